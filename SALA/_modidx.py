@@ -5,14 +5,88 @@ d = { 'settings': { 'branch': 'master',
                 'doc_host': 'https://tktran11.github.io',
                 'git_url': 'https://github.com/tktran11/SALA/tree/master/',
                 'lib_path': 'SALA'},
-  'syms': { 'SALA.plots': { 'SALA.plots.ClockPlot': ('plots.html#clockplot', 'SALA/plots.py'),
+  'syms': { 'SALA.benchmarks': { 'SALA.benchmarks._episodes': ('benchmarks.html#_episodes', 'SALA/benchmarks.py'),
+                                 'SALA.benchmarks._light_groups': ('benchmarks.html#_light_groups', 'SALA/benchmarks.py'),
+                                 'SALA.benchmarks._quoted': ('benchmarks.html#_quoted', 'SALA/benchmarks.py'),
+                                 'SALA.benchmarks._within': ('benchmarks.html#_within', 'SALA/benchmarks.py'),
+                                 'SALA.benchmarks.benchmark': ('benchmarks.html#benchmark', 'SALA/benchmarks.py'),
+                                 'SALA.benchmarks.run_benchmark': ('benchmarks.html#run_benchmark', 'SALA/benchmarks.py'),
+                                 'SALA.benchmarks.synthetic_epochs': ('benchmarks.html#synthetic_epochs', 'SALA/benchmarks.py'),
+                                 'SALA.benchmarks.synthetic_study': ('benchmarks.html#synthetic_study', 'SALA/benchmarks.py'),
+                                 'SALA.benchmarks.write_synthetic_export': ( 'benchmarks.html#write_synthetic_export',
+                                                                             'SALA/benchmarks.py')},
+            'SALA.cli': { 'SALA.cli._config_key': ('cli.html#_config_key', 'SALA/cli.py'),
+                          'SALA.cli._fingerprint': ('cli.html#_fingerprint', 'SALA/cli.py'),
+                          'SALA.cli._now': ('cli.html#_now', 'SALA/cli.py'),
+                          'SALA.cli._sites_table': ('cli.html#_sites_table', 'SALA/cli.py'),
+                          'SALA.cli._write_manifest': ('cli.html#_write_manifest', 'SALA/cli.py'),
+                          'SALA.cli.load_config': ('cli.html#load_config', 'SALA/cli.py'),
+                          'SALA.cli.main': ('cli.html#main', 'SALA/cli.py'),
+                          'SALA.cli.read_manifest': ('cli.html#read_manifest', 'SALA/cli.py'),
+                          'SALA.cli.run': ('cli.html#run', 'SALA/cli.py')},
+            'SALA.plots': { 'SALA.plots.ClockPlot': ('plots.html#clockplot', 'SALA/plots.py'),
+                            'SALA.plots.ClockPlot._draw': ('plots.html#_draw', 'SALA/plots.py'),
+                            'SALA.plots.ClockPlot._prepare': ('plots.html#_prepare', 'SALA/plots.py'),
+                            'SALA.plots.ClockPlot._render': ('plots.html#_render', 'SALA/plots.py'),
                             'SALA.plots.ClockPlot.mins_to_radians': ('plots.html#mins_to_radians', 'SALA/plots.py'),
                             'SALA.plots.ClockPlot.plot': ('plots.html#plot', 'SALA/plots.py'),
                             'SALA.plots.ClockPlot.print_time': ('plots.html#print_time', 'SALA/plots.py'),
+                            'SALA.plots.ClockPlot.save_figures': ('plots.html#save_figures', 'SALA/plots.py'),
+                            'SALA.plots.ClockPlot.statistics': ('plots.html#statistics', 'SALA/plots.py'),
                             'SALA.plots.LightPlot': ('plots.html#lightplot', 'SALA/plots.py'),
+                            'SALA.plots.LightPlot._draw': ('plots.html#_draw', 'SALA/plots.py'),
+                            'SALA.plots.LightPlot._from_cube': ('plots.html#_from_cube', 'SALA/plots.py'),
                             'SALA.plots.LightPlot.plot': ('plots.html#plot', 'SALA/plots.py')},
-            'SALA.processing': { 'SALA.processing.SALAFrame': ('processing.html#salaframe', 'SALA/processing.py'),
+            'SALA.processing': { 'SALA.processing.LightCube': ('processing.html#lightcube', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube.__init__': ('processing.html#__init__', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube._bucket_values': ('processing.html#_bucket_values', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube._buckets': ('processing.html#_buckets', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube._compact': ('processing.html#_compact', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube.concat': ('processing.html#concat', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube.from_raw': ('processing.html#from_raw', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube.gamma': ('processing.html#gamma', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube.load': ('processing.html#load', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube.quantile_sketch': ('processing.html#quantile_sketch', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube.save': ('processing.html#save', 'SALA/processing.py'),
+                                 'SALA.processing.LightCube.summary': ('processing.html#summary', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache': ('processing.html#parsedfilecache', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache.__init__': ('processing.html#__init__', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache._digest': ('processing.html#_digest', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache._index_file': ('processing.html#_index_file', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache._read_index': ('processing.html#_read_index', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache._table_file': ('processing.html#_table_file', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache.clear': ('processing.html#clear', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache.get': ('processing.html#get', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache.put': ('processing.html#put', 'SALA/processing.py'),
+                                 'SALA.processing.ParsedFileCache.save': ('processing.html#save', 'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler': ('processing.html#pipelineprofiler', 'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler.__init__': ('processing.html#__init__', 'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler._emit': ('processing.html#_emit', 'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler.add_participant': ( 'processing.html#add_participant',
+                                                                                       'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler.participants': ('processing.html#participants', 'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler.reset': ('processing.html#reset', 'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler.slowest_participants': ( 'processing.html#slowest_participants',
+                                                                                            'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler.stage': ('processing.html#stage', 'SALA/processing.py'),
+                                 'SALA.processing.PipelineProfiler.stages': ('processing.html#stages', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch': ('processing.html#quantilesketch', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.__init__': ('processing.html#__init__', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.count': ('processing.html#count', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.from_frame': ('processing.html#from_frame', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.gamma': ('processing.html#gamma', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.median': ('processing.html#median', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.merge': ('processing.html#merge', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.quantile': ('processing.html#quantile', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.to_frame': ('processing.html#to_frame', 'SALA/processing.py'),
+                                 'SALA.processing.QuantileSketch.update': ('processing.html#update', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame': ('processing.html#salaframe', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.__getstate__': ('processing.html#__getstate__', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.__init__': ('processing.html#__init__', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame._join_sleep': ('processing.html#_join_sleep', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame._process_participant': ( 'processing.html#_process_participant',
+                                                                                     'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame._sun_table': ('processing.html#_sun_table', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.data': ('processing.html#data', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.directory': ('processing.html#directory', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.do_everything': ('processing.html#do_everything', 'SALA/processing.py'),
@@ -20,12 +94,83 @@ d = { 'settings': { 'branch': 'master',
                                  'SALA.processing.SALAFrame.get_raw_data': ('processing.html#get_raw_data', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.get_raw_data_from_key': ( 'processing.html#get_raw_data_from_key',
                                                                                       'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.holidays': ('processing.html#holidays', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.latitude': ('processing.html#latitude', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.light_cube': ('processing.html#light_cube', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.longitude': ('processing.html#longitude', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.process_data': ('processing.html#process_data', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.process_incremental': ( 'processing.html#process_incremental',
+                                                                                    'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.process_shard': ('processing.html#process_shard', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.process_sleep': ('processing.html#process_sleep', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.process_streaming': ('processing.html#process_streaming', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.profiler': ('processing.html#profiler', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.quality': ('processing.html#quality', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.sites': ('processing.html#sites', 'SALA/processing.py'),
+                                 'SALA.processing.SALAFrame.sun_table': ('processing.html#sun_table', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.sun_timings': ('processing.html#sun_timings', 'SALA/processing.py'),
                                  'SALA.processing.SALAFrame.timezone': ('processing.html#timezone', 'SALA/processing.py'),
+                                 'SALA.processing._add_day_types': ('processing.html#_add_day_types', 'SALA/processing.py'),
+                                 'SALA.processing._assign_person_days': ('processing.html#_assign_person_days', 'SALA/processing.py'),
+                                 'SALA.processing._bucket_values': ('processing.html#_bucket_values', 'SALA/processing.py'),
+                                 'SALA.processing._build_year_table': ('processing.html#_build_year_table', 'SALA/processing.py'),
+                                 'SALA.processing._calendar_days': ('processing.html#_calendar_days', 'SALA/processing.py'),
+                                 'SALA.processing._channel_values': ('processing.html#_channel_values', 'SALA/processing.py'),
+                                 'SALA.processing._clock_offset': ('processing.html#_clock_offset', 'SALA/processing.py'),
+                                 'SALA.processing._compact_columns': ('processing.html#_compact_columns', 'SALA/processing.py'),
+                                 'SALA.processing._date_rows': ('processing.html#_date_rows', 'SALA/processing.py'),
+                                 'SALA.processing._day_fingerprints': ('processing.html#_day_fingerprints', 'SALA/processing.py'),
+                                 'SALA.processing._day_window_stats': ('processing.html#_day_window_stats', 'SALA/processing.py'),
+                                 'SALA.processing._flatten_thresholds': ('processing.html#_flatten_thresholds', 'SALA/processing.py'),
+                                 'SALA.processing._group_labels': ('processing.html#_group_labels', 'SALA/processing.py'),
+                                 'SALA.processing._header_cells': ('processing.html#_header_cells', 'SALA/processing.py'),
+                                 'SALA.processing._holiday_key': ('processing.html#_holiday_key', 'SALA/processing.py'),
+                                 'SALA.processing._log_buckets': ('processing.html#_log_buckets', 'SALA/processing.py'),
+                                 'SALA.processing._parse_datetimes': ('processing.html#_parse_datetimes', 'SALA/processing.py'),
+                                 'SALA.processing._participant_files': ('processing.html#_participant_files', 'SALA/processing.py'),
+                                 'SALA.processing._peak_rss': ('processing.html#_peak_rss', 'SALA/processing.py'),
+                                 'SALA.processing._profiled': ('processing.html#_profiled', 'SALA/processing.py'),
+                                 'SALA.processing._read_actiwatch_file': ('processing.html#_read_actiwatch_file', 'SALA/processing.py'),
+                                 'SALA.processing._reduce_windows': ('processing.html#_reduce_windows', 'SALA/processing.py'),
+                                 'SALA.processing._rows': ('processing.html#_rows', 'SALA/processing.py'),
+                                 'SALA.processing._scan_actiwatch_file': ('processing.html#_scan_actiwatch_file', 'SALA/processing.py'),
+                                 'SALA.processing._shard_of': ('processing.html#_shard_of', 'SALA/processing.py'),
+                                 'SALA.processing._shard_path': ('processing.html#_shard_path', 'SALA/processing.py'),
+                                 'SALA.processing._sleep_periods': ('processing.html#_sleep_periods', 'SALA/processing.py'),
+                                 'SALA.processing._sun_times': ('processing.html#_sun_times', 'SALA/processing.py'),
+                                 'SALA.processing._threshold_of': ('processing.html#_threshold_of', 'SALA/processing.py'),
+                                 'SALA.processing._time_index': ('processing.html#_time_index', 'SALA/processing.py'),
+                                 'SALA.processing._timed_call': ('processing.html#_timed_call', 'SALA/processing.py'),
+                                 'SALA.processing._valid_day_rows': ('processing.html#_valid_day_rows', 'SALA/processing.py'),
+                                 'SALA.processing._valid_light': ('processing.html#_valid_light', 'SALA/processing.py'),
+                                 'SALA.processing._window_edges': ('processing.html#_window_edges', 'SALA/processing.py'),
+                                 'SALA.processing._window_offsets': ('processing.html#_window_offsets', 'SALA/processing.py'),
+                                 'SALA.processing._window_settings': ('processing.html#_window_settings', 'SALA/processing.py'),
+                                 'SALA.processing._year_table': ('processing.html#_year_table', 'SALA/processing.py'),
+                                 'SALA.processing.apply_wear_rules': ('processing.html#apply_wear_rules', 'SALA/processing.py'),
+                                 'SALA.processing.compact_raw_data': ('processing.html#compact_raw_data', 'SALA/processing.py'),
+                                 'SALA.processing.date_table': ('processing.html#date_table', 'SALA/processing.py'),
                                  'SALA.processing.firstAndLastLight': ('processing.html#firstandlastlight', 'SALA/processing.py'),
                                  'SALA.processing.load_actiwatch_data': ('processing.html#load_actiwatch_data', 'SALA/processing.py'),
-                                 'SALA.processing.remove_first_day': ('processing.html#remove_first_day', 'SALA/processing.py')}}}
\ No newline at end of file
+                                 'SALA.processing.long_timing': ('processing.html#long_timing', 'SALA/processing.py'),
+                                 'SALA.processing.melanopic_edi': ('processing.html#melanopic_edi', 'SALA/processing.py'),
+                                 'SALA.processing.merge_shards': ('processing.html#merge_shards', 'SALA/processing.py'),
+                                 'SALA.processing.person_day_quality': ('processing.html#person_day_quality', 'SALA/processing.py'),
+                                 'SALA.processing.read_dataset': ('processing.html#read_dataset', 'SALA/processing.py'),
+                                 'SALA.processing.remove_first_day': ('processing.html#remove_first_day', 'SALA/processing.py'),
+                                 'SALA.processing.wide_timing': ('processing.html#wide_timing', 'SALA/processing.py'),
+                                 'SALA.processing.write_dataset': ('processing.html#write_dataset', 'SALA/processing.py')},
+            'SALA.reports': { 'SALA.reports.ParticipantReport': ('reports.html#participantreport', 'SALA/reports.py'),
+                              'SALA.reports.ParticipantReport.__init__': ('reports.html#__init__', 'SALA/reports.py'),
+                              'SALA.reports.ParticipantReport._quality': ('reports.html#_quality', 'SALA/reports.py'),
+                              'SALA.reports.ParticipantReport._sleep_table': ('reports.html#_sleep_table', 'SALA/reports.py'),
+                              'SALA.reports.ParticipantReport.from_output': ('reports.html#from_output', 'SALA/reports.py'),
+                              'SALA.reports.ParticipantReport.quality': ('reports.html#quality', 'SALA/reports.py'),
+                              'SALA.reports.ParticipantReport.save': ('reports.html#save', 'SALA/reports.py'),
+                              'SALA.reports._clock_time': ('reports.html#_clock_time', 'SALA/reports.py'),
+                              'SALA.reports._hours': ('reports.html#_hours', 'SALA/reports.py'),
+                              'SALA.reports._light_quality': ('reports.html#_light_quality', 'SALA/reports.py'),
+                              'SALA.reports._new_page': ('reports.html#_new_page', 'SALA/reports.py'),
+                              'SALA.reports._render_report': ('reports.html#_render_report', 'SALA/reports.py'),
+                              'SALA.reports._table': ('reports.html#_table', 'SALA/reports.py'),
+                              'SALA.reports._tick_step': ('reports.html#_tick_step', 'SALA/reports.py')}}}
\ No newline at end of file
@@ -0,0 +1,360 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../02_benchmarks.ipynb.
+
+# %% auto 0
+__all__ = ['SUMMARY_COLUMNS', 'RAW_COLUMNS', 'BENCHMARK_STAGES', 'BENCHMARK_THRESHOLDS', 'synthetic_epochs',
+           'write_synthetic_export', 'synthetic_study', 'run_benchmark', 'benchmark']
+
+# %% ../02_benchmarks.ipynb 2
+from joblib import Parallel, delayed
+from joblib.externals.loky import get_reusable_executor
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+import csv
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from .processing import SALAFrame, _peak_rss
+from .plots import ClockPlot, LightPlot
+
+# %% ../02_benchmarks.ipynb 5
+# column layout of an Actiware export: a 35 column summary table above a 12 column epoch-by-epoch table
+SUMMARY_COLUMNS = ["Interval Type", "Interval#", "Start Date", "Start Time", "End Date", "End Time",
+                   "Duration", "Off-Wrist", "%Off-Wrist", "Total AC", "Avg AC/min", "Max AC",
+                   "Invalid SW (min)", "%Invalid SW", "Onset Latency", "Efficiency", "WASO", "Wake Time",
+                   "%Wake", "Wake Bouts", "Avg Wake B", "Sleep Time", "%Sleep", "Sleep Bouts", "Avg Sleep B",
+                   "Immobile Time", "%Immobile", "Imm Bouts", "Avg Imm B", "Mobile Time", "%Mobile",
+                   "Mob Bouts", "Avg Mob B", "Total White", "Avg White"]
+RAW_COLUMNS = ["Line", "Date", "Time", "Off-Wrist Status", "Activity", "Marker", "White Light",
+               "Red Light", "Green Light", "Blue Light", "Sleep/Wake", "Interval Status"]
+
+def _episodes(rng, days, center, spread, low, high, chance = 1.0):
+    """Random daily (start, end) episodes in seconds from the first midnight, one per day with the given chance."""
+    day = np.arange(-1, days + 1)[rng.random(days + 2) < chance]
+    start = day * 86400 + (center + rng.normal(0, spread, len(day))) * 3600
+    return start, start + rng.uniform(low, high, len(day)) * 3600
+
+def _within(seconds, starts, ends):
+    """Whether each time in seconds falls inside one of the sorted, non-overlapping (start, end) episodes."""
+    if len(starts) == 0:
+        return np.zeros(len(seconds), dtype = bool)
+    order = np.argsort(starts)
+    starts, ends = starts[order], ends[order]
+    idx = np.searchsorted(starts, seconds, side = "right") - 1
+    return (idx >= 0) & (seconds < ends[np.maximum(idx, 0)])
+
+def synthetic_epochs(start = "2018-06-06 14:58", days = 7, epoch = 30, seed = None):
+    """Generates epoch-by-epoch actiwatch data for a single participant, with a daily light cycle,
+    a nightly main sleep (REST-S), occasional afternoon naps and off-wrist gaps.
+
+        #### Parameters
+
+        start: str or datetime
+
+            Time of the first epoch. Default = "2018-06-06 14:58".
+
+        days: int
+
+            Length of the recording in days. Default = 7.
+
+        epoch: int
+
+            Epoch length in seconds. Default = 30.
+
+        seed: int or None
+
+            Seed of the random generator, for reproducible data.
+
+        #### Returns
+
+            Dataframe indexed by DateTime with the raw columns of an Actiware export.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start)
+    times = start + pd.to_timedelta(np.arange(int(days * 86400 // epoch)) * epoch, unit = "s")
+    seconds = (times - start.normalize()).total_seconds().to_numpy()
+    hours = (seconds % 86400) / 3600
+    n = len(times)
+
+    # main sleep starts around 23:00 and lasts 6.5 to 8.5 hours, naps are taken on a third of days
+    asleep = (_within(seconds, *_episodes(rng, days, 23, 0.75, 6.5, 8.5))
+              | _within(seconds, *_episodes(rng, days, 14, 1, 0.3, 1.5, chance = 0.3)))
+    woken = asleep & (rng.random(n) < 0.03) # brief wake epochs scored during sleep
+    off_wrist = ~asleep & _within(seconds, *_episodes(rng, days, 12, 3, 0.5, 3, chance = 0.2))
+
+    # indoor light all day, bright outdoor light in 15 minute bouts under daylight, dim evenings and dark nights
+    daylight = np.clip(np.sin(np.pi * (hours - 6) / 14), 0, None)
+    outdoors = np.repeat(rng.random(n // 30 + 1) < 0.12, 30)[:n]
+    white = rng.lognormal(np.log(150), 0.8, n) * (1 + 40 * daylight * outdoors)
+    white = np.where((hours >= 21) | (hours < 6), white * 0.2, white)
+    white = np.where(asleep, rng.exponential(0.5, n), white).round(2)
+
+    activity = np.where(asleep, rng.poisson(5, n), rng.poisson(150, n))
+    status = np.select([off_wrist, asleep & ~woken, asleep], ["EXCLUDED", "REST-S", "REST"], "ACTIVE")
+    return pd.DataFrame({"Off-Wrist Status": off_wrist.astype(int),
+                         "Activity": np.where(off_wrist, 0, activity),
+                         "Marker": 0,
+                         "White Light": white,
+                         "Red Light": (white / 3).round(2),
+                         "Green Light": (white / 3).round(2),
+                         "Blue Light": (white / 3).round(2),
+                         "Sleep/Wake": (~asleep | woken).astype(int),
+                         "Interval Status": status},
+                        index = pd.DatetimeIndex(times, name = "DateTime"))
+
+def _quoted(cells):
+    """A line of an Actiware export, with every cell quoted and a trailing comma."""
+    return ",".join('"{}"'.format(cell) for cell in cells) + ","
+
+def write_synthetic_export(path, uid, start = "2018-06-06 14:58", days = 7, epoch = 30, seed = None):
+    """Writes a synthetic Actiware csv export for a single participant, laid out like the
+    exports SALA reads: a pre-amble, the summary table of rest intervals and the
+    epoch-by-epoch table (see `synthetic_epochs`).
+
+        #### Parameters
+
+        path: str
+
+            Directory to write the export to.
+
+        uid: str
+
+            Participant identifier, used as the start of the filename. It must not contain '_'.
+
+        start, days, epoch, seed:
+
+            Passed on to `synthetic_epochs`.
+
+        #### Returns
+
+            Path of the written csv file.
+    """
+    epochs = synthetic_epochs(start, days, epoch, seed)
+    start = epochs.index[0]
+    afile = os.path.join(path, "{}_{}_New_Analysis.csv".format(uid, start.strftime("%m_%d_%Y_%H%M")))
+
+    # one summary row per sleep episode, statistics that SALA does not use are left blank
+    sleeping = (epochs["Interval Status"] != "ACTIVE") & (epochs["Interval Status"] != "EXCLUDED")
+    runs = (sleeping != sleeping.shift()).cumsum()[sleeping]
+    intervals = epochs.index.to_series()[sleeping].groupby(runs.to_numpy()).agg(["min", "max"])
+    lines = ['"Actiware Export File"', '"Identity:","{}"'.format(uid), "",
+             '"-------------------- Statistics ---------------------"',
+             _quoted(SUMMARY_COLUMNS)[:-1], _quoted([""] * len(SUMMARY_COLUMNS))[:-1]]
+    for number, (begin, end) in enumerate(intervals.itertuples(index = False), start = 1):
+        lines.append(_quoted(["REST", number, begin.strftime("%m/%d/%Y"), begin.strftime("%I:%M:%S %p"),
+                              end.strftime("%m/%d/%Y"), end.strftime("%I:%M:%S %p"),
+                              (end - begin).total_seconds() / 60] + [""] * 28)[:-1])
+    lines += [_quoted(["Summary", "Rest"] + [""] * 33)[:-1], "",
+              _quoted(["EXCLUDED", 1] + [""] * 33)[:-1], "",
+              '"-------------------- Epoch-by-Epoch Data -------------------"',
+              _quoted(RAW_COLUMNS), ""]
+
+    raw = epochs.reset_index(drop = True)
+    raw.insert(0, "Line", np.arange(1, len(raw) + 1))
+    raw.insert(1, "Date", epochs.index.strftime("%m/%d/%Y"))
+    raw.insert(2, "Time", epochs.index.strftime("%I:%M:%S %p"))
+    table = raw.to_csv(header = False, index = False, quoting = csv.QUOTE_ALL, float_format = "%.2f")
+    with open(afile, "w") as f:
+        f.write("\n".join(lines))
+        f.write(table.replace("\n", ",\n"))
+    return afile
+
+def synthetic_study(directory, participants = 10, days = 7, groups = ("base_", "follow_up_"),
+                    epoch = 30, seed = 0, n_jobs = 1):
+    """Writes a synthetic study of Actiware exports, one folder per group, with participants
+    spread evenly over the groups.
+
+        #### Parameters
+
+        directory: str
+
+            Directory to create the group folders in.
+
+        participants: int
+
+            Total number of participants. Default = 10.
+
+        days: int
+
+            Recording length of every participant in days. Default = 7.
+
+        groups: tuple
+
+            Names of the groups. Default = ("base_", "follow_up_").
+
+        epoch: int
+
+            Epoch length in seconds. Default = 30.
+
+        seed: int
+
+            Seed for the study, each participant gets its own seed derived from it. Default = 0.
+
+        n_jobs: int
+
+            Number of files written at once. Default = 1.
+
+        #### Returns
+
+            Dictionary of group names to folders, as used to initialize a SALA object.
+    """
+    folders = {group: os.path.join(directory, group) for group in groups}
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok = True)
+    # recordings start on different days and times of day
+    rng = np.random.default_rng(seed)
+    starts = (pd.Timestamp("2018-06-04") + pd.to_timedelta(rng.integers(0, 60, participants), unit = "D")
+              + pd.to_timedelta(rng.integers(8 * 60, 18 * 60, participants), unit = "min"))
+    Parallel(n_jobs = n_jobs)(delayed(write_synthetic_export)(folders[groups[i % len(groups)]], "user{}".format(i),
+                                                              starts[i], days, epoch, seed * 100_003 + i)
+                              for i in range(participants))
+    return folders
+
+# %% ../02_benchmarks.ipynb 11
+BENCHMARK_STAGES = ["load_actiwatch_data", "process_data", "sun_timings", "process_sleep", "export",
+                    "ClockPlot.plot", "LightPlot.plot"]
+BENCHMARK_THRESHOLDS = [5, 10, 50, 100, 500, 1000, 2000, 5000]
+
+def _light_groups(raw_data, group):
+    """Quarter-hourly White Light of one group's on-wrist samples, grouped as in the plots module examples."""
+    rows = ((raw_data["Group"] == group) & np.logical_not(raw_data["Off-Wrist Status"])
+            & raw_data["Interval Status"].isin(["ACTIVE", "REST"]) & (raw_data["White Light"] > 1.0))
+    light = raw_data.loc[rows, "White Light"]
+    return light.groupby(light.index.floor("15min").time)
+
+def run_benchmark(directory, outfile, thresholds, latitude = 32.88, longitude = -117.234,
+                  timezone = "America/Los_Angeles", n_jobs = 1):
+    """Runs every stage of the SALA pipeline once on a study in the current process, timing each.
+
+        #### Parameters
+
+        directory: dict
+
+            Dictionary of group names to folders of csv files.
+
+        outfile: str
+
+            Directory the export stage writes to.
+
+        thresholds: list
+
+            List of light thresholds, e.g. [5, 50, 500].
+
+        latitude, longitude, timezone:
+
+            Location of the study.
+
+        n_jobs: int
+
+            Number of workers for csv parsing and light processing. Default = 1, which keeps all
+            of the work in this process so that its peak RSS covers every stage.
+
+        #### Returns
+
+            Dataframe with the 'Stage', 'Seconds' and 'Peak RSS (MB)' of every stage. Peak RSS is
+            the high-water mark of the process by the end of the stage.
+    """
+    results = []
+    def timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        value = func(*args, **kwargs)
+        results.append({"Stage": stage, "Seconds": time.perf_counter() - start, "Peak RSS (MB)": _peak_rss()})
+        return value
+
+    plt.switch_backend("Agg")
+    sala = SALAFrame(latitude, longitude, timezone, directory = directory)
+    raw_data = timed("load_actiwatch_data", sala.get_raw_data, outfile, export = False, n_jobs = n_jobs)
+    timed("process_data", sala.process_data, raw_data, [[threshold] for threshold in thresholds], n_jobs = n_jobs)
+    timed("sun_timings", sala.sun_timings)
+    timed("process_sleep", sala.process_sleep, raw_data)
+    timed("export", sala.export, outfile)
+    timed("ClockPlot.plot", ClockPlot.plot, sala.data, "Weekend/Holiday", thresholds = thresholds[:3],
+          timezone = timezone)
+    plt.close("all")
+    groups = list(directory)
+    timed("LightPlot.plot", lambda: LightPlot.plot([_light_groups(raw_data, group) for group in groups],
+                                                   groups, y_lim = 3000))
+    plt.close("all")
+    return pd.DataFrame(results)
+
+def benchmark(participants = (10,), days = (7,), thresholds = (6,), repeats = 1, epoch = 30,
+              n_jobs = 1, workdir = None, outfile = None, seed = 0):
+    """Benchmarks the SALA pipeline on synthetic studies for every combination of participant,
+    day and threshold counts. Each run happens in a fresh process, so that its peak RSS is
+    not inflated by earlier runs.
+
+        #### Parameters
+
+        participants: tuple
+
+            Numbers of participants to benchmark. Default = (10,).
+
+        days: tuple
+
+            Recording lengths in days to benchmark. Default = (7,).
+
+        thresholds: tuple
+
+            Numbers of light thresholds to benchmark, taken from BENCHMARK_THRESHOLDS. Default = (6,).
+
+        repeats: int
+
+            Number of runs of every combination. Default = 1.
+
+        epoch: int
+
+            Epoch length of the synthetic data in seconds. Default = 30.
+
+        n_jobs: int
+
+            Number of workers used by the loading and light processing stages (see run_benchmark).
+
+        workdir: str or None
+
+            Directory for the synthetic studies and exports. Default = None, which uses a temporary
+            directory that is removed afterwards.
+
+        outfile: str or None
+
+            csv file the results are appended to, so runs across library versions can be compared.
+
+        seed: int
+
+            Seed of the synthetic studies. Default = 0.
+
+        #### Returns
+
+            Dataframe with one row per run and stage, holding the 'Participants', 'Days', 'Thresholds',
+            'Repeat', 'Stage', 'Seconds' and 'Peak RSS (MB)', along with the Python, pandas and numpy
+            versions used.
+    """
+    root = tempfile.mkdtemp() if workdir is None else workdir
+    runs = []
+    try:
+        for n_participants in participants:
+            for n_days in days:
+                study = os.path.join(root, "study_{}x{}".format(n_participants, n_days))
+                directory = synthetic_study(study, n_participants, n_days, epoch = epoch, seed = seed)
+                for n_thresholds in thresholds:
+                    for repeat in range(repeats):
+                        # a new worker process for every run
+                        executor = get_reusable_executor(max_workers = 1, reuse = False)
+                        run = executor.submit(run_benchmark, directory, study + os.sep,
+                                              BENCHMARK_THRESHOLDS[:n_thresholds], n_jobs = n_jobs).result()
+                        executor.shutdown()
+                        runs.append(run.assign(Participants = n_participants, Days = n_days,
+                                               Thresholds = n_thresholds, Repeat = repeat))
+    finally:
+        if workdir is None:
+            shutil.rmtree(root, ignore_errors = True)
+
+    results = pd.concat(runs, ignore_index = True)
+    results = results[["Participants", "Days", "Thresholds", "Repeat", "Stage", "Seconds", "Peak RSS (MB)"]]
+    results = results.assign(Python = platform.python_version(), pandas = pd.__version__, numpy = np.__version__)
+    if outfile is not None:
+        results.to_csv(outfile, mode = "a", index = False, header = not os.path.exists(outfile))
+    return results
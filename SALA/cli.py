@@ -0,0 +1,329 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../03_cli.ipynb.
+
+# %% auto 0
+__all__ = ['EXIT_OK', 'EXIT_FAILED', 'EXIT_USAGE', 'EXIT_INTERRUPTED', 'CONFIG_DEFAULTS', 'CONFIG_REQUIRED', 'logger',
+           'load_config', 'read_manifest', 'run', 'main']
+
+# %% ../03_cli.ipynb 2
+import pandas as pd
+
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sys
+import traceback
+
+from .processing import SALAFrame, PipelineProfiler, merge_shards, _participant_files, _shard_of, _shard_path
+from .processing import WEAR_RULES, _window_offsets
+from .reports import ParticipantReport
+
+try:
+    import tomllib
+except ImportError:
+    # python < 3.11 reads TOML configurations through the tomli backport, if it is installed
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+# %% ../03_cli.ipynb 5
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INTERRUPTED = 130
+
+CONFIG_DEFAULTS = {"n_jobs": 1, "grouping": "Group", "sleep_split": "18:00", "cache": None, "sites": [],
+                   "channels": None, "windows": None, "day_start": "04:00", "wear_rules": None}
+CONFIG_REQUIRED = ["directory", "thresholds", "latitude", "longitude", "timezone", "outfile"]
+
+logger = logging.getLogger("SALA")
+
+def load_config(path):
+    """Reads a run configuration from a TOML file (or a JSON file with the same keys), filling in
+       defaults for optional settings. Relative paths in it are taken relative to the folder of
+       the configuration file.
+
+        #### Parameters
+
+        path: str
+
+            Path of the configuration file.
+
+        #### Returns
+
+            Dictionary of settings.
+    """
+    if path.endswith(".json"):
+        with open(path) as f:
+            config = json.load(f)
+    else:
+        if tomllib is None:
+            raise ImportError("Error: reading TOML configurations requires python 3.11+ or the tomli package.")
+        with open(path, "rb") as f:
+            config = tomllib.load(f)
+
+    missing = [key for key in CONFIG_REQUIRED if key not in config]
+    if missing:
+        raise ValueError("Error: configuration is missing " + ", ".join(missing))
+    if not isinstance(config["directory"], dict) or not config["directory"]:
+        raise ValueError("Error: directory must be a table of group names to folders")
+    if not config["thresholds"] or not all(isinstance(threshold, (int, float)) for threshold in config["thresholds"]):
+        raise ValueError("Error: thresholds must be a list of numbers")
+    for site in config.get("sites", []):
+        if len({"Group", "UID"} & set(site)) != 1 or not {"latitude", "longitude", "timezone"} <= set(site):
+            raise ValueError("Error: every site needs a Group or UID along with latitude, longitude and timezone")
+    channels = config.get("channels")
+    if channels is not None and (not isinstance(channels, list) or not channels
+                                 or not all(isinstance(channel, str) for channel in channels)):
+        raise ValueError("Error: channels must be a list of light channel names")
+    if config.get("windows") is not None:
+        if not isinstance(config["windows"], dict):
+            raise ValueError("Error: windows must be a table of names to [start, end] clock times")
+        _window_offsets(config["windows"], config.get("day_start", CONFIG_DEFAULTS["day_start"]))
+    if config.get("wear_rules") is not None:
+        if not isinstance(config["wear_rules"], dict):
+            raise ValueError("Error: wear_rules must be a table of wear-time rules")
+        unknown = set(config["wear_rules"]) - set(WEAR_RULES)
+        if unknown:
+            raise ValueError(f"Error: unknown wear rules {sorted(unknown)}, expected some of {list(WEAR_RULES)}")
+
+    config = {**CONFIG_DEFAULTS, **config}
+    root = os.path.dirname(os.path.abspath(path))
+    config["directory"] = {group: os.path.join(root, folder) for group, folder in config["directory"].items()}
+    config["outfile"] = os.path.join(root, config["outfile"], "")
+    if config["cache"] is not None:
+        config["cache"] = os.path.join(root, config["cache"])
+    return config
+
+def _sites_table(sites):
+    """The sites of a configuration as a SALA sites table, or None without any."""
+    if not sites:
+        return None
+    by = "Group" if "Group" in sites[0] else "UID"
+    return pd.DataFrame({"Latitude": [site["latitude"] for site in sites],
+                         "Longitude": [site["longitude"] for site in sites],
+                         "Timezone": [site["timezone"] for site in sites]},
+                        index = pd.Index([site[by] for site in sites], name = by))
+
+# %% ../03_cli.ipynb 8
+def _fingerprint(files):
+    """Size and modification time of every csv file of a participant."""
+    return {afile: [os.path.getsize(afile), os.path.getmtime(afile)] for afile in files}
+
+def _config_key(config):
+    """Hash of the settings that change timing results, runs with other settings cannot be resumed."""
+    settings = {key: config[key] for key in ["thresholds", "latitude", "longitude", "timezone",
+                                             "grouping", "sleep_split", "sites"]}
+    # settings added later only count when they are changed, so earlier runs can still be resumed
+    settings.update({key: config[key] for key in ["channels", "windows", "day_start", "wear_rules"]
+                     if config.get(key, CONFIG_DEFAULTS[key]) != CONFIG_DEFAULTS[key]})
+    return hashlib.sha1(json.dumps(settings, sort_keys = True).encode()).hexdigest()
+
+def read_manifest(outfile):
+    """Reads the run manifest written to outfile by `run`, or returns None if there is none."""
+    try:
+        with open(os.path.join(outfile, "manifest.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_manifest(outfile, manifest):
+    """Writes the run manifest, replacing the previous one at once so it is never left half written."""
+    path = os.path.join(outfile, "manifest.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent = 1, default = str)
+    os.replace(path + ".tmp", path)
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec = "seconds")
+
+# %% ../03_cli.ipynb 9
+def run(config, n_jobs = None, resume = True, shard = None, num_shards = None):
+    """Runs the full SALA pipeline for a configuration (see `load_config`), one participant at a
+       time (see `SALAFrame.process_streaming`), writing timing data to outfile/timing/.
+
+       Progress is recorded in a run manifest (outfile/manifest.json) after every participant. When
+       resuming, participants that a previous run with the same settings already finished are
+       skipped, as long as their csv files have not changed since.
+
+       With a shard, only the participants of that shard are run (see `SALAFrame.process_shard`),
+       and its output and manifest are written to the shard directory within outfile.
+
+        #### Parameters
+
+        config: dict
+
+            Settings of the run, as returned by `load_config`.
+
+        n_jobs: int or None
+
+            Number of participants processed at once. Default = None, which uses the n_jobs setting
+            of the configuration.
+
+        resume: bool
+
+            Whether to continue from the manifest of an earlier run. Default = True.
+
+        shard: int or None
+
+            Shard of the study to run, from 0 to num_shards - 1. Default = None, which runs every
+            participant.
+
+        num_shards: int or None
+
+            Number of shards the study is split into, required along with shard.
+
+        #### Returns
+
+            The run manifest, with the 'status' of the run ('complete' or 'failed'), the settings used,
+            the status and wall time of every participant and the profiled pipeline stages.
+    """
+    if (shard is None) != (num_shards is None):
+        raise ValueError("shard and num_shards must be given together.")
+    outfile = config["outfile"] if shard is None else _shard_path(config["outfile"], shard, num_shards)
+    os.makedirs(outfile, exist_ok = True)
+    n_jobs = config["n_jobs"] if n_jobs is None else n_jobs
+    participants = {UID: (group, files) for group, UID, files in _participant_files(config["directory"])
+                    if shard is None or _shard_of(UID, num_shards) == shard}
+
+    # participants finished by an earlier run of the same settings on the same files are kept
+    previous = read_manifest(outfile) if resume else None
+    finished = {}
+    if previous is not None and previous.get("config_key") == _config_key(config):
+        finished = {UID: entry for UID, entry in previous["participants"].items()
+                    if UID in participants and entry["files"] == _fingerprint(participants[UID][1])}
+
+    manifest = {"status": "running", "started": _now(), "finished": None,
+                "config": config, "config_key": _config_key(config), "n_jobs": n_jobs,
+                "shard": shard, "num_shards": num_shards,
+                "resumed": len(finished), "participants": finished, "stages": []}
+    _write_manifest(outfile, manifest)
+    logger.info("run of %d participants started, %d finished earlier", len(participants), len(finished))
+
+    seconds = {}
+    def participant_seconds(record):
+        if record["Event"] == "participant":
+            seconds[record["UID"]] = record["Wall (s)"]
+
+    def progress(done, total, UID):
+        group, files = participants[UID]
+        manifest["participants"][UID] = {"group": group, "files": _fingerprint(files), "status": "done",
+                                         "seconds": seconds.get(UID)}
+        _write_manifest(outfile, manifest)
+
+    profiler = PipelineProfiler(hooks = [participant_seconds])
+    sala = SALAFrame(config["latitude"], config["longitude"], config["timezone"],
+                     directory = config["directory"], sites = _sites_table(config["sites"]), profiler = profiler)
+    settings = dict(grouping = config["grouping"], sleep_split = config["sleep_split"], n_jobs = n_jobs,
+                    progress = progress, cache = config["cache"], channels = config["channels"],
+                    windows = config["windows"], day_start = config["day_start"], wear_rules = config["wear_rules"],
+                    skip = set(finished) if previous is not None else None)
+    try:
+        thresholds = [[threshold] for threshold in config["thresholds"]]
+        if shard is None:
+            sala.process_streaming(outfile, thresholds, **settings)
+        else:
+            sala.process_shard(config["outfile"], thresholds, shard, num_shards, **settings)
+        manifest["status"] = "complete"
+    except KeyboardInterrupt:
+        manifest["status"] = "interrupted"
+        raise
+    except Exception as error:
+        manifest["status"] = "failed"
+        manifest["error"] = "".join(traceback.format_exception_only(type(error), error)).strip()
+        logger.error("run failed: %s", manifest["error"])
+        logger.debug(traceback.format_exc())
+    finally:
+        manifest["finished"] = _now()
+        manifest["stages"] = profiler.stages.to_dict(orient = "records")
+        _write_manifest(outfile, manifest)
+    logger.info("run %s, %d of %d participants done", manifest["status"],
+                len(manifest["participants"]), len(participants))
+    return manifest
+
+# %% ../03_cli.ipynb 13
+def main(argv = None):
+    """Entry point of the `sala` command. `sala run config.toml` runs the full pipeline for a
+       configuration, exiting with 0 once it is complete, 1 if it failed, 2 for an invalid
+       configuration or arguments, and 130 if it was interrupted. Rerunning a failed or interrupted
+       run continues where it stopped.
+
+       `sala run config.toml --shard I --num-shards N` runs a single shard of the study, e.g. one per
+       machine, and `sala merge config.toml` combines the shards once all of them are complete,
+       exiting with 1 while any shard is missing.
+
+       `sala report config.toml` saves a PDF report of every participant of a finished run to
+       outfile/reports/ (see `ParticipantReport`), exiting with 1 without any timing data.
+    """
+    parser = argparse.ArgumentParser(prog = "sala", description = "Spectrum Actiwatch Light Analysis")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    run_parser = commands.add_parser("run", help = "run the full pipeline for a configuration file")
+    run_parser.add_argument("config", help = "TOML (or JSON) configuration file")
+    run_parser.add_argument("--n-jobs", type = int, default = None,
+                            help = "participants processed at once, overriding the configuration")
+    run_parser.add_argument("--restart", action = "store_true",
+                            help = "process every participant again instead of resuming an earlier run")
+    run_parser.add_argument("--shard", type = int, default = None, help = "shard of the study to run")
+    run_parser.add_argument("--num-shards", type = int, default = None,
+                            help = "number of shards the study is split into")
+    run_parser.add_argument("-v", "--verbose", action = "store_true", help = "log every pipeline stage")
+    merge_parser = commands.add_parser("merge", help = "combine the outputs of every shard of a study")
+    merge_parser.add_argument("config", help = "TOML (or JSON) configuration file")
+    merge_parser.add_argument("--num-shards", type = int, default = None,
+                              help = "number of shards the study was split into, found from the output by default")
+    merge_parser.add_argument("-v", "--verbose", action = "store_true", help = "log progress")
+    report_parser = commands.add_parser("report", help = "save a PDF report of every participant of a run")
+    report_parser.add_argument("config", help = "TOML (or JSON) configuration file")
+    report_parser.add_argument("--outdir", default = None,
+                               help = "directory to save the reports to, outfile/reports/ by default")
+    report_parser.add_argument("--uid", action = "append", dest = "uids", default = None,
+                               help = "participant to report on, can be repeated, every participant by default")
+    report_parser.add_argument("--n-jobs", type = int, default = None,
+                               help = "reports drawn at once, overriding the configuration")
+    report_parser.add_argument("-v", "--verbose", action = "store_true", help = "log progress")
+    args = parser.parse_args(argv)
+    if args.command == "run" and (args.shard is None) != (args.num_shards is None):
+        parser.error("--shard and --num-shards must be given together")
+    if args.command == "run" and args.shard is not None and not 0 <= args.shard < args.num_shards:
+        parser.error("--shard must be between 0 and --num-shards - 1")
+
+    logging.basicConfig(level = logging.INFO if args.verbose else logging.WARNING, stream = sys.stderr,
+                        format = "%(asctime)s %(levelname)s %(name)s: %(message)s")
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError, ImportError) as error:
+        logger.error("could not read configuration %s: %s", args.config, error)
+        return EXIT_USAGE
+    if args.command == "merge":
+        try:
+            timing_data = merge_shards(config["outfile"], args.num_shards, grouping = config["grouping"])
+        except ValueError as error:
+            logger.error("could not merge shards: %s", error)
+            return EXIT_FAILED
+        logger.info("merged %d timing rows into %s", len(timing_data), config["outfile"])
+        return EXIT_OK
+    if args.command == "report":
+        outdir = os.path.join(config["outfile"], "reports") if args.outdir is None else args.outdir
+        try:
+            report = ParticipantReport.from_output(config["outfile"], thresholds = config["thresholds"],
+                                                   timezone = config["timezone"], grouping = config["grouping"])
+        except ValueError as error:
+            logger.error("could not read the run output: %s", error)
+            return EXIT_FAILED
+        paths = report.save(outdir, uids = args.uids, n_jobs = config["n_jobs"] if args.n_jobs is None else args.n_jobs)
+        logger.info("saved %d reports to %s", len(paths), outdir)
+        return EXIT_OK
+    try:
+        manifest = run(config, n_jobs = args.n_jobs, resume = not args.restart,
+                       shard = args.shard, num_shards = args.num_shards)
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    return EXIT_OK if manifest["status"] == "complete" else EXIT_FAILED
+
+# %% ../03_cli.ipynb 15
+# python -m SALA.cli, the notebook kernel is also __main__ but runs outside of the package
+if __name__ == "__main__" and __package__:
+    sys.exit(main())
@@ -13,7 +13,10 @@ import matplotlib.dates as md
 import matplotlib as mpl
 
 from datetime import time
-from .processing import SALAFrame
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import matplotlib.figure
+import os
+from .processing import SALAFrame, LightCube, QuantileSketch
 
 # %% ../01_plots.ipynb 5
 class ClockPlot:
@@ -30,7 +33,7 @@ class ClockPlot:
             Maps a series of minutes to radians for plot making.
         print_time(mins)
             Takes in a time as a float and returns a printable format.
-        plot(timing_data, group_by, thresholds=[], figsize=(5,10), timezone=None)
+        plot(timing_data, group_by, thresholds=[], figsize=(5,10), timezone=None, accuracy=None)
             Creates a clock-shaped plot for grouping with SALA-styled timing data.
     """
 
@@ -40,15 +43,15 @@ class ClockPlot:
 
         #### Parameters
 
-        data: pd.Series
-            A series of minute data
+        data: pd.Series or QuantileSketch
+            A series of minute data, or a sketch of it for approximate quartiles
 
         #### Returns
 
         (as a tuple) list of mins converted to radians, a converted median
         """
-        if type(data) != pd.Series:
-            raise TypeError("Error: function expected a series as input")
+        if not isinstance(data, (pd.Series, QuantileSketch)):
+            raise TypeError("Error: function expected a series or QuantileSketch as input")
         median = data.median()
         p25 = data.quantile(0.25)
         p75 = data.quantile(0.75)
@@ -75,65 +78,16 @@ class ClockPlot:
         return '{:02d}:{:02d}'.format(h,m)
 
     @staticmethod
-    def plot(timing_data, group_by, thresholds = [], figsize = (5, 10), timezone = None):
-        """Creates clock plots for a grouping within SALA-styled timing data. For
-        full functionality, the data should have specifically labeled columns for
-        'Sunrise', 'Sunset', 'Mins to FL from 4AM', 'Mins to LL from 4AM', 'Sleep offset MSLM',
-        'Sleep onset MSLM', and 'Threshold'.
-
-        #### Parameters
-
-
-            timing_data: pd.DataFrame or SALA
-                Timing data stored within a pandas dataframe, or a SALA object with
-                properly initialized data stored.
-
-            group_by: str
-                String to group the data by for comparison. (e.g. comparing Weekends/Holidays
-                against business days).
-
-            thresholds: list
-                List of light thresholds to draw.
-
-            figsize: tuple
-                Desired size of the outputted figure.
-
-            timezone: str
-                Timezone of the provided data. This should be of a single timezone. List
-                of valid timezones can be found in pytz.timezones.
-        """
-
+    def _prepare(timing_data, group_by, timezone, split_by = None):
+        """Columns of the timing data needed for clock plots, with sunrise and sunset as hours of the day."""
         if isinstance(timing_data, SALAFrame):
             timing_data = timing_data.data
 
-        sns.set_style("white")
-        if group_by == 'UID':
-            data = (
-            timing_data[["UID", "Date", "Threshold",
-                        "Sunrise", "Sunset",
-                        "Sleep onset MSLM", "Sleep offset MSLM",
-                        "Mins to FL from 4AM", "Mins to LL from 4AM"]]
-        ).copy()
-        else:
-            data = (
-                timing_data[["UID", "Date", "Threshold",
-                            group_by, "Sunrise", "Sunset",
-                            "Sleep onset MSLM", "Sleep offset MSLM",
-                            "Mins to FL from 4AM", "Mins to LL from 4AM"]]
-            ).copy()
-
-        if thresholds is None or len(thresholds) < 1 or not thresholds:
-            thresholds = data["Threshold"].unique()
-
-        # selecting a palette with seven colors
-        colors = sns.color_palette("Set2", 7)
-        box_rad = 0.3 / len(thresholds)
-        bar_width = (np.pi * 2) / 1440
-        box_sep = 1.1
-
-        unique_data = data[group_by].unique()
-        n_rows = unique_data.shape[0]
-        figure = plt.figure(figsize = figsize)
+        columns = ["UID", "Date", "Threshold", group_by, split_by, "Sunrise", "Sunset",
+                   "Sleep onset MSLM", "Sleep offset MSLM", "Mins to FL from 4AM", "Mins to LL from 4AM"]
+        data = timing_data[list(dict.fromkeys(column for column in columns if column is not None))].copy()
+        # minutes are nullable integers, plotted and summarized as floats with NaN for missing crossings
+        data = data.astype({"Mins to FL from 4AM": float, "Mins to LL from 4AM": float})
 
         # checking to ensure that the data has an initialized timezone
         if data["Sunrise"].dt.tz is None and timezone is not None:
@@ -159,87 +113,143 @@ class ClockPlot:
         data["Sunset"] = (
             data["Sunset"] - pd.to_datetime(data["Sunset"].dt.date)
             .dt.tz_localize(timezone)).dt.total_seconds() / (60 * 60)
+        return data
+
+    @staticmethod
+    def statistics(timing_data, group_by, thresholds = [], timezone = None, accuracy = None, split_by = None):
+        """Calculates everything drawn on the clock plots of every group in one grouped pass over the
+        timing data.
+
+        #### Parameters
+
+            timing_data: pd.DataFrame or SALA
+                Timing data stored within a pandas dataframe, or a SALA object with
+                properly initialized data stored.
+
+            group_by: str
+                String to group the data by for comparison, one clock per value.
 
-        unique_data = data[group_by].unique()
+            thresholds: list
+                List of light thresholds to draw. Default is every threshold in the data.
+
+            timezone: str
+                Timezone of the provided data.
+
+            accuracy: float or None
+                Relative accuracy of approximate quartiles from a QuantileSketch of every group.
+                Default = None, which calculates them exactly.
+
+            split_by: str or None
+                Column to split the data by ahead of group_by, e.g. 'UID' for one figure per
+                participant. Default = None.
+
+        #### Returns
+
+            (as a tuple) the light statistics, with the 25th, 50th and 75th percentiles of
+            light onset and offset for every group and threshold, and the clock statistics,
+            with the median sunrise and sunset, sleep onset and offset percentiles and the
+            number of subjects, dates and person-days of every group.
+        """
+        data = ClockPlot._prepare(timing_data, group_by, timezone, split_by)
+        if thresholds is None or len(thresholds) < 1 or not thresholds:
+            thresholds = data["Threshold"].unique()
+        keys = [group_by] if split_by is None or split_by == group_by else [split_by, group_by]
+        data["Light onset"] = 4 * 60 + data["Mins to FL from 4AM"]
+        data["Light offset"] = 4 * 60 + data["Mins to LL from 4AM"]
+        data = data.rename(columns = {"Sleep onset MSLM": "Sleep onset", "Sleep offset MSLM": "Sleep offset"})
+
+        def quartiles(frame, by, columns):
+            qs = [0.25, 0.5, 0.75]
+            grouped = frame.groupby(by, observed = True, sort = False)[columns]
+            if accuracy is None:
+                stats = grouped.quantile(qs).unstack()
+            else:
+                # one sketch per group and column in place of the exact quantiles
+                stats = grouped.apply(lambda group: pd.concat(
+                    {column: pd.Series(QuantileSketch(accuracy).update(group[column]).quantile(qs), index = qs)
+                     for column in columns}))
+            stats.columns = ["{} p{:.0f}".format(column, q * 100) for column, q in stats.columns]
+            return stats
+
+        # the order of the groups is the order they appear in within the data
+        light = quartiles(data[data["Threshold"].isin(thresholds)], keys + ["Threshold"],
+                          ["Light onset", "Light offset"])
+        # sleep is the same for every threshold of a day, it is taken from the rows of the last one
+        last = data[data["Threshold"] == thresholds[-1]]
+        grouped = data.groupby(keys, observed = True, sort = False)
+        clock = pd.DataFrame({"Sunrise": grouped["Sunrise"].median() * 60,
+                              "Sunset": grouped["Sunset"].median() * 60,
+                              "Subjects": grouped["UID"].nunique(),
+                              "Dates": grouped["Date"].nunique(),
+                              "Person-days": last.drop_duplicates(keys + ["UID", "Date"])
+                                             .groupby(keys, observed = True, sort = False).size()})
+        clock = clock.join(quartiles(last, keys, ["Sleep onset", "Sleep offset"]))
+        clock["Person-days"] = clock["Person-days"].fillna(0).astype(int)
+        return light, clock
+
+    @staticmethod
+    def _draw(figure, light, clock, group_by, thresholds):
+        """Draws one clock per group of the statistics onto figure, each of its arcs as a single patch."""
+        colors = sns.color_palette("Set2", 7)
+        box_rad = 0.3 / len(thresholds)
+        box_sep = 1.1
+        to_radians = 2 * np.pi / 1440
 
-        # setting up one plot per group within the data
-        for group_name, group in enumerate(unique_data):
+        for row, (group, stats) in enumerate(clock.iterrows()):
             # drawing radial/polar plot
-            ax = figure.add_subplot(n_rows, 1, group_name + 1, projection = "polar")
-            current_group = data.groupby(group_by).get_group(group)
+            ax = figure.add_subplot(len(clock), 1, row + 1, projection = "polar")
+
+            def arc(start, end, height, bottom, color):
+                # one polar bar spanning the minutes from start to end, if there are any
+                if not end > start:
+                    return False
+                ax.bar(start * to_radians, height, width = (end - start) * to_radians, bottom = bottom,
+                       align = "edge", color = color, linewidth = 0, alpha = 1.0)
+                return True
 
-            sunrise = (current_group["Sunrise"]).median() * 60
-            sunset = (current_group["Sunset"]).median() * 60
+            def median(minutes, height, bottom):
+                if not np.isnan(minutes):
+                    ax.bar(minutes * to_radians, height, width = 0.02, bottom = bottom,
+                           color = [0.2, 0.2, 0.2], linewidth = 0)
 
             # drawing distinctions between day and nighttime on the plot
-            dark = [x / 1440.0 * 2 * np.pi for x in np.arange(0, sunrise)]
-            ax.bar(dark, np.ones_like(dark), width = 0.02,  color = [0.42,0.42,0.42], linewidth = 0)
-            dark = [x / 1440.0 * 2 * np.pi for x in np.arange(sunset, 1440)]
-            ax.bar(dark, np.ones_like(dark), width = 0.02, color = [0.42, 0.42, 0.42], linewidth = 0)
+            arc(stats["Sunset"], stats["Sunrise"] + 1440, 1.0, 0.0, [0.42, 0.42, 0.42])
 
             light_boxes = []
             light_labels = []
-             # drawing range boxes for light thresholds
+            # drawing range boxes for light thresholds
             for i, threshold in enumerate(thresholds):
+                bottom = 1.0 - (i + 1) * box_rad * box_sep
+                key = group + (threshold,) if isinstance(group, tuple) else (group, threshold)
+                box = light.loc[key] if key in light.index else pd.Series(np.nan, index = light.columns)
                 added = False
-                group_by_thresh = current_group[current_group["Threshold"] == threshold]
-                onset = 4 * 60 + group_by_thresh["Mins to FL from 4AM"]
-                offset = 4 * 60 + group_by_thresh["Mins to LL from 4AM"]
-
-                onset_box, onset_median = ClockPlot.mins_to_radians(onset)
-                offset_box, offset_median = ClockPlot.mins_to_radians(offset)
-                light_box = ax.bar(onset_box, np.full(len(onset_box), box_rad),
-                       width = bar_width, bottom = 1.0 - (i + 1) * box_rad * box_sep,
-                       color = colors[i], linewidth = 0, alpha = 1.0)
-                light_median = ax.bar(onset_median, box_rad,
-                      width = 0.02, bottom = 1.0 - (i + 1) * box_rad * box_sep,
-                      color = [0.2, 0.2, 0.2], linewidth = 0)
-
-                # attempting to deal with low threshold light onset w/o offset issues
-                # these may sometimes be present in smaller datasets
-                if len(light_box) > 0:
-                    light_boxes.append(light_box)
+                if arc(box["Light onset p25"], box["Light onset p75"], box_rad, bottom, colors[i]):
+                    light_boxes.append(mpl.patches.Patch(color = colors[i]))
                     light_labels.append(
                         ('{:3d}lx {}-{}'.format(threshold,
-                                                ClockPlot.print_time(onset.median()),
-                                                ClockPlot.print_time(offset.median())))
+                                                ClockPlot.print_time(box["Light onset p50"]),
+                                                ClockPlot.print_time(box["Light offset p50"])))
                         )
                     added = True
+                median(box["Light onset p50"], box_rad, bottom)
                 # creating light boxes and medians based on offset
-                light_box = ax.bar(offset_box, np.full(len(offset_box), box_rad),
-                   width = bar_width, bottom = 1.0 - (i + 1) * box_rad * box_sep,
-                   color = colors[i], linewidth = 0, alpha = 1.0)
-                light_median = ax.bar(offset_median, box_rad,
-                    width = 0.02, bottom = 1.0 - (i + 1) * box_rad * box_sep,
-                    color = [0.2, 0.2, 0.2], linewidth = 0)
-                if (len(light_box) > 0) and (not added):
-                    light_boxes.append(light_box)
+                if arc(box["Light offset p25"], box["Light offset p75"], box_rad, bottom, colors[i]) and not added:
+                    light_boxes.append(mpl.patches.Patch(color = colors[i]))
                     light_labels.append('{}lx'.format(threshold))
+                median(box["Light offset p50"], box_rad, bottom)
 
             # drawing sleep onset and offset bars
-            onset = group_by_thresh["Sleep onset MSLM"]
-            offset = group_by_thresh["Sleep offset MSLM"]
-            onset_box, onset_median = ClockPlot.mins_to_radians(onset)
-            offset_box, offset_median = ClockPlot.mins_to_radians(offset)
-
-            slp_onset_box = ax.bar(onset_box, np.full(len(onset_box), 2 * box_rad),
-                  width = bar_width, bottom = 1.0 - (i + 3) * box_rad * box_sep,
-                  color = colors[-2], linewidth = 0, alpha = 1.0)
-            slp_onset_median = ax.bar(onset_median, 2 * box_rad,
-                  width = 0.02, bottom = 1.0 - (i + 3) * box_rad * box_sep,
-                  color = [0.2, 0.2, 0.2], linewidth = 0)
-            light_boxes.append(slp_onset_box)
+            bottom = 1.0 - (len(thresholds) + 2) * box_rad * box_sep
+            arc(stats["Sleep onset p25"], stats["Sleep onset p75"], 2 * box_rad, bottom, colors[-2])
+            median(stats["Sleep onset p50"], 2 * box_rad, bottom)
+            arc(stats["Sleep offset p25"], stats["Sleep offset p75"], 2 * box_rad, bottom, colors[-2])
+            median(stats["Sleep offset p50"], 2 * box_rad, bottom)
+            light_boxes.append(mpl.patches.Patch(color = colors[-2]))
             light_labels.append(
                 ('Sleep {}-{}'.format(
-                    ClockPlot.print_time(onset.median()),
-                    ClockPlot.print_time(offset.median())))
+                    ClockPlot.print_time(stats["Sleep onset p50"]),
+                    ClockPlot.print_time(stats["Sleep offset p50"])))
                 )
-            slp_offset_box = ax.bar(offset_box, np.full(len(offset_box), 2 * box_rad),
-                  width = bar_width, bottom = 1.0 - (i + 3) * box_rad * box_sep,
-                  color = colors[-2], linewidth = 0, alpha = 1.0)
-            slp_offset_median = ax.bar(offset_median, 2 * box_rad, width = 0.02,
-                  bottom = 1.0 - (i + 3) * box_rad * box_sep,
-                  color=[0.2, 0.2, 0.2], linewidth=0)
 
             # modifying figure element locations so that it is read as a clock
             theta_times = np.arange(0,6)*60
@@ -256,38 +266,202 @@ class ClockPlot:
             # generating a legend
             ax.legend(light_boxes,light_labels,loc=[1.01,0.01],prop={'family': 'monospace'})
 
-            # getting stats for plot title
-            num_uids = len(current_group["UID"].unique())
-            num_days = len(current_group["Date"].unique())
-            person_days = len(group_by_thresh[["UID", "Date"]].drop_duplicates())
-
             # setting plot title
             title = (
                 "{}={}: {} subjects, {} dates, {} person-days"
-                .format(group_by,group,num_uids,num_days,person_days)
+                .format(group_by, group[-1] if isinstance(group, tuple) else group,
+                        int(stats["Subjects"]), int(stats["Dates"]), int(stats["Person-days"]))
             )
             ax.set_title(title, y = 1.02)
 
+    @staticmethod
+    def _render(light, clock, group_by, thresholds, figsize, path):
+        """Draws and saves a figure with the Agg canvas, without going through pyplot."""
+        figure = mpl.figure.Figure(figsize = figsize)
+        FigureCanvasAgg(figure)
+        with sns.axes_style("white"):
+            ClockPlot._draw(figure, light, clock, group_by, thresholds)
+        figure.subplots_adjust(wspace = 1.2)
+        figure.savefig(path, bbox_inches = "tight")
+        return path
+
+    @staticmethod
+    def save_figures(timing_data, group_by, outdir, split_by = "UID", thresholds = [], figsize = (5, 10),
+                     timezone = None, accuracy = None, fmt = "png", n_jobs = -1):
+        """Saves one clock plot figure per value of split_by (e.g. per participant) to outdir, such as
+        for per-participant reports. The statistics of every figure are calculated together in one
+        pass, then the figures are drawn in parallel worker processes.
+
+        #### Parameters
+
+            timing_data: pd.DataFrame or SALA
+                Timing data stored within a pandas dataframe, or a SALA object with
+                properly initialized data stored.
+
+            group_by: str
+                String to group the data of each figure by, one clock per value.
+
+            outdir: str
+                Directory to save the figures to, named <split_by value>.<fmt>, with any '/' in the
+                value replaced by '-' (e.g. 'base_Weekend-Holiday.png').
+
+            split_by: str
+                Column holding the value each figure is drawn for. Default = 'UID'.
+
+            thresholds, figsize, timezone, accuracy
+                See plot.
+
+            fmt: str
+                File format of the figures, e.g. 'png' or 'pdf'. Default = 'png'.
+
+            n_jobs: int
+                Number of worker processes. Default = -1, which uses every available core.
+
+        #### Returns
+
+            The paths of the saved figures.
+        """
+        light, clock = ClockPlot.statistics(timing_data, group_by, thresholds, timezone, accuracy, split_by)
+        if thresholds is None or len(thresholds) < 1 or not thresholds:
+            thresholds = list(light.index.get_level_values("Threshold").unique())
+        os.makedirs(outdir, exist_ok = True)
+        splits = clock.index.get_level_values(0).unique()
+        return Parallel(n_jobs = n_jobs)(
+            delayed(ClockPlot._render)(light.xs(split, level = 0, drop_level = False),
+                                       clock.loc[[split]],
+                                       group_by, thresholds, figsize,
+                                       os.path.join(outdir, "{}.{}".format(str(split).replace("/", "-"), fmt)))
+            for split in splits)
+
+    @staticmethod
+    def plot(timing_data, group_by, thresholds = [], figsize = (5, 10), timezone = None, accuracy = None):
+        """Creates clock plots for a grouping within SALA-styled timing data. For
+        full functionality, the data should have specifically labeled columns for
+        'Sunrise', 'Sunset', 'Mins to FL from 4AM', 'Mins to LL from 4AM', 'Sleep offset MSLM',
+        'Sleep onset MSLM', and 'Threshold'.
+
+        #### Parameters
+
+
+            timing_data: pd.DataFrame or SALA
+                Timing data stored within a pandas dataframe, or a SALA object with
+                properly initialized data stored.
+
+            group_by: str
+                String to group the data by for comparison. (e.g. comparing Weekends/Holidays
+                against business days).
+
+            thresholds: list
+                List of light thresholds to draw.
+
+            figsize: tuple
+                Desired size of the outputted figure.
+
+            timezone: str
+                Timezone of the provided data. This should be of a single timezone. List
+                of valid timezones can be found in pytz.timezones.
+
+            accuracy: float or None
+                Relative accuracy of approximate medians and quartiles from a QuantileSketch of
+                every group, e.g. 0.01. Default = None, which calculates them exactly.
+        """
+
+        light, clock = ClockPlot.statistics(timing_data, group_by, thresholds, timezone, accuracy)
+        if thresholds is None or len(thresholds) < 1 or not thresholds:
+            thresholds = list(light.index.get_level_values("Threshold").unique())
+
+        sns.set_style("white")
+        figure = plt.figure(figsize = figsize)
+        ClockPlot._draw(figure, light, clock, group_by, thresholds)
         # adjusting spacing between generated plots
         plt.subplots_adjust(wspace = 1.2)
 
-# %% ../01_plots.ipynb 14
+# %% ../01_plots.ipynb 19
 class LightPlot:
     """Creates various light plots for grouped data based on time of day."""
 
     @staticmethod
-    def plot(data_list, labels, palette = "deep",
-                plot_type= "mean/sem", y_lim = None):
+    def _from_cube(cube, labels, plot_type, group_by, channel, min_count):
+        """Middle, low and high lines of every label straight from the aggregates of a LightCube."""
+        summary = cube.summary(group_by, channel, min_count)
+        found = list(summary.index.get_level_values("Label").unique())
+        labels = found if labels is None else list(labels)
+        missing = [label for label in labels if label not in found]
+        if missing:
+            raise ValueError(f"No light data for {missing}, available labels are {found}.")
+        d_m, d_low, d_high = [], [], []
+        for label in labels:
+            part = summary.loc[label]
+            if plot_type == "mean/sem":
+                d_m.append(part["Mean"].rename(channel))
+                d_low.append(d_m[-1] - part["SEM"])
+                d_high.append(d_m[-1] + part["SEM"])
+            elif plot_type == "counts":
+                d_m.append(part["Count"].rename(channel))
+                d_low.append(d_m[-1])
+                d_high.append(d_m[-1])
+            else:
+                d_m.append(part["Median"].rename(channel))
+                d_low.append(part["Q25"])
+                d_high.append(part["Q75"])
+        return d_m, d_low, d_high, labels
+
+    @staticmethod
+    def _draw(ax, d_m, d_low, d_high, labels, palette, plot_type, y_lim, tinc, y_label, verbose = True):
+        """Draws the middle lines and low-high bands of every label onto ax."""
+        palette = sns.color_palette(palette)
+        palette_idx = 0
+
+        for mid, lo, hi, lab in zip(d_m,d_low,d_high,labels):
+            cval = mpl.colors.to_hex(palette[palette_idx])
+            palette_idx = palette_idx + 1
+            timval = [pd.Timestamp(av.isoformat()) for av in mid.index.tolist()]
+
+            vals = pd.DataFrame(mid)
+            vals['time']=vals.index.to_series()
+            vals['mins']=vals.time.apply(lambda x: x.second / 60.0 + x.minute + x.hour * 60.0)
+            light = vals[vals.columns[0]]
+            vals['lux-mins']=light*vals['mins']
+            v = vals['lux-mins'].dropna().mean()/light.dropna().mean()
+            hrs = int(v / 1440*24)
+            mins = int((v - hrs * 60))
+            tmid = time(hrs, mins)
+            if verbose:
+                print ('{} - cumulative {}*sec: {:e}, center of mass of light exposure: {}'.format(lab                     ,y_label.strip(),mid.sum()*20,tmid))
+            lab = lab+'\n{:4.3e} lx*s, COLE {}'.format(mid.sum()*20,tmid)
+
+            ax.plot(timval, mid.values, color=cval, label=lab)
+            ax.fill_between(timval, hi.values, lo.values, color=cval, alpha=0.33)
+
+        ax.legend()
+
+        # format the ticks
+        tFmt = md.DateFormatter('%H:%M')
+        ax.xaxis.set_major_locator(md.HourLocator(byhour=range(0,24,4)))
+        ax.xaxis.set_major_formatter(tFmt)
+        if y_lim is not None:
+            ax.set_ylim(0,y_lim)
+        ax.yaxis.set_ticks(np.arange(tinc,y_lim,tinc))
+
+        ax.grid(True)
+        ax.set_ylabel(y_label + " " + plot_type)
+        ax.set_xlabel('Time of day')
+
+    @staticmethod
+    def plot(data_list, labels = None, palette = "deep",
+                plot_type= "mean/sem", y_lim = None, group_by = "Group", channel = "White Light", min_count = 0):
         """Generates light plots.
 
         #### Parameters
 
-        data_list: list
+        data_list: list or LightCube
 
-            A list of series of light data for plotting.
+            A list of series of light data for plotting, or a LightCube of the study, which is
+            plotted directly from its time-of-day aggregates.
         labels: list
 
-            A list of labels corresponding how you'd like each series in d_list to be labeled.
+            A list of labels corresponding how you'd like each series in d_list to be labeled. For
+            a LightCube, the values of group_by to plot (default: all of them).
         palette: string
 
             Valid seaborn color palette title.
@@ -298,9 +472,20 @@ class LightPlot:
         y_limit: int or None
 
             Desired default range for y_limit of the outputted plots.
+        group_by: str
+
+            For a LightCube, the grouping to compare: 'Group', 'DayType' or 'GroupDayType'.
+        channel: str
+
+            For a LightCube, the light channel to plot. Default is "White Light".
+        min_count: int
+
+            For a LightCube, time-of-day bins with this many samples or fewer are left out.
         """
 
-        if len(data_list) != len(labels):
+        if plot_type not in ("mean/sem", "counts", "quantiles"):
+            raise ValueError("Valid plot choices are 'mean/sem', 'counts', 'quantiles'.")
+        if not isinstance(data_list, LightCube) and (labels is None or len(data_list) != len(labels)):
             raise ValueError("Number of data series must match number of labels.")
         d_m = []
         d_low = []
@@ -308,7 +493,14 @@ class LightPlot:
         tinc = 200
         y_label = "Lux"
 
-        if plot_type == "mean/sem":
+        if isinstance(data_list, LightCube):
+            d_m, d_low, d_high, labels = LightPlot._from_cube(data_list, labels, plot_type,
+                                                              group_by, channel, min_count)
+            if plot_type == "counts":
+                tinc = 5000
+                y_label = "Number of Samples"
+                y_lim = np.max([len(data) for data in d_m]) * 10
+        elif plot_type == "mean/sem":
             for data in data_list:
                 d_m.append(pd.Series(data.mean()).sort_index())
                 # sem = standard error
@@ -335,39 +527,4 @@ class LightPlot:
             raise ValueError("Valid plot choices are 'mean/sem', 'counts', 'quantiles'.")
 
         plt.figure(figsize=(8,6))
-        ax=plt.gca()
-        palette = sns.color_palette(palette)
-        palette_idx = 0
-
-        for mid, lo, hi, lab in zip(d_m,d_low,d_high,labels):
-            cval = mpl.colors.to_hex(palette[palette_idx])
-            palette_idx = palette_idx + 1
-            timval = [pd.Timestamp(av.isoformat()) for av in mid.index.tolist()]
-
-            vals = pd.DataFrame(mid)
-            vals['time']=vals.index.to_series()
-            vals['mins']=vals.time.apply(lambda x: x.second / 60.0 + x.minute + x.hour * 60.0)
-            vals['lux-mins']=vals['White Light']*vals['mins']
-            v = vals['lux-mins'].dropna().mean()/vals['White Light'].dropna().mean()
-            hrs = int(v / 1440*24)
-            mins = int((v - hrs * 60))
-            tmid = time(hrs, mins)
-            print ('{} - cumulative {}*sec: {:e}, center of mass of light exposure: {}'.format(lab                     ,y_label.strip(),mid.sum()*20,tmid))
-            lab = lab+'\n{:4.3e} lx*s, COLE {}'.format(mid.sum()*20,tmid)
-
-            ax.plot(timval, mid.values, color=cval, label=lab)
-            ax.fill_between(timval, hi.values, lo.values, color=cval, alpha=0.33)
-
-        ax.legend()
-
-        # format the ticks
-        tFmt = md.DateFormatter('%H:%M')
-        ax.xaxis.set_major_locator(md.HourLocator(byhour=range(0,24,4)))
-        ax.xaxis.set_major_formatter(tFmt)
-        if y_lim is not None:
-            ax.set_ylim(0,y_lim)
-        ax.yaxis.set_ticks(np.arange(tinc,y_lim,tinc))
-
-        ax.grid(True)
-        plt.ylabel(y_label + " " + plot_type)
-        plt.xlabel('Time of day')
+        LightPlot._draw(plt.gca(), d_m, d_low, d_high, labels, palette, plot_type, y_lim, tinc, y_label)
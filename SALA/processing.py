@@ -1,9 +1,13 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../00_processing.ipynb.
 
 # %% auto 0
-__all__ = ['SALAFrame', 'remove_first_day']
+__all__ = ['MELANOPIC_WEIGHTS', 'DERIVED_CHANNELS', 'RAW_SCHEMA', 'WEAR_RULES', 'THRESHOLD_COLUMNS', 'melanopic_edi',
+           'compact_raw_data', 'ParsedFileCache', 'person_day_quality', 'apply_wear_rules', 'write_dataset',
+           'read_dataset', 'QuantileSketch', 'LightCube', 'PipelineProfiler', 'date_table', 'wide_timing',
+           'long_timing', 'SALAFrame', 'remove_first_day', 'merge_shards']
 
 # %% ../00_processing.ipynb 3
+import fastparquet
 import numpy as np
 import pandas as pd
 
@@ -11,245 +15,1589 @@ from joblib import Parallel, delayed
 from pandas.tseries.holiday import USFederalHolidayCalendar as calendar
 from astral import LocationInfo, sun, pytz
 
+import contextlib
+import cProfile
+import copy
+import datetime
+import functools
 import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
 import sys
+import time
+import tracemalloc
+import warnings
 
 # %% ../00_processing.ipynb 4
-def firstAndLastLight(data, threshold_list, resamp=False):
-    ''' firstAndLastLight(data, threshold_list, resamp=False) applies all thresholds in the list to each unique person-day in the data, finding the first and last times as well as total times light intensity is above those thresholds for any non-zero number.  A 0 threshold is a request to calc amount of time spent at 5 lux and under.  Time resampling of the data is done if resamp is of the form [func name,'time'], such as [np.mean,'5T'] or [np.max,'15T'].'''
-    ids = data.UID.unique()
-    firstlight = []
-    lastlight = []
-    min2fl = []
-    min2ll = []
-    whoswatch = []
-    watchperiod = []
-    thresholds = []
-    datelist = []
-    grouplist = []
-    totalact=[]
-    tabvlight=[]
-    tabvlightAM=[]
-    tluxmin = []
-    tluxminAM = []
-
-    for uid in ids:
-            these_rows = (data.UID == uid) & (data['Interval Status'].isin(['ACTIVE','REST'])) & np.logical_not(data['Off-Wrist Status'])
-
-            assert (these_rows.sum() > 0),"ISSUE: "+uid+" has no ACTIVE rows"
-
-
-            daysofdata = set( data[ these_rows ].index.date )
-
-            if 'Group' in data.columns:
-                group = data[data.UID == uid].iloc[0,:]["Group"]
-            elif 'Season' in data.columns:
-                group = data[data.UID == uid].iloc[0,:]["Season"]
-            else:
-                print("ISSUE: Potentially no group variable?")
-                raise ValueError
-
-            for a_day in daysofdata:
-                nextday = a_day + pd.tseries.offsets.Day()
-                nextday = nextday.date().isoformat()
-                thisday = a_day.isoformat()
-                daylight = data[these_rows][thisday + ' 04:00:00' : nextday + ' 03:59:00']['White Light']
-                if resamp: # resample if the function argument is set
-                    daylight = daylight.resample(resamp[1]).apply(resamp[0])
-
-                # watch update period for todays data
-                dperiod = daylight.index.to_series().diff().min()
-                dpmult = dperiod/pd.Timedelta('1 min') # multiplier to get lux-minutes later
-
-                lxmin =  dpmult * daylight.sum()
-                lxminAM = dpmult * daylight[:thisday + ' 12:00'].sum()
-
-                for a_thresh in threshold_list:
-                    thresholds.append(a_thresh)
-                    if a_thresh == 0 :
-                        abovethresh = daylight.index[ daylight < 5] # 0 theshold is a request to calculate under 5 lux
-                        abovethreshAM = daylight[:thisday + ' 12:00'].index[ daylight[:thisday + ' 12:00'] < 5]
-                    else:
-                        abovethresh = daylight.index[ daylight > a_thresh]
-                        abovethreshAM = daylight[:thisday + ' 12:00'].index[ daylight[:thisday + ' 12:00'] > a_thresh]
-                    tabvlight.append( dperiod * len(abovethresh))
-                    tabvlightAM.append( dperiod * len(abovethreshAM))
-                    tluxmin.append( lxmin )
-                    tluxminAM.append( lxminAM )
-                    watchperiod.append(dperiod)
-                    datelist.append(a_day)
-                    grouplist.append(group)
-                    try:
-                        timelight = abovethresh[-1] # last time is above threshold
-                        mins4am = (timelight.time().hour - 4) * 60 + timelight.time().minute
-                        if mins4am < 0: # if after midnight, then value above is negative
-                            mins4am += 24 * 60 # fix by adding 24 hours (in minutes) to it
-                    except IndexError: # there is no above threshold level all day long
-                        timelight = np.nan
-                        mins4am = np.nan
-                    lastlight.append(timelight)
-                    min2ll.append(mins4am)
-                    try:
-                        timelight = abovethresh[0] # first time is above threshold
-                        mins4am = (timelight.time().hour - 4) * 60 + timelight.time().minute
-                        if mins4am < 0: # if after midnight, then value above is negative
-                            mins4am += 24 * 60 # fix by adding 24 hours (in minutes) to it
-                    except IndexError: # there is no above threshold level all day long
-                        timelight = np.nan
-                        mins4am = np.nan
-                    firstlight.append(timelight)
-                    min2fl.append(mins4am)
-                    whoswatch.append(uid)
-    return pd.DataFrame( {'UID': whoswatch, 'Date': datelist, 'Threshold': thresholds,
-                          'Last Light': lastlight, 'Mins to LL from 4AM': min2ll,
-                          'First Light': firstlight, 'Mins to FL from 4AM': min2fl,
-                          'Time above threshold': tabvlight, 'Time above threshold AM': tabvlightAM,
-                          'Minutes above threshold': [ el.total_seconds()/60.0 for el in tabvlight],
-                          'Minutes above threshold AM': [ el.total_seconds()/60.0 for el in tabvlightAM],
-                          'Lux minutes': tluxmin, 'Lux minutes AM': tluxminAM,
-                          'Group': grouplist,
-                          'Watch period': watchperiod
-                         } )
+# PLACEHOLDER weights, not a calibration: melanopic EDI (lux) is approximated as a weighted sum of the
+# Actiwatch Spectrum color channels (uW/cm2), scaled by 10 (uW/cm2 to mW/m2) over the melanopic efficacy
+# of daylight (1.3262 mW/m2 per melanopic EDI lux, CIE S 026). The shares below are uncalibrated round
+# numbers that only favor the blue end of the spectrum; they are not derived from the watch's channel
+# sensitivities or the melanopsin action spectrum, so results are not comparable to measured melanopic EDI.
+MELANOPIC_WEIGHTS = {'Red Light': 0.0, 'Green Light': 0.3, 'Blue Light': 0.7}
+
+def melanopic_edi(data, weights=None):
+    '''melanopic_edi(data, weights) approximates the melanopic equivalent daylight illuminance of every sample of raw data from its color channels, as a weighted sum of the channels converted to lux. weights should be the calibrated {channel: share} weights of the specific watch model. Without them the uncalibrated placeholder MELANOPIC_WEIGHTS are used and a warning is issued, since the result is then only a rough relative index and not a melanopic EDI.'''
+    if weights is None:
+        warnings.warn("melanopic_edi is using the uncalibrated placeholder MELANOPIC_WEIGHTS; pass calibrated "
+                      "weights of the watch model for a meaningful melanopic EDI.", UserWarning, stacklevel = 2)
+        weights = MELANOPIC_WEIGHTS
+    irradiance = sum(weight * data[channel].to_numpy(dtype = float) for channel, weight in weights.items())
+    return irradiance * 10 / 1.3262
+
+# channels calculated from the raw channels of the watch, by name
+DERIVED_CHANNELS = {'Melanopic EDI': melanopic_edi}
 
 # %% ../00_processing.ipynb 5
-def load_actiwatch_data(path,uidprefix=''):
-
-    if path[-1]!='/':    # make sure path has a trailing slash
-        path = path + '/'
-    files = glob.glob(path+'*.csv') # gets all .csv filenames in directory
-    if not files: # let us know if there's no .csv files in path!
-        print('Oops! No csv files in ' + path)
-        raise OSError
+# person-days run from 4AM to 4AM unless another day start is given; the light window of a day ends 59 seconds
+# before the next day starts (inclusive to the second) and its default "AM" window ends at 12:00 (inclusive
+# to the minute)
+DAY_START = pd.Timedelta("4 hours")
+DAY_END = pd.Timedelta("23 hours 59 min 1 s")
+AM_END = "12:00"
+
+def _channel_values(data, channel):
+    '''raw values of a channel column of data, or the values of a derived channel calculated from it'''
+    if channel in data.columns:
+        return data[channel].to_numpy()
+    if channel in DERIVED_CHANNELS:
+        return DERIVED_CHANNELS[channel](data)
+    raise ValueError(f"Unknown light channel {channel!r}, expected a column of the raw data or one of {list(DERIVED_CHANNELS)}.")
+
+def _valid_light(data, channel='White Light'):
+    '''_valid_light(data, channel) returns the on-wrist ACTIVE/REST samples of data as a frame of UID, DateTime and Light, sorted by participant (in order of appearance) and time. With a list of channels, every channel gets its own column named after it instead of Light.'''
+    codes, ids = pd.factorize(data.UID.to_numpy())
+    these_rows = (data['Interval Status'].isin(['ACTIVE','REST']) & np.logical_not(data['Off-Wrist Status'])).to_numpy()
+    channels = {'Light': channel} if isinstance(channel, str) else {name: name for name in channel}
+    valid = pd.DataFrame({'UID': pd.Categorical.from_codes(codes[these_rows], categories = ids),
+                          'DateTime': data.index[these_rows],
+                          **{name: _channel_values(data, column)[these_rows] for name, column in channels.items()}})
+    found = np.bincount(codes[these_rows], minlength = len(ids)) > 0
+    missing = [uid for uid, present in zip(ids, found) if not present]
+    if missing:
+        raise ValueError("ISSUE: "+", ".join(map(str, missing))+" has no on-wrist ACTIVE or REST rows")
+    return valid.sort_values(['UID', 'DateTime'], kind = 'stable', ignore_index = True)
+
+def _assign_person_days(valid, day_start=DAY_START):
+    '''_assign_person_days(valid, day_start) labels every sample with its person-day starting at day_start (Date) and its offset from the start of that day (Offset), dropping samples outside of the day window.'''
+    shifted = valid.DateTime - _clock_offset(day_start)
+    valid = valid.assign(Date = shifted.dt.floor('D'))
+    valid['Offset'] = shifted - valid.Date
+    return valid[valid.Offset < DAY_END].reset_index(drop = True)
+
+def _clock_offset(clock):
+    '''_clock_offset(clock) converts a clock time such as "06:30" or a datetime.time to the pd.Timedelta since midnight, timedeltas are returned as they are'''
+    if isinstance(clock, pd.Timedelta):
+        return clock
+    stamp = pd.Timestamp(str(clock))
+    return stamp - stamp.normalize()
+
+def _window_offsets(windows, day_start=DAY_START):
+    '''_window_offsets(windows, day_start) turns a dict of named (start, end) clock times into the (start, end) offsets of every window from the start of the person-day, in nanoseconds. Ends are inclusive to the minute, a window ending at or before its start runs past midnight, and windows are cut off at the end of the person-day.'''
+    day_start = _clock_offset(day_start)
+    offsets = {}
+    for name, window in windows.items():
+        if not isinstance(name, str) or len(window) != 2:
+            raise ValueError(f"Day windows are given as {{name: (start, end)}}, got {name!r}: {window!r}.")
+        start = (_clock_offset(window[0]) - day_start) % pd.Timedelta("1 day")
+        end = (_clock_offset(window[1]) - day_start) % pd.Timedelta("1 day") + pd.Timedelta("1 min")
+        if end <= start:
+            end += pd.Timedelta("1 day")
+        offsets[name] = (start.value, min(end, DAY_END).value)
+    return offsets
+
+
+DAY_NS = pd.Timedelta("1 day").value
+
+def _time_index(uids, times):
+    '''_time_index(uids, times) builds the time index of samples sorted by participant and time: their int64 epoch timestamps (nanoseconds), the UIDs in order of their blocks and the offsets where each UID's block of timestamps begins, with the number of samples appended. The timestamps are a view of times where possible.'''
+    stamps = np.asarray(times, dtype = 'datetime64[ns]').view('i8')
+    uids = np.asarray(uids)
+    changed = np.ones(len(uids), dtype = bool)
+    changed[1:] = uids[1:] != uids[:-1]
+    starts = np.flatnonzero(changed)
+    return stamps, uids[starts], np.append(starts, len(uids))
+
+def _window_edges(index, uids, *edges):
+    '''_window_edges(index, uids, *edges) finds the sample position of every edge (int64 epoch nanoseconds, one array per edge) of a window of each of uids with a binary search within the block of that UID in the time index, so that every window is a plain slice [lo, hi) of the sorted samples. Windows of UIDs without any samples are empty.'''
+    stamps, order, bounds = index
+    block = pd.Index(order).get_indexer(uids)
+    found = [np.zeros(len(block), dtype = np.int64) for _ in edges]
+    windows = np.argsort(block, kind = 'stable')
+    splits = np.searchsorted(block[windows], np.arange(len(order) + 1))
+    for b in range(len(order)):
+        these = windows[splits[b]:splits[b + 1]]
+        if len(these):
+            samples = stamps[bounds[b]:bounds[b + 1]]
+            for positions, edge in zip(found, edges):
+                positions[these] = bounds[b] + np.searchsorted(samples, edge[these])
+    return tuple(found)
+
+def _reduce_windows(ufunc, values, lo, hi, empty):
+    '''_reduce_windows(ufunc, values, lo, hi, empty) reduces the rows values[lo:hi] of every window with a single ufunc.reduceat over the window edges, which reads the samples in place instead of copying each window. Windows must be disjoint and in ascending order, and empty ones get the value empty.'''
+    result = np.full((len(lo),) + values.shape[1:], empty, dtype = np.result_type(values, empty))
+    # reduceat runs its last edge to the end of values, so edges at the very end are left out
+    edges = np.column_stack([lo, hi]).ravel()
+    edges = edges[:np.count_nonzero(edges < len(values))]
+    if len(edges):
+        reduced = ufunc.reduceat(values, edges, axis = 0)[::2]
+        filled = (hi > lo)[:len(reduced)]
+        result[:len(reduced)][filled] = reduced[filled]
+    return result
+
+def _calendar_days(valid, index):
+    '''_calendar_days(valid, index) returns every (UID, Date) calendar date with samples in a sorted frame, found from runs of the time index.'''
+    stamps = index[0]
+    day = stamps - stamps % DAY_NS
+    uid = valid.UID.cat.codes.to_numpy()
+    changed = np.ones(len(day), dtype = bool)
+    changed[1:] = (uid[1:] != uid[:-1]) | (day[1:] != day[:-1])
+    return pd.DataFrame({'UID': valid.UID[changed].reset_index(drop = True), 'Date': day[changed].view('M8[ns]')})
+
+
+def _day_window_stats(valid, index, days, threshold_list, channels=None, windows=None, day_start=DAY_START):
+    '''_day_window_stats(valid, index, days, threshold_list, channels, windows, day_start) computes the light timing of every (UID, Date) person-day in days for all thresholds in one pass, returning one row per day and threshold. The window of every day, starting at day_start, and its named windows (offsets from _window_offsets) are slices of the sorted valid samples found with the time index in a single search, and every statistic is reduced over all days at once, so each named window only adds its own reductions. Days without samples in their window get missing values. With a list of channel columns, all channels are evaluated in the same pass and the rows of each day are repeated per channel, with a Channel column.'''
+    stamps = index[0]
+    windows = {} if windows is None else windows
+    names = ['Light'] if channels is None else list(channels)
+    thresh = np.asarray(threshold_list)
+    nthresh = len(thresh)
+    light = valid[names].to_numpy(dtype = float)
+    date = days.Date.to_numpy(dtype = 'datetime64[ns]').view('i8')
+    start = date + _clock_offset(day_start).value
+    edges = [start, start + DAY_END.value] + [start + offset for window in windows.values() for offset in window]
+    edges = _window_edges(index, days.UID.cat.codes.to_numpy(), *edges)
+    lo, hi = edges[:2]
+
+    # watch update period for each person-day, NaT for days with fewer than two samples
+    steps = np.diff(stamps, prepend = stamps[:1])
+    steps[lo[lo < len(steps)]] = np.iinfo(np.int64).max
+    dperiod = _reduce_windows(np.minimum, steps, lo, hi, np.iinfo(np.int64).max)
+    dperiod = np.where(dperiod == np.iinfo(np.int64).max, np.iinfo(np.int64).min, dperiod).view('m8[ns]')
+    dpmult = dperiod / np.timedelta64(1, 'm') # multiplier to get lux-minutes later
+
+    # a single broadcast comparison for every channel and threshold, 0 is a request to calculate under 5 lux;
+    # every (channel, threshold) pair becomes one column, channel-major
+    lit = np.nan_to_num(light)
+    with np.errstate(invalid = 'ignore'):
+        abovethresh = np.where(thresh == 0, light[:, :, None] < 5,
+                               light[:, :, None] > thresh).reshape(len(light), -1)
+    positions = np.arange(len(light))[:, None]
+    counts = abovethresh.astype(np.int64)
+    firsts = np.where(abovethresh, positions, len(light))
+    lasts = np.where(abovethresh, positions, -1)
+    # the appended NaT stands in for the times of windows without any sample above threshold
+    times = np.append(stamps, np.iinfo(np.int64).min).view('M8[ns]')
+    ncols = abovethresh.shape[1]
+    period = np.repeat(dperiod, ncols)
+
+    def window_stats(wlo, whi, suffix = ''):
+        '''every statistic of the windows [wlo, whi) of all days, as columns named with suffix'''
+        first = _reduce_windows(np.minimum, firsts, wlo, whi, len(light)).ravel()
+        last = _reduce_windows(np.maximum, lasts, wlo, whi, -1).ravel()
+        anyabove = last >= 0
+        lxmin = dpmult[:, None] * _reduce_windows(np.add, lit, wlo, whi, 0.0)
+        return {'Last Light' + suffix: times[np.where(anyabove, last, len(light))],
+                'First Light' + suffix: times[np.where(anyabove, first, len(light))],
+                'Time above threshold' + suffix: period * _reduce_windows(np.add, counts, wlo, whi, 0).ravel(),
+                'Lux minutes' + suffix: np.repeat(lxmin, nthresh, axis = 1).ravel()}
+
+    stats = pd.DataFrame({'UID': np.repeat(days.UID.to_numpy(), ncols),
+                          'Date': np.repeat(days.Date.to_numpy(), ncols),
+                          'Threshold': np.tile(thresh, len(days) * len(names)),
+                          **window_stats(lo, hi),
+                          **{column: values for w, name in enumerate(windows)
+                             for column, values in window_stats(*edges[2 + 2 * w:4 + 2 * w], ' ' + name).items()},
+                          'Watch period': period})
+    # offsets are always counted from 4AM of the date, whatever the day start
+    fourAM = np.repeat(date + DAY_START.value, ncols).view('M8[ns]')
+    stats['LL offset'] = stats['Last Light'] - fourAM
+    stats['FL offset'] = stats['First Light'] - fourAM
+    if channels is not None:
+        stats.insert(2, 'Channel', np.tile(np.repeat(names, nthresh), len(days)))
+    return stats
+
+def firstAndLastLight(data, threshold_list, resamp=False, channels=None, windows=None, day_start="04:00"):
+    ''' firstAndLastLight(data, threshold_list, resamp=False, channels=None, windows=None, day_start="04:00") applies all thresholds in the list to each unique person-day in the data, finding the first and last times as well as total times light intensity is above those thresholds for any non-zero number.  A 0 threshold is a request to calc amount of time spent at 5 lux and under.  Time resampling of the data is done if resamp is of the form [func name,'time'], such as [np.mean,'5T'] or [np.max,'15T'].  The window of every person-day is found once with a binary search in a per-participant time index and all thresholds are evaluated together over those windows, so run time grows linearly with the number of rows.  By default only White Light is used; channels can list other raw light columns (e.g. 'Red Light') or derived channels (see DERIVED_CHANNELS, e.g. 'Melanopic EDI'), which are all evaluated in the same pass and reported in long format with a Channel column.  Person-days start at day_start (4AM by default) and run for 24 hours.  windows can name further windows of the day as {name: (start, end)} clock times, e.g. {'Morning': ('06:00', '10:00'), 'Evening': ('18:00', '22:00')}, each of which gets its own Time above threshold, Minutes above threshold, Lux minutes, First Light and Last Light columns suffixed with its name; ends are inclusive to the minute and windows are cut off at the end of the person-day.  All windows are found in the same search and reduced in the same pass as the full day.  By default only the time above threshold and lux minutes of an "AM" window from the day start until 12:00 are reported.  Mins to FL/LL from 4AM are whole minutes (nullable Int64, missing when the threshold is never exceeded) counted from 4AM of the Date whatever the day start.'''
+    if 'Group' in data.columns:
+        group_col = 'Group'
+    elif 'Season' in data.columns:
+        group_col = 'Season'
     else:
-        print('Found {} csv files in {}. Pass #1, raw data'.format(len(files),path))
-        for _ in range(len(files)):
-            sys.stdout.write('.')
-        sys.stdout.write('\n')
-
-    frames = [] # list of data frames we will get from processing the files
-    for afile in files:
-        sys.stdout.write('.')
-        sys.stdout.flush()
-        with open(afile,'r') as f:
-            # we need to skip any previous analysis that's at the top of the
-            # file and get to the raw data below it
-            while True:
-                currentFilePosition = f.tell()
-                line = f.readline()
-                if line == '': # empty line read if EOF
-                    print('EOF without retrieving raw data: ' + afile)
-                    break # get out of this loop so we can go on to next file
-                cells = line.split(',') # comma seperated values (CSV)
-                columns = tuple(filter( None, [el.strip().strip('\"') for el in cells])) #need tuple because in python3 filter is evaluated in lazy fasion
-                # DEBUG print len(columns),': ', columns
-                # the raw data has a 12 element long header line:
-                # Line , Date , Time , Off-wrist status , ....
-                if ( (len(columns)==12) and (columns[0] == 'Line') ):
-                    break
-
-
-            if line == '': #empty line read if EOF
-                continue # go on to the next file
+        print("ISSUE: Potentially no group variable?")
+        raise ValueError
+    groups = data.drop_duplicates('UID').set_index('UID')[group_col]
+    offsets = _window_offsets({'AM': (day_start, AM_END)} if windows is None else windows, day_start)
+
+    valid = _valid_light(data) if channels is None else _valid_light(data, list(channels))
+    index = _time_index(valid.UID.cat.codes.to_numpy(), valid.DateTime)
+    # a person-day is reported for every calendar date with valid data, even if its window is empty
+    daysofdata = _calendar_days(valid, index)
+
+    lights = ['Light'] if channels is None else list(channels)
+    if resamp: # resample each person-day if the function argument is set
+        valid = (_assign_person_days(valid, day_start).set_index('DateTime')
+                 .groupby(['UID', 'Date'], observed = True, sort = False)[lights]
+                 .resample(resamp[1]).apply(resamp[0]).reset_index())
+        index = _time_index(valid.UID.cat.codes.to_numpy(), valid.DateTime)
+
+    keys = ['UID', 'Date', 'Threshold'] if channels is None else ['UID', 'Date', 'Channel', 'Threshold']
+    timing = _day_window_stats(valid, index, daysofdata, threshold_list, channels, offsets, day_start)
+
+    timing['UID'] = timing.UID.astype(object)
+    timing['Date'] = timing.Date.dt.date
+    # whole minutes since 4AM, times after midnight count past 24 hours; missing without any light above the threshold
+    timing['Mins to LL from 4AM'] = np.floor(timing.pop('LL offset') / pd.Timedelta('1 min')).astype('Int64')
+    timing['Mins to FL from 4AM'] = np.floor(timing.pop('FL offset') / pd.Timedelta('1 min')).astype('Int64')
+    suffixes = [''] + [' ' + name for name in offsets]
+    for suffix in suffixes:
+        timing['Minutes above threshold' + suffix] = timing['Time above threshold' + suffix] / pd.Timedelta('1 min')
+    timing['Group'] = groups.loc[timing.UID].to_numpy()
+    if channels is not None:
+        # channels keep the order they were requested in when sorted
+        timing['Channel'] = pd.Categorical(timing.Channel, categories = lights)
+    # the default AM window keeps the columns timing data always had, named windows also report their crossings
+    crossings = [] if windows is None else [kind + suffix for suffix in suffixes[1:] for kind in ['First Light', 'Last Light']]
+    return timing[keys + ['Last Light', 'Mins to LL from 4AM', 'First Light', 'Mins to FL from 4AM']
+                  + [column + suffix for column in ['Time above threshold', 'Minutes above threshold', 'Lux minutes']
+                     for suffix in suffixes]
+                  + crossings + ['Group', 'Watch period']]
+
+def _flatten_thresholds(thresholds):
+    '''thresholds may be given as a list of lists, one per worker in the threshold mode of process_data'''
+    return [t for threshold in thresholds for t in np.atleast_1d(threshold)]
+
+def _day_fingerprints(raw_data):
+    '''_day_fingerprints(raw_data) summarizes the raw rows of every (UID, calendar date) by their count and an order-independent hash, so that changed days can be found later without keeping the previous raw data around.'''
+    stamps = pd.DataFrame({'UID': raw_data.UID.to_numpy(), 'Date': raw_data.index.normalize(),
+                           'Hash': pd.util.hash_pandas_object(raw_data, index = True).to_numpy()})
+    return (stamps.groupby(['UID', 'Date'], sort = False)
+            .agg(Rows = ('Hash', 'size'), Hash = ('Hash', 'sum')).reset_index())
+
+def _window_settings(windows, day_start, sleep_split, wear_rules=None):
+    '''_window_settings(windows, day_start, sleep_split, wear_rules) describes the day windows and wear-time rules that timing data was processed with, as stored next to exported timing data so that incremental runs can tell whether they changed'''
+    clock = lambda time: str(_clock_offset(time))
+    return {'windows': None if windows is None else {name: [clock(start), clock(end)] for name, (start, end) in windows.items()},
+            'day_start': clock(day_start), 'sleep_split': clock(sleep_split), 'wear_rules': wear_rules}
+
+# a sleep day runs from the sleep split on its date until 18:00 (inclusive to the minute) on the next day,
+# and a sleep period ends once the watch has not scored REST-S for more than an hour
+SLEEP_DAY_END = pd.Timedelta("1 day 18 hours 1 min")
+SLEEP_GAP = pd.Timedelta("1 hour")
+
+def _sleep_periods(raw_data, days, sleep_split="18:00"):
+    '''_sleep_periods(raw_data, days, sleep_split) splits the REST-S samples of every (UID, Date) sleep day in days into sleep periods, returning one row per period with its UID, Date, Sleep period (numbered within the day), Sleep onset, Sleep offset and Sleep duration. The window of every sleep day is found in a time index of each participant's sorted REST-S timestamps, the samples of all windows are gathered by position, and periods are split at the gaps in one run-length pass.'''
+    split = (pd.Timestamp(sleep_split) - pd.Timestamp(sleep_split).normalize()).value
+    asleep = raw_data["Interval Status"].to_numpy() == "REST-S" # REST-S = watch thinks user is asleep
+    codes, uids = pd.factorize(raw_data["UID"].to_numpy()[asleep])
+    stamps = raw_data.index.to_numpy(dtype = "datetime64[ns]")[asleep].view("i8")
+    order = np.lexsort((stamps, codes))
+    index = _time_index(codes[order], stamps[order])
+
+    # sleep days overlap, the one starting before a sample and the one before that can both hold it
+    days = days.sort_values(["UID", "Date"], ignore_index = True)
+    start = days["Date"].to_numpy(dtype = "datetime64[ns]").view("i8")
+    lo, hi = _window_edges(index, pd.Index(uids).get_indexer(days["UID"]), start + split,
+                           start + SLEEP_DAY_END.value)
+    counts = hi - lo
+    window = np.repeat(np.arange(len(days)), counts)
+    times = index[0][np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+
+    # a new sleep period starts with every sleep day and after every gap of more than an hour
+    new_period = np.ones(len(times), dtype = bool)
+    new_period[1:] = (window[1:] != window[:-1]) | (np.diff(times) > SLEEP_GAP.value)
+    onsets = np.flatnonzero(new_period)
+    offsets = np.append(onsets[1:], len(times)) - 1
+    periods = days.iloc[window[onsets]].reset_index(drop = True)
+    periods["Sleep period"] = np.arange(len(onsets)) - np.searchsorted(window[onsets], window[onsets])
+    periods["Sleep onset"] = times[onsets].view("M8[ns]")
+    periods["Sleep offset"] = times[offsets].view("M8[ns]")
+    periods["Sleep duration"] = periods["Sleep offset"] - periods["Sleep onset"]
+    return periods
 
+# %% ../00_processing.ipynb 6
+def _header_cells(line):
+    '''splits a csv line into its non-empty, unquoted cells'''
+    cells = line.decode(errors = 'replace').split(',') # comma seperated values (CSV)
+    return tuple(filter( None, [el.strip().strip('\"') for el in cells])) #need tuple because in python3 filter is evaluated in lazy fasion
+
+def _scan_actiwatch_file(f):
+    '''_scan_actiwatch_file(f) finds the summary table and the raw epoch table of an Actiware export in a single
+    pass over the lines above the raw data, returning (raw_position, raw_columns, summary_position, toskip, nlines).
+    Positions are None if the respective table was not found.'''
+    raw_position = raw_columns = summary_position = summary_start = None
+    toskip = [1] # we skip the line after the summary header, it has units
+    nlines = 0
+    position = 0
+    for line in iter(f.readline, b''):
+        columns = _header_cells(line)
+        # the raw data has a 12 element long header line:
+        # Line , Date , Time , Off-wrist status , ....
+        if ( (len(columns)==12) and (columns[0] == 'Line') ):
+            raw_position, raw_columns = position, columns
+            break
+        if summary_start is not None and summary_position is None:
+            # advance to find out how many lines the summary includes
+            # since we don't care about excluded intervals and they
+            # also don't have a full set of columns, we stop there
+            nlines += 1
+            if columns:
+                if columns[0].find('Summary'):
+                    toskip.append(nlines)
+
+                if columns[0] == 'EXCLUDED':
+                    summary_position = summary_start
+        # the summary data has a 35 element long header line:
+        # Interval Type , Interval #, Start Date, ....
+        elif ( (len(columns)==35) and (columns[0] == 'Interval Type') and (summary_start is None) ):
+            summary_start = position
+        position += len(line)
+    return raw_position, raw_columns, summary_position, toskip, nlines
+
+# Actiware writes dates and times in one of these layouts, anything else falls back to pandas' inference
+ACTIWARE_DATETIME_FORMATS = ['%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %H:%M:%S']
+
+def _parse_datetimes(stamps):
+    '''parses a series of "Date Time" strings, trying the known Actiware layouts before per-element inference'''
+    for fmt in ACTIWARE_DATETIME_FORMATS:
+        try:
+            return pd.to_datetime(stamps, format=fmt)
+        except ValueError:
+            pass
+    return pd.to_datetime(stamps)
+
+def _read_actiwatch_file(afile):
+    '''_read_actiwatch_file(afile) parses the raw epoch table and the summary table of a single
+    Actiware export, returning (raw, summary) with None for any table that is missing from the file.'''
+    rawData = summaryData = None
+    with open(afile,'rb') as f:
+        # we need to skip any previous analysis that's at the top of the
+        # file and get to the raw data below it
+        raw_position, columns, summary_position, toskip, nlines = _scan_actiwatch_file(f)
+
+        if summary_position is None:
+            print('EOF without retrieving summary data: ' + afile)
+        else:
             # move the file pointer back to the beginning of the header line
             # so we can read it in as a header for the DataFrame
-            f.seek(currentFilePosition)
-
-            # generate unique identifier for this individual based on filename
-            # assumes filename has format:
-            # /path/to/file/UID_Month_Date_Year_Time_*.csv
-            UID = uidprefix + afile.split('/')[-1].split('_')[0]
+            f.seek(summary_position)
+            summaryData = pd.read_csv(f, index_col=False, skiprows=toskip,
+                                      nrows=nlines, skip_blank_lines=True)
 
+        if raw_position is None:
+            print('EOF without retrieving raw data: ' + afile)
+        else:
             # grab the data, ignore the first column which just has line numbers
             # stuff the two Date/Time columns into a single Date variable
-            fileData = pd.read_csv(f, index_col=False, usecols=columns[1:],
-                                       parse_dates={'DateTime': [0,1]})
-            fileData['UID'] = UID
-
-            frames.append(fileData)
-
-    rawWatchData = pd.concat(frames) # make one big dataframe
+            f.seek(raw_position)
+            rawData = pd.read_csv(f, index_col=False, usecols=columns[1:])
+            stamps = rawData.pop(columns[1]).astype(str) + ' ' + rawData.pop(columns[2]).astype(str)
+            rawData.insert(0, 'DateTime', _parse_datetimes(stamps))
+    return rawData, summaryData
+
+def load_actiwatch_data(path, uidprefix='', n_jobs=1, prefer='threads', progress=None, cache=None, quality=False):
+    '''load_actiwatch_data(path, uidprefix='', n_jobs=1, prefer='threads', progress=None, cache=None, quality=False) loads every
+    Actiware csv export in path (a directory or a list of csv files), returning (raw, summary) dataframes. Each file is scanned once for both of its tables and
+    files are parsed concurrently by n_jobs workers of a thread (prefer='threads') or process (prefer='processes')
+    pool. If given, progress(done, total, filename) is called as each file is finished. cache can be a ParsedFileCache
+    (or a directory for one), in which case only new or changed files are parsed and the rest are read from the cache.
+    The raw table is returned in the compact RAW_SCHEMA types, sorted by UID and time. With quality=True the
+    data-quality and wear-time index of every person-day (see person_day_quality) is returned as a third frame; it is
+    computed in one pass over the combined table once every file is parsed, as the files of a participant can share
+    person-days.'''
+    if isinstance(path, (list, tuple)):
+        files = list(path)
+    else:
+        if path[-1]!='/':    # make sure path has a trailing slash
+            path = path + '/'
+        files = glob.glob(path+'*.csv') # gets all .csv filenames in directory
+        if not files: # let us know if there's no .csv files in path!
+            print('Oops! No csv files in ' + path)
+            raise OSError
+        else:
+            print('Found {} csv files in {}'.format(len(files),path))
+    if isinstance(cache, str):
+        cache = ParsedFileCache(cache)
+
+    parsed = {} # (raw, summary) frames of every file
+    def finished(afile, frames):
+        parsed[afile] = frames
+        if progress is not None:
+            progress(len(parsed), len(files), afile)
+
+    if cache is not None:
+        for afile in files:
+            frames = cache.get(afile)
+            if frames is not None:
+                finished(afile, frames)
+    misses = [afile for afile in files if afile not in parsed]
+    results = (Parallel(n_jobs=n_jobs, prefer=prefer, return_as='generator')
+               (delayed(_read_actiwatch_file)(afile) for afile in misses))
+    for afile, frames in zip(misses, results):
+        if cache is not None:
+            cache.put(afile, *frames)
+        finished(afile, frames)
+    if cache is not None:
+        cache.save()
+
+    rawframes = [] # list of data frames we will get from processing the files
+    summaryframes = []
+    for afile in files:
+        # generate unique identifier for this individual based on filename
+        # assumes filename has format:
+        # /path/to/file/UID_Month_Date_Year_Time_*.csv
+        UID = uidprefix + afile.split('/')[-1].split('_')[0]
+        rawData, summaryData = parsed[afile]
+        if rawData is not None:
+            # cast numeric columns per file so the combined frame is never held at full width
+            rawframes.append(_compact_columns(rawData, RAW_SCHEMA).assign(UID = UID))
+        if summaryData is not None:
+            summaryframes.append(summaryData.assign(UID = UID))
+
+    rawWatchData = pd.concat(rawframes) # make one big dataframe
     rawWatchData.index = rawWatchData['DateTime']
     del rawWatchData['DateTime']
-#%%
-    print('\nPass #2, data summary')
-    for _ in range(len(files)):
-        sys.stdout.write('.')
-    sys.stdout.write('\n')
+    rawWatchData = compact_raw_data(rawWatchData)
 
-    frames = [] # list of data frames we will get from processing the files
-    for afile in files:
-        sys.stdout.write('.')
-        sys.stdout.flush()
-        with open(afile,'r') as f:
-            # we need to skip to the summary statistics
-            while True:
-                summaryFilePosition = f.tell()
-                line = f.readline()
-                if line == '': #empty line read if EOF
-                    print('EOF without retrieving summary data: ' + afile)
-                    break # get out of this loop so we can go on to next file
-                cells = line.split(',') # comma seperated values (CSV)
-                columns = tuple(filter( None, [el.strip().strip('\"') for el in cells])) #need tuple because in python3 filter is evaluated in lazy fasion
-                # print len(columns), columns[0]
-                # the raw data has a 35 element long header line:
-                # Interval Type , Interval #, Start Date, ....
-                if ( (len(columns)==35) and (columns[0] == 'Interval Type') ):
-                    break
-
-            if line == '': #empty line read if EOF
-                continue # go on to the next file
+    if summaryframes:
+        summaryWatchData = pd.concat(summaryframes)
+    else:
+        summaryWatchData = None
 
-            # advance to find out how many lines the summary includes
-            # since we don't care about excluded intervals and they
-            # also don't have a full set of columns, we stop there
-            nlines = 0
-            toskip = [1] # we skip the line after the header, it has units
-            while True:
-                line = f.readline()
-                if line == '': #empty line read if EOF
-                    print('EOF without retrieving summary data: ' + afile)
-                    break # get out of this loop so we can go on to next file
-                cells = line.split(',') # comma seperated values (CSV)
-                columns = tuple(filter( None, [el.strip().strip('\"') for el in cells])) #need tuple because in python3 filter is evaluated in lazy fasion
-                nlines += 1
-
-                if columns:
-                    if columns[0].find('Summary'):
-                        toskip.append(nlines)
-
-                    if columns[0] == 'EXCLUDED':
-                        break
-
-            if line == '': #empty line read if EOF
-                continue # go on to the next file
+    if quality:
+        return (rawWatchData, summaryWatchData, person_day_quality(rawWatchData))
+    return (rawWatchData, summaryWatchData)
 
-            # move the file pointer back to the beginning of the header line
-            # so we can read it in as a header for the DataFrame
-            f.seek(summaryFilePosition)
+def _participant_files(directory):
+    '''_participant_files(directory) lists the (key, UID, files) of every participant in a dictionary of folders, with
+    UIDs generated from the filenames in the same way as load_actiwatch_data (key + UID_Month_Date_Year_Time_*.csv).'''
+    participants = {}
+    for key, path in directory.items():
+        for afile in sorted(glob.glob(os.path.join(path, '*.csv'))):
+            UID = key + os.path.basename(afile).split('_')[0]
+            participants.setdefault((key, UID), []).append(afile)
+    return [(key, UID, files) for (key, UID), files in participants.items()]
+
+# %% ../00_processing.ipynb 7
+# compact in-memory schema of raw actiwatch data, see "Raw Data Schema" below
+RAW_SCHEMA = {
+    "Off-Wrist Status": "bool",
+    "Activity": "float32",
+    "Marker": "float32",
+    "White Light": "float32",
+    "Red Light": "float32",
+    "Green Light": "float32",
+    "Blue Light": "float32",
+    "Sleep/Wake": "boolean",
+    "Interval Status": "category",
+    "UID": "category",
+    "Group": "category",
+}
+
+def _compact_columns(raw_data, columns):
+    """Casts the given columns of raw_data to their RAW_SCHEMA types, skipping any that are missing."""
+    dtypes = {column: RAW_SCHEMA[column] for column in columns if column in raw_data.columns}
+    if "Off-Wrist Status" in dtypes:
+        # epochs without an off-wrist flag have always been treated as off-wrist
+        raw_data["Off-Wrist Status"] = raw_data["Off-Wrist Status"].fillna(1)
+    return raw_data.astype(dtypes)
+
+def compact_raw_data(raw_data):
+    """Casts raw actiwatch data to the compact types of RAW_SCHEMA and sorts it by UID and time,
+    so every participant's rows form one block with a sorted DateTime index. Columns that are not
+    part of the schema are kept as they are.
+    """
+    raw_data = _compact_columns(raw_data, RAW_SCHEMA)
+    return raw_data.rename_axis("DateTime").sort_values(["UID", "DateTime"], kind = "stable")
 
-            # generate unique identifier for this individual based on filename
-            # assumes filename has format:
-            # /path/to/file/UID_Month_Date_Year_Time_*.csv
-            UID = uidprefix + afile.split('/')[-1].split('_')[0]
+# %% ../00_processing.ipynb 8
+class ParsedFileCache:
+    """
+    On-disk cache of parsed Actiware exports. The raw and summary tables of every source csv are
+    stored as parquet files named after the content hash of the csv, so reloading a study only
+    parses exports that are new or have changed.
 
-            # grab the data, ignore the first column which just has line numbers
-            # stuff the two Date/Time columns into a single Date variable
-            fileData = pd.read_csv(f, index_col=False, skiprows=toskip,
-                                       nrows=nlines, skip_blank_lines=True)
-            fileData['UID'] = UID
 
-            frames.append(fileData)
+        Attributes
+        ----------
+        path: str
+            Directory holding the cached tables along with an index.json file that maps each
+            source csv (path, size and modification time) to its content hash.
+
+        max_bytes: int
+            Size cap for the cached tables. Least recently used entries are evicted once the
+            cache grows beyond it.
+
+        Methods
+        -------
+        get(afile)
+            Returns the cached (raw, summary) tables for a csv file, or None if it has not
+            been cached yet.
+
+        put(afile, raw, summary)
+            Stores the parsed tables of a csv file.
+
+        save()
+            Evicts least recently used entries above max_bytes and writes the index to disk.
+
+        clear()
+            Removes every cached table and the index.
+    """
+
+    def __init__(self, path, max_bytes = 2 * 1024**3):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok = True)
+        self._index = self._read_index()
+        self._evicted = set()
 
-    if frames:
-        summaryWatchData = pd.concat(frames)
+    def _index_file(self):
+        return os.path.join(self.path, "index.json")
+
+    def _table_file(self, digest, table):
+        return os.path.join(self.path, f"{digest}.{table}.parquet")
+
+    def _read_index(self):
+        try:
+            with open(self._index_file()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"files": {}, "entries": {}}
+
+    def _digest(self, afile):
+        """Content hash of a csv file, reusing the recorded hash while its size and mtime are unchanged."""
+        stat = os.stat(afile)
+        key = os.path.abspath(afile)
+        record = self._index["files"].get(key)
+        if record is None or record["size"] != stat.st_size or record["mtime"] != stat.st_mtime_ns:
+            digest = hashlib.sha1()
+            with open(afile, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            record = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest.hexdigest()}
+            self._index["files"][key] = record
+        return record["hash"]
+
+    def get(self, afile):
+        """Returns the cached (raw, summary) tables of afile, None for a table missing from the
+        file, or None altogether if the file is not in the cache."""
+        digest = self._digest(afile)
+        entry = self._index["entries"].get(digest)
+        if entry is None:
+            return None
+        try:
+            tables = tuple(pd.read_parquet(self._table_file(digest, table), engine = "fastparquet")
+                           if entry[table] else None for table in ("raw", "summary"))
+        except OSError:
+            # cached tables were removed behind our back, parse the file again
+            del self._index["entries"][digest]
+            return None
+        entry["used"] = time.time()
+        return tables
+
+    def put(self, afile, raw, summary):
+        """Stores the parsed raw and summary tables of afile."""
+        digest = self._digest(afile)
+        entry = {"raw": raw is not None, "summary": summary is not None, "bytes": 0, "used": time.time()}
+        for table, data in (("raw", raw), ("summary", summary)):
+            if data is not None:
+                # write aside and rename, other loaders may be storing the same content
+                tmp_file = f"{self._table_file(digest, table)}.{os.getpid()}.tmp"
+                data.to_parquet(tmp_file, engine = "fastparquet", compression = "snappy")
+                os.replace(tmp_file, self._table_file(digest, table))
+                entry["bytes"] += os.path.getsize(self._table_file(digest, table))
+        self._index["entries"][digest] = entry
+        self._evicted.discard(digest)
+
+    def save(self):
+        """Evicts least recently used entries above max_bytes and writes the index, merging in
+        entries written by other loaders sharing the same directory."""
+        index = self._read_index()
+        index["files"].update(self._index["files"])
+        index["entries"].update(self._index["entries"])
+        for digest in self._evicted:
+            index["entries"].pop(digest, None)
+
+        total = sum(entry["bytes"] for entry in index["entries"].values())
+        for digest in sorted(index["entries"], key = lambda d: index["entries"][d]["used"]):
+            if total <= self.max_bytes:
+                break
+            total -= index["entries"].pop(digest)["bytes"]
+            self._evicted.add(digest)
+            for table in ("raw", "summary"):
+                if os.path.exists(self._table_file(digest, table)):
+                    os.remove(self._table_file(digest, table))
+
+        self._index = index
+        tmp_file = f"{self._index_file()}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_file, self._index_file())
+
+    def clear(self):
+        """Removes every cached table and the index."""
+        for digest in self._index["entries"]:
+            for table in ("raw", "summary"):
+                if os.path.exists(self._table_file(digest, table)):
+                    os.remove(self._table_file(digest, table))
+        if os.path.exists(self._index_file()):
+            os.remove(self._index_file())
+        self._index = {"files": {}, "entries": {}}
+        self._evicted = set()
+
+# %% ../00_processing.ipynb 9
+# wear-time rules of a valid person-day, see apply_wear_rules; rules set to None are not checked
+WEAR_RULES = {
+    "min_wear_minutes": 600,
+    "max_off_wrist_fraction": None,
+    "max_gaps": None,
+    "max_gap_minutes": None,
+    "max_duplicates": None,
+    "max_epoch_changes": None,
+}
+
+def person_day_quality(raw_data, day_start = "04:00"):
+    """Data-quality and wear-time index of every person-day of raw actiwatch data, computed in one
+    vectorized pass over the rows of each participant in time order. Person-days start at day_start,
+    as in firstAndLastLight.
+
+    #### Parameters
+
+    raw_data: pd.DataFrame
+
+        Raw actiwatch data, as returned by load_actiwatch_data or get_raw_data.
+
+    day_start: str
+
+        Clock time at which person-days start. Default = "04:00", which is 4:00AM.
+
+    #### Returns
+
+        A dataframe with one row per UID and Date holding the number of 'Epochs' (rows), the
+        'Epoch length' (shortest step between rows), the number of 'Epoch changes' (switches between
+        regular step lengths), 'Duplicates' (rows repeating the previous timestamp), 'Gaps' (steps
+        longer than two epochs) and their 'Gap minutes' of missing time, the 'Off-wrist fraction' of
+        rows and the 'Wear minutes' spent on-wrist in ACTIVE, REST or REST-S intervals.
+    """
+    codes, uids = pd.factorize(raw_data["UID"].to_numpy())
+    stamps = raw_data.index.to_numpy(dtype = "datetime64[ns]").view("i8")
+    # raw data from compact_raw_data is already sorted by participant and time
+    if np.any(np.diff(codes) < 0) or np.any((np.diff(stamps) < 0) & (codes[1:] == codes[:-1])):
+        order = np.lexsort((stamps, codes))
     else:
-        summaryWatchData = None
-    #%%
+        order = np.arange(len(codes))
+    codes, stamps = codes[order], stamps[order]
+    off_wrist = raw_data["Off-Wrist Status"].to_numpy(dtype = bool)[order]
+    worn = raw_data["Interval Status"].isin(["ACTIVE", "REST", "REST-S"]).to_numpy()[order] & ~off_wrist
+
+    shifted = stamps - _clock_offset(day_start).value
+    day = shifted - shifted % DAY_NS
+    new_day = np.ones(len(stamps), dtype = bool)
+    new_day[1:] = (codes[1:] != codes[:-1]) | (day[1:] != day[:-1])
+    firsts = np.flatnonzero(new_day)
+    which = np.cumsum(new_day) - 1
+    ndays = len(firsts)
+    lo, hi = firsts, np.append(firsts[1:], len(stamps))
+    count = lambda weights: np.bincount(which, weights = weights, minlength = ndays)
+
+    # steps between rows of the same participant, only those within a person-day make up its epochs
+    steps = np.diff(stamps, prepend = stamps[:1])
+    same_uid = np.zeros(len(stamps), dtype = bool)
+    same_uid[1:] = codes[1:] == codes[:-1]
+    positive = ~new_day & (steps > 0)
+    epoch = _reduce_windows(np.minimum, np.where(positive, steps, np.iinfo(np.int64).max), lo, hi,
+                            np.iinfo(np.int64).max)
+    missing = steps - epoch[which]
+    gap = positive & (missing > epoch[which])
+    regular = np.flatnonzero(positive & ~gap)
+    changed = np.bincount(which[regular[1:]], minlength = ndays,
+                          weights = (steps[regular[1:]] != steps[regular[:-1]])
+                                    & (which[regular[1:]] == which[regular[:-1]]))
+    epoch = np.where(epoch == np.iinfo(np.int64).max, np.iinfo(np.int64).min, epoch).view("m8[ns]")
+
+    quality = pd.DataFrame({"UID": uids[codes[firsts]], "Date": day[firsts].view("M8[ns]"),
+                            "Epochs": hi - lo, "Epoch length": epoch,
+                            "Epoch changes": changed.astype(np.int64),
+                            "Duplicates": count(same_uid & (steps == 0)).astype(np.int64),
+                            "Gaps": count(gap).astype(np.int64),
+                            "Gap minutes": count(np.where(gap, missing, 0)) / pd.Timedelta("1 min").value,
+                            "Off-wrist fraction": count(off_wrist) / (hi - lo),
+                            "Wear minutes": count(worn) * (epoch / pd.Timedelta("1 min"))})
+    return quality
+
+def apply_wear_rules(quality, rules = None):
+    """Marks the person-days of a quality index that pass the wear-time rules.
+
+    #### Parameters
+
+    quality: pd.DataFrame
+
+        Quality index of person-days, as returned by person_day_quality.
+
+    rules: dict or None
+
+        Rules to apply on top of WEAR_RULES, e.g. {'min_wear_minutes': 720, 'max_gaps': 2}. A rule
+        set to None is not checked. Default = None, which applies WEAR_RULES as they are.
+
+    #### Returns
+
+        The quality index with a boolean 'Valid' column. Person-days without an epoch length
+        (a single row) are never valid.
+    """
+    rules = {**WEAR_RULES, **({} if rules is None else rules)}
+    unknown = set(rules) - set(WEAR_RULES)
+    if unknown:
+        raise ValueError(f"Unknown wear rules {sorted(unknown)}, expected some of {list(WEAR_RULES)}.")
+    checks = {"min_wear_minutes": ("Wear minutes", np.greater_equal),
+              "max_off_wrist_fraction": ("Off-wrist fraction", np.less_equal),
+              "max_gaps": ("Gaps", np.less_equal),
+              "max_gap_minutes": ("Gap minutes", np.less_equal),
+              "max_duplicates": ("Duplicates", np.less_equal),
+              "max_epoch_changes": ("Epoch changes", np.less_equal)}
+    valid = quality["Epoch length"].notna().to_numpy()
+    for rule, limit in rules.items():
+        if limit is not None:
+            column, compare = checks[rule]
+            valid &= compare(quality[column].to_numpy(), limit)
+    return quality.assign(Valid = valid)
+
+def _valid_day_rows(raw_data, quality, day_start = "04:00"):
+    '''_valid_day_rows(raw_data, quality, day_start) flags the rows of raw_data that fall in a person-day marked Valid in quality'''
+    valid = quality[quality["Valid"]]
+    days = pd.MultiIndex.from_arrays([valid["UID"].astype(str), valid["Date"]])
+    shifted = raw_data.index - _clock_offset(day_start)
+    return pd.MultiIndex.from_arrays([raw_data["UID"].astype(str), shifted.floor("D")]).isin(days)
+
+# %% ../00_processing.ipynb 10
+def write_dataset(data, path, time_column = "DateTime", partition_on = ("Group", "UID"),
+                  compression = "snappy", row_group_size = 50_000):
+    """Writes raw or timing data to a hive-partitioned parquet dataset, with one directory per
+       value of each partition_on column and then one per calendar month of time_column
+       (e.g. path/Group=base_/UID=base_user1234/Month=2018-06/). Rows are time ordered within
+       every file, so the row group statistics of time_column can be used to skip data on reads.
 
-    return (rawWatchData, summaryWatchData)
+        #### Parameters
+
+        data: pd.DataFrame
+
+            Data to write, such as the output of `get_raw_data` or `process_data`.
+
+        path: str
+
+            Directory of the dataset. (e.g. ../SALA/example_output/raw)
+
+        time_column: str
+
+            Index level or column holding the time of each row, used to partition by month.
+            Default = "DateTime", use "Date" for timing data.
+
+        partition_on: tuple
+
+            Columns to partition by ahead of the month. Default = ("Group", "UID").
+
+        compression: str
+
+            Parquet codec. Default = "snappy".
+
+        row_group_size: int
+
+            Maximum number of rows in a row group. Default = 50,000.
+
+    """
+    data = data.reset_index() if time_column in data.index.names else data.copy()
+    data[time_column] = pd.to_datetime(data[time_column]).astype("datetime64[ns]")
+    data["Month"] = data[time_column].dt.strftime("%Y-%m")
+    partition_on = [column for column in partition_on if column in data.columns] + ["Month"]
+    data = data.sort_values(partition_on + [time_column], kind = "stable")
+    data.to_parquet(path, engine = "fastparquet", compression = compression, index = False,
+                    partition_cols = partition_on, row_group_offsets = row_group_size)
+
+def read_dataset(path, groups = None, uids = None, start = None, end = None, columns = None,
+                 time_column = "DateTime"):
+    """Reads a dataset written by `write_dataset`. Group, UID and date filters are pushed down
+       to the partition directories and row group statistics, so only the matching files are read.
+
+        #### Parameters
+
+        path: str
+
+            Directory of the dataset. (e.g. ../SALA/example_output/raw)
+
+        groups: list or None
+
+            Groups to read. Default = None, which reads every group.
+
+        uids: list or None
+
+            UIDs to read. Default = None, which reads every UID.
+
+        start, end: str, datetime or None
+
+            First and last times to read (both inclusive). Default = None, which does not limit
+            the time range.
+
+        columns: list or None
+
+            Columns to read, along with time_column. Default = None, which reads every column.
+
+        time_column: str
+
+            Column holding the time of each row. Default = "DateTime", use "Date" for timing data.
+            Raw data is returned indexed by it.
+
+        #### Returns
+
+        The matching rows of the dataset.
+
+    """
+    filters = []
+    if groups is not None:
+        filters.append(("Group", "in", list(groups)))
+    if uids is not None:
+        filters.append(("UID", "in", list(uids)))
+    if start is not None:
+        start = pd.Timestamp(start)
+        filters += [("Month", ">=", start.strftime("%Y-%m")), (time_column, ">=", start)]
+    if end is not None:
+        end = pd.Timestamp(end)
+        filters += [("Month", "<=", end.strftime("%Y-%m")), (time_column, "<=", end)]
+    if columns is not None:
+        columns = [time_column] + [column for column in columns if column != time_column]
+    # filters only select partitions and row groups, the time range is trimmed exactly below
+    data = pd.read_parquet(path, engine = "fastparquet", columns = columns, filters = filters or None)
+    data = data.drop(columns = "Month", errors = "ignore")
+    if start is not None:
+        data = data[data[time_column] >= start]
+    if end is not None:
+        data = data[data[time_column] <= end]
+    if time_column == "DateTime":
+        data = data.set_index("DateTime")
+    return data
+
+# %% ../00_processing.ipynb 11
+class QuantileSketch:
+    """
+    Mergeable approximate quantiles of a stream of values, in the style of DDSketch. Values are
+    counted in logarithmic buckets, so memory grows with the range of the values rather than their
+    number, and sketches of separate participants, groups, shards or runs can be merged exactly.
+    Every quantile is within the relative accuracy of the value at its rank, i.e. the median of
+    values around 600 minutes is off by at most 6 minutes with the default accuracy of 1%.
+
+
+        Methods
+        -------
+        update(values)
+            Adds values to the sketch.
+        merge(other)
+            Adds the values counted by another sketch of the same accuracy.
+        quantile(q) / median()
+            Estimated quantile(s) of all values added so far.
+        to_frame() / from_frame(frame, accuracy)
+            Stores the bucket counts of a sketch in a dataframe and reads them back.
+    """
+
+    def __init__(self, accuracy = 0.01):
+        if not 0 < accuracy < 1:
+            raise ValueError("accuracy must be between 0 and 1.")
+        self.accuracy = accuracy
+        self._zeros = 0
+        self._stores = {1: pd.Series(dtype = "int64"), -1: pd.Series(dtype = "int64")}
+
+    @property
+    def gamma(self):
+        return (1 + self.accuracy) / (1 - self.accuracy)
+
+    @property
+    def count(self):
+        """Number of values added to the sketch."""
+        return int(self._zeros + self._stores[1].sum() + self._stores[-1].sum())
+
+    def update(self, values):
+        """Adds an array or series of values, skipping missing ones. Returns the sketch itself."""
+        values = np.asarray(values, dtype = float).ravel()
+        values = values[~np.isnan(values)]
+        self._zeros += int((values == 0).sum())
+        for sign in (1, -1):
+            magnitudes = values[values * sign > 0] * sign
+            counts = pd.Series(_log_buckets(magnitudes, self.gamma)).value_counts()
+            self._stores[sign] = self._stores[sign].add(counts, fill_value = 0).astype("int64")
+        return self
+
+    def merge(self, other):
+        """Adds the values counted by another sketch. Returns the sketch itself."""
+        if other.accuracy != self.accuracy:
+            raise ValueError("Only sketches with the same accuracy can be merged.")
+        self._zeros += other._zeros
+        for sign in (1, -1):
+            self._stores[sign] = self._stores[sign].add(other._stores[sign], fill_value = 0).astype("int64")
+        return self
+
+    def quantile(self, q = 0.5):
+        """Estimated q-quantile (or array of quantiles for a list of q) of the values, NaN when empty."""
+        qs = np.atleast_1d(np.asarray(q, dtype = float))
+        if self.count == 0:
+            result = np.full(len(qs), np.nan)
+        else:
+            # buckets in ascending order of their values, negative values first
+            negative = self._stores[-1].sort_index(ascending = False)
+            positive = self._stores[1].sort_index()
+            values = np.concatenate([-_bucket_values(negative.index.to_numpy(), self.gamma), [0.0],
+                                     _bucket_values(positive.index.to_numpy(), self.gamma)])
+            seen = np.cumsum(np.concatenate([negative.to_numpy(), [self._zeros], positive.to_numpy()]))
+            # the bucket holding the value at rank q * (count - 1)
+            result = values[np.searchsorted(seen, qs * (self.count - 1), side = "right")]
+        return result[0] if np.ndim(q) == 0 else result
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def to_frame(self):
+        """The 'Count' of values in every 'Bucket' of each 'Sign' (-1, 0 or 1) of the sketch."""
+        frames = [pd.DataFrame({"Sign": sign, "Bucket": store.index.to_numpy(dtype = "int64"),
+                                "Count": store.to_numpy()}) for sign, store in self._stores.items()]
+        frames.append(pd.DataFrame({"Sign": [0], "Bucket": [0], "Count": [self._zeros]}))
+        frame = pd.concat(frames, ignore_index = True)
+        return frame[frame["Count"] > 0].sort_values(["Sign", "Bucket"], ignore_index = True)
+
+    @classmethod
+    def from_frame(cls, frame, accuracy = 0.01):
+        """Sketch of the bucket counts in frame, as written by to_frame with the same accuracy."""
+        sketch = cls(accuracy)
+        counts = frame.groupby(["Sign", "Bucket"])["Count"].sum()
+        sketch._zeros = int(counts.loc[0].sum()) if 0 in counts.index.get_level_values("Sign") else 0
+        for sign in (1, -1):
+            if sign in counts.index.get_level_values("Sign"):
+                sketch._stores[sign] = counts.loc[sign].astype("int64")
+        return sketch
+
+def _log_buckets(magnitudes, gamma):
+    """Sketch bucket of every positive value, the value of bucket k lies within gamma^(k-1) and gamma^k."""
+    return np.ceil(np.log(magnitudes) / np.log(gamma)).astype(np.int64)
+
+def _bucket_values(buckets, gamma):
+    """Representative value of every bucket, within the relative accuracy of the values in it."""
+    return 2 * np.power(gamma, np.asarray(buckets, dtype = float)) / (gamma + 1)
+
+class LightCube:
+    """
+    Compact time-of-day aggregates of raw light data, built once so that light plots can be
+    redrawn without going back to the raw samples. For every Group, day type (Weekday or
+    Weekend/Holiday), light channel and time-of-day bin it holds the count, sum and sum of squares
+    of the on-wrist ACTIVE/REST light samples, along with a quantile sketch (see QuantileSketch). Cubes of
+    separate participants, shards or runs can be combined with `concat`.
+
+
+        Attributes
+        ----------
+        stats: pd.DataFrame
+            One row per Group, DayType, Channel and Time (start of the bin in minutes after midnight),
+            with the 'Count', 'Sum' and 'Sum of squares' of its samples.
+
+        sketch: pd.DataFrame
+            Quantile sketch of every cell of stats, as the 'Count' of samples in each logarithmic
+            'Bucket' of light values. A value in bucket k lies within gamma^(k-1) and gamma^k, where
+            gamma = (1 + accuracy) / (1 - accuracy).
+
+        bin_minutes: int
+            Width of the time-of-day bins in minutes.
+
+        accuracy: float
+            Relative accuracy of the quantiles estimated from the sketch.
+
+
+        Methods
+        -------
+        from_raw(raw_data, bin_minutes=15, channels=None, min_light=1.0, accuracy=0.01)
+            Builds a cube from raw actiwatch data.
+        concat(cubes)
+            Combines cubes built from separate parts of a study.
+        save(path) / load(path)
+            Stores a cube in a directory of parquet files and reads it back.
+        summary(by='Group', channel='White Light', min_count=0)
+            Per time-of-day statistics of a grouping, as used by LightPlot.
+        quantile_sketch(group=None, day_type=None, channel='White Light', time=None)
+            QuantileSketch of a selection of the cube.
+    """
+    KEYS = ["Group", "DayType", "Channel", "Time"]
+
+    def __init__(self, stats, sketch, bin_minutes = 15, accuracy = 0.01):
+        self.stats = stats
+        self.sketch = sketch
+        self.bin_minutes = bin_minutes
+        self.accuracy = accuracy
+
+    @property
+    def gamma(self):
+        return (1 + self.accuracy) / (1 - self.accuracy)
+
+    @classmethod
+    def from_raw(cls, raw_data, bin_minutes = 15, channels = None, min_light = 1.0, accuracy = 0.01,
+                 grouping = "Group", holidays = None):
+        """Builds a cube from raw actiwatch data in a single grouped pass per channel.
+
+        #### Parameters
+
+        raw_data: pd.DataFrame
+
+            Combined raw data, as returned by get_raw_data.
+
+        bin_minutes: int
+
+            Width of the time-of-day bins in minutes. Default = 15.
+
+        channels: list or None
+
+            Light channels to aggregate, raw light columns or derived channels (see DERIVED_CHANNELS).
+            Default = None, which only aggregates White Light.
+
+        min_light: float or None
+
+            Samples at or below this level are left out, as in the light plots. Default = 1.0.
+
+        accuracy: float
+
+            Relative accuracy of the quantile sketches. Default = 0.01 (1%).
+
+        grouping: str
+
+            Column holding the group of every sample. Default = 'Group'.
+
+        holidays: holiday calendar, list of dates or None
+
+            Holidays counted as Weekend/Holiday days (see date_table). Default = None, which uses
+            US federal holidays.
+
+        #### Returns
+
+            A LightCube of the raw data.
+        """
+        if not 0 < accuracy < 1:
+            raise ValueError("accuracy must be between 0 and 1.")
+        channels = ["White Light"] if channels is None else list(channels)
+        cube = cls(None, None, bin_minutes, accuracy)
+        on_wrist = (raw_data["Interval Status"].isin(["ACTIVE", "REST"])
+                    & np.logical_not(raw_data["Off-Wrist Status"])).to_numpy()
+
+        # day type of every calendar date, looked up once per date rather than per sample
+        dates = raw_data.index.normalize()
+        table, rows = _date_rows(dates, holidays)
+        day_type = np.where(table["Weekend/Holiday"].to_numpy()[rows], "Weekend/Holiday", "Weekday")
+        minutes = (raw_data.index - dates) // pd.Timedelta("1 min")
+        time_bin = (np.asarray(minutes) // bin_minutes * bin_minutes).astype(np.int16)
+
+        stats, sketches = [], []
+        for channel in channels:
+            values = np.asarray(_channel_values(raw_data, channel), dtype = float)
+            keep = on_wrist & ~np.isnan(values)
+            if min_light is not None:
+                keep &= values > min_light
+            samples = pd.DataFrame({"Group": raw_data[grouping].to_numpy()[keep], "DayType": day_type[keep],
+                                    "Channel": channel, "Time": time_bin[keep], "Value": values[keep]})
+            samples["Square"] = samples["Value"] ** 2
+            samples["Bucket"] = cube._buckets(samples["Value"].to_numpy())
+            grouped = samples.groupby(cls.KEYS, observed = True, sort = True)
+            stats.append(grouped.agg(Count = ("Value", "size"), Sum = ("Value", "sum"),
+                                     **{"Sum of squares": ("Square", "sum")}).reset_index())
+            sketches.append(samples.groupby(cls.KEYS + ["Bucket"], observed = True, sort = True)
+                            .size().rename("Count").reset_index())
+        cube.stats = cls._compact(pd.concat(stats, ignore_index = True))
+        cube.sketch = cls._compact(pd.concat(sketches, ignore_index = True))
+        return cube
+
+    def _buckets(self, values):
+        """Sketch bucket of every positive value, zero and negative values share the lowest bucket."""
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            buckets = np.where(values > 0, _log_buckets(np.abs(values), self.gamma), np.iinfo(np.int32).min)
+        return buckets.astype(np.int32)
+
+    def _bucket_values(self, buckets):
+        """Representative value of every bucket, within the relative accuracy of its samples."""
+        return np.where(buckets == np.iinfo(np.int32).min, 0.0, _bucket_values(buckets, self.gamma))
+
+    def quantile_sketch(self, group = None, day_type = None, channel = "White Light", time = None):
+        """QuantileSketch of the light samples of the matching cells of the cube, e.g. of a whole
+        group across the day. Arguments left as None match every value."""
+        cells = self.sketch[self.sketch["Channel"] == channel]
+        for column, value in (("Group", group), ("DayType", day_type), ("Time", time)):
+            if value is not None:
+                cells = cells[cells[column] == value]
+        zero = cells["Bucket"] == np.iinfo(np.int32).min
+        frame = pd.DataFrame({"Sign": np.where(zero, 0, 1), "Bucket": np.where(zero, 0, cells["Bucket"]),
+                              "Count": cells["Count"].to_numpy()})
+        return QuantileSketch.from_frame(frame, self.accuracy)
+
+    @staticmethod
+    def _compact(frame):
+        for column in ["Group", "DayType", "Channel"]:
+            frame[column] = frame[column].astype(str).astype("category")
+        return frame
+
+    @classmethod
+    def concat(cls, cubes):
+        """Combines cubes built from separate participants, shards or runs of a study with the same
+        bin width and accuracy into one, by adding up their counts, sums and sketches."""
+        cubes = [cube for cube in cubes if cube is not None]
+        if not cubes:
+            raise ValueError("No cubes to combine.")
+        first = cubes[0]
+        if any((cube.bin_minutes, cube.accuracy) != (first.bin_minutes, first.accuracy) for cube in cubes):
+            raise ValueError("Only cubes with the same bin_minutes and accuracy can be combined.")
+
+        def combine(frames, keys):
+            frame = cls._compact(pd.concat(frames, ignore_index = True))
+            return frame.groupby(keys, observed = True, sort = True).sum().reset_index()
+        return cls(combine([cube.stats for cube in cubes], cls.KEYS),
+                   combine([cube.sketch for cube in cubes], cls.KEYS + ["Bucket"]),
+                   first.bin_minutes, first.accuracy)
+
+    def save(self, path):
+        """Stores the cube in a directory of two parquet files and a small settings file."""
+        os.makedirs(path, exist_ok = True)
+        self.stats.to_parquet(os.path.join(path, "stats.parquet"), engine = "fastparquet", compression = "snappy")
+        self.sketch.to_parquet(os.path.join(path, "sketch.parquet"), engine = "fastparquet", compression = "snappy")
+        with open(os.path.join(path, "cube.json"), "w") as f:
+            json.dump({"bin_minutes": self.bin_minutes, "accuracy": self.accuracy}, f)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a cube stored by `save`."""
+        with open(os.path.join(path, "cube.json")) as f:
+            settings = json.load(f)
+        return cls(pd.read_parquet(os.path.join(path, "stats.parquet"), engine = "fastparquet"),
+                   pd.read_parquet(os.path.join(path, "sketch.parquet"), engine = "fastparquet"),
+                   settings["bin_minutes"], settings["accuracy"])
+
+    def summary(self, by = "Group", channel = "White Light", min_count = 0):
+        """Per time-of-day statistics of the light samples of every value of a grouping.
+
+        #### Parameters
+
+        by: str or list
+
+            'Group', 'DayType', 'GroupDayType' (group and day type combined, e.g. 'base_Weekday')
+            or a list of those columns. Default = 'Group'.
+
+        channel: str
+
+            Light channel to summarize. Default = 'White Light'.
+
+        min_count: int
+
+            Time-of-day bins with this many samples or fewer are left out. Default = 0.
+
+        #### Returns
+
+            A dataframe indexed by the grouping label and time of day (datetime.time), with the
+            'Count', 'Mean', 'SEM', 'Median', 'Q25' and 'Q75' of each bin.
+        """
+        by = ["Group", "DayType"] if by == "GroupDayType" else ([by] if isinstance(by, str) else list(by))
+
+        def labelled(frame):
+            frame = frame[frame["Channel"] == channel]
+            label = frame[by[0]].astype(str)
+            for column in by[1:]:
+                label = label + frame[column].astype(str)
+            return frame.assign(Label = label)
+
+        stats = (labelled(self.stats).groupby(["Label", "Time"], sort = True)
+                 [["Count", "Sum", "Sum of squares"]].sum())
+        stats = stats[stats["Count"] > min_count]
+        n = stats["Count"]
+        summary = pd.DataFrame({"Count": n, "Mean": stats["Sum"] / n}, index = stats.index)
+        variance = (stats["Sum of squares"] - stats["Sum"] ** 2 / n) / (n - 1)
+        summary["SEM"] = np.sqrt(variance.clip(lower = 0)) / np.sqrt(n)
+
+        # quantiles from the merged sketches, the bucket holding the sample at each rank
+        sketch = (labelled(self.sketch).groupby(["Label", "Time", "Bucket"], sort = True)["Count"].sum()
+                  .reset_index())
+        sketch = sketch.merge(stats["Count"].rename("Total").reset_index(), on = ["Label", "Time"])
+        sketch["Seen"] = sketch.groupby(["Label", "Time"], sort = False)["Count"].cumsum()
+        for name, q in [("Median", 0.5), ("Q25", 0.25), ("Q75", 0.75)]:
+            rank = q * (sketch["Total"] - 1)
+            found = sketch[sketch["Seen"] > rank].groupby(["Label", "Time"], sort = False)["Bucket"].first()
+            summary[name] = pd.Series(self._bucket_values(found.to_numpy()), index = found.index)
+
+        times = summary.index.get_level_values("Time")
+        summary.index = pd.MultiIndex.from_arrays(
+            [summary.index.get_level_values("Label"),
+             [datetime.time(minute // 60, minute % 60) for minute in times]], names = ["Label", "Time"])
+        return summary
+
+# %% ../00_processing.ipynb 12
+def _peak_rss():
+    """Peak resident set size of this process in MB, or NaN where it cannot be measured."""
+    try:
+        import resource
+    except ImportError:
+        return np.nan
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def _rows(value):
+    """Number of rows of a dataframe, or of the last dataframe in a tuple, None otherwise."""
+    if isinstance(value, tuple):
+        value = next((item for item in reversed(value) if isinstance(item, pd.DataFrame)), None)
+    return len(value) if isinstance(value, pd.DataFrame) else None
+
+def _timed_call(func, *args, **kwargs):
+    """Calls func, returning its result along with the wall time it took."""
+    start = time.perf_counter()
+    return func(*args, **kwargs), time.perf_counter() - start
+
+class PipelineProfiler:
+    """
+    Collects stage-level instrumentation of a SALA object's pipeline. Once attached through the
+    object's profiler attribute, every call of a pipeline method (get_raw_data, process_data,
+    sun_timings, process_sleep, export, ...) is recorded as a stage. Each finished stage and
+    participant is passed on to the hooks and to the logger, so it can be fed into monitoring.
+
+
+        Attributes
+        ----------
+        hooks: list
+            Callables that are called with the record (a dict) of every finished stage and
+            participant. Records have an 'Event' of either 'stage' or 'participant'.
+
+        logger: logging.Logger
+            Logger that every record is written to at INFO level, with the record attached
+            as the 'sala' attribute of the log record. Default is the "SALA" logger.
+
+        cprofile_dir: str or None
+            If given, every top-level stage is run under cProfile and its stats are dumped
+            to a numbered .prof file in this directory.
+
+        trace_memory: bool
+            Whether to trace memory allocations (through tracemalloc) for the peak memory
+            of each stage. This slows the pipeline down.
+
+        stages: pd.DataFrame
+            One row per finished stage, holding its 'Stage', 'Parent' stage, 'Start' time,
+            'Wall (s)', 'CPU (s)', 'Rows in', 'Rows out', 'Peak RSS (MB)' (the high-water mark
+            of the process by the end of the stage) and 'Peak traced (MB)'.
+
+        participants: pd.DataFrame
+            One row per participant timed by process_data (when sharded by UID) or by
+            process_streaming, holding its 'Stage', 'UID', 'Wall (s)' and 'Rows'.
+
+        Methods
+        -------
+        stage(name, rows_in=None)
+            Context manager recording a stage, yielding its record so 'Rows out' can be set.
+
+        add_participant(stage, uid, seconds, rows=None)
+            Records the wall time of a single participant within a stage.
+
+        slowest_participants(n=10, stage=None)
+            The n participants with the longest wall times.
+
+        reset()
+            Clears all recorded stages and participants.
+    """
+
+    def __init__(self, hooks = None, logger = None, cprofile_dir = None, trace_memory = False):
+        self.hooks = list(hooks) if hooks is not None else []
+        self.logger = logger if logger is not None else logging.getLogger("SALA")
+        self.cprofile_dir = cprofile_dir
+        self.trace_memory = trace_memory
+        self._stack = []
+        self.reset()
+
+    def reset(self):
+        """Clears all recorded stages and participants."""
+        self._stages = []
+        self._participants = []
+        self._dumps = 0
+
+    @property
+    def stages(self):
+        """Getter method for stages."""
+        return pd.DataFrame(self._stages, columns = ["Stage", "Parent", "Start", "Wall (s)", "CPU (s)", "Rows in",
+                                                     "Rows out", "Peak RSS (MB)", "Peak traced (MB)"])
+
+    @property
+    def participants(self):
+        """Getter method for participants."""
+        return pd.DataFrame(self._participants, columns = ["Stage", "UID", "Wall (s)", "Rows"])
+
+    def slowest_participants(self, n = 10, stage = None):
+        """The n participants with the longest wall times, optionally within a single stage."""
+        participants = self.participants
+        if stage is not None:
+            participants = participants[participants["Stage"] == stage]
+        return participants.nlargest(n, "Wall (s)").reset_index(drop = True)
+
+    def add_participant(self, stage, uid, seconds, rows = None):
+        """Records the wall time of a single participant within a stage."""
+        record = {"Stage": stage, "UID": uid, "Wall (s)": seconds, "Rows": rows}
+        self._participants.append(record)
+        self._emit("participant", record)
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in = None):
+        """Context manager recording the wall time, CPU time, rows and peak memory of a stage."""
+        record = {"Stage": name, "Parent": self._stack[-1]["Stage"] if self._stack else None,
+                  "Start": pd.Timestamp.now(), "Rows in": rows_in, "Rows out": None}
+        top = not self._stack
+        tracing = self.trace_memory and top and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        if self.trace_memory and tracemalloc.is_tracing():
+            # an enclosing stage keeps the peak reached before this one started
+            if self._stack:
+                self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        record["_peak"] = 0
+        profile = cProfile.Profile() if self.cprofile_dir is not None and top else None
+        self._stack.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            record["Wall (s)"] = time.perf_counter() - wall
+            record["CPU (s)"] = time.process_time() - cpu
+            record["Peak RSS (MB)"] = _peak_rss()
+            peak = record.pop("_peak")
+            record["Peak traced (MB)"] = None
+            if self.trace_memory and tracemalloc.is_tracing():
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                record["Peak traced (MB)"] = peak / 1024 ** 2
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+            if tracing:
+                tracemalloc.stop()
+            if profile is not None:
+                os.makedirs(self.cprofile_dir, exist_ok = True)
+                self._dumps += 1
+                profile.dump_stats(os.path.join(self.cprofile_dir, "{:03d}_{}.prof".format(self._dumps, name)))
+            self._stages.append(record)
+            self._emit("stage", record)
+
+    def _emit(self, event, record):
+        """Passes a finished record on to the logger and every hook."""
+        record = dict(record, Event = event)
+        if event == "stage":
+            self.logger.info("%s %s: %.3f s wall, %.3f s CPU, %s rows in, %s rows out",
+                             event, record["Stage"], record["Wall (s)"], record["CPU (s)"],
+                             record["Rows in"], record["Rows out"], extra = {"sala": record})
+        else:
+            self.logger.info("%s %s in %s: %.3f s wall", event, record["UID"], record["Stage"],
+                             record["Wall (s)"], extra = {"sala": record})
+        for hook in self.hooks:
+            hook(record)
+
+def _profiled(method):
+    """Records calls of a SALA pipeline method as a stage of the object's profiler, if it has one."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._profiler is None:
+            return method(self, *args, **kwargs)
+        frames = [value for value in list(args) + list(kwargs.values()) if isinstance(value, pd.DataFrame)]
+        rows_in = len(frames[0]) if frames else _rows(self._data)
+        with self._profiler.stage(method.__name__, rows_in) as record:
+            result = method(self, *args, **kwargs)
+            record["Rows out"] = _rows(result)
+        return result
+    return wrapper
+
+# %% ../00_processing.ipynb 13
+# sunrise and sunset by location and day, see _year_tables for why this is not a functools.lru_cache
+_sun_cache = {}
+
+def _sun_times(latitude, longitude, timezone, day):
+    """Sunrise and sunset of a calendar day at a location, memoized so every date is only calculated once."""
+    key = (latitude, longitude, timezone, day)
+    if key not in _sun_cache:
+        city = LocationInfo(timezone = timezone, latitude = latitude, longitude = longitude)
+        _sun_cache[key] = (sun.sunrise(city.observer, day, tzinfo = city.tzinfo),
+                           sun.sunset(city.observer, day, tzinfo = city.tzinfo))
+    return _sun_cache[key]
+
+# date tables by years and holiday calendar; a plain dict rather than functools.lru_cache, which worker
+# processes cannot unpickle when these functions are defined in a notebook
+_year_tables = {}
+
+def _year_table(first_year, last_year, holidays):
+    """Date table of whole calendar years, memoized so that runs over the same years share one table."""
+    key = (first_year, last_year, holidays)
+    if key not in _year_tables:
+        _year_tables[key] = _build_year_table(first_year, last_year, holidays)
+    return _year_tables[key]
+
+def _build_year_table(first_year, last_year, holidays):
+    """Date table of whole calendar years, see _year_table."""
+    dates = pd.date_range(f"{first_year}-01-01", f"{last_year}-12-31", freq = "D", name = "Date")
+    if hasattr(holidays, "holidays"):
+        holidays = (holidays() if isinstance(holidays, type) else holidays).holidays(start = dates[0], end = dates[-1])
+    holiday = dates.isin(pd.DatetimeIndex(holidays))
+    weekend = dates.dayofweek > 4
+    return pd.DataFrame({"DayofWeek": dates.dayofweek, "Weekend": weekend, "Holiday": holiday,
+                         "Weekend/Holiday": weekend | holiday,
+                         "DayType": pd.Categorical.from_codes((weekend | holiday).astype(int),
+                                                              categories = ["Weekday", "Weekend/Holiday"])},
+                        index = dates)
+
+def date_table(start, end, holidays = None):
+    """Date dimension of a study: the day of week, weekend, holiday and day type of every date from
+    start to end. Tables are built for whole calendar years and memoized per holiday calendar, so the
+    day types of timing data, light cubes and plots are looked up once per unique date from the same
+    table, rather than calculated row by row.
+
+    #### Parameters
+
+    start, end: str or datetime-like
+
+        First and last date of the study.
+
+    holidays: holiday calendar, list of dates or None
+
+        A pandas holiday calendar (class or instance, e.g. one of the AbstractHolidayCalendar
+        subclasses of another country) or any object with a holidays(start, end) method, or a list of
+        dates that count as holidays (e.g. the breaks of an academic term). Default = None, which uses
+        US federal holidays.
+
+    #### Returns
+
+        A dataframe indexed by Date with 'DayofWeek' (0 = Monday), 'Weekend', 'Holiday',
+        'Weekend/Holiday' and 'DayType' ('Weekday' or 'Weekend/Holiday') columns.
+    """
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    return _year_table(start.year, end.year, _holiday_key(holidays)).loc[start:end].copy()
+
+def _holiday_key(holidays):
+    """hashable form of a holiday calendar, with lists of dates turned into a sorted tuple"""
+    if holidays is None:
+        return calendar
+    if hasattr(holidays, "holidays"):
+        return holidays
+    return tuple(sorted(pd.DatetimeIndex(pd.to_datetime(list(holidays))).normalize()))
+
+def _date_rows(dates, holidays = None):
+    """(table, rows) of the date table rows of every date, found once per unique date"""
+    codes, unique = pd.factorize(dates)
+    unique = pd.DatetimeIndex(pd.to_datetime(unique)).normalize()
+    table = _year_table(unique.min().year, unique.max().year, _holiday_key(holidays))
+    return table, table.index.get_indexer(unique)[codes]
+
+def _group_labels(codes, groups, labels, which):
+    """Categorical of every row's group combined with one of labels (e.g. 'base_Mon'), built from the
+    group codes and label positions instead of concatenating strings row by row. Every group gets all
+    of its labels as categories, whether or not they occur, so subsets of the rows share them."""
+    categories = [f"{group}{label}" for group in groups for label in labels]
+    codes = np.where(codes < 0, -1, codes * len(labels) + which)
+    return pd.Categorical.from_codes(codes, categories = categories)
+
+def _add_day_types(timing_data, holidays = None):
+    """Adds the day of week, GroupDayofWeek, GroupDayType and Weekend/Holiday columns to timing data,
+    which only depend on the group and date of every row and are looked up in the date table (see
+    date_table) once per unique date. The combined labels are categoricals."""
+    table, rows = _date_rows(timing_data["Date"], holidays)
+    # retrieve day number (e.g. 0) from the date table
+    dayofweek = table["DayofWeek"].to_numpy()[rows]
+    weekend = table["Weekend/Holiday"].to_numpy()[rows]
+    timing_data["DayofWeek"] = dayofweek
+    days = ["Mon", "Tues", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+    # results should be a combination of Group identifier and the day of the week (e.g. Mon)
+    # or day type (e.g. Weekday)
+    codes, groups = pd.factorize(timing_data["Group"])
+    timing_data["GroupDayofWeek"] = _group_labels(codes, groups, days, dayofweek)
+    timing_data["GroupDayType"] = _group_labels(codes, groups, ["Weekday", "Weekend/Holiday"], weekend.astype(int))
+    timing_data["Weekend/Holiday"] = weekend
+    return timing_data
+
+# columns of timing data that differ between the thresholds of a person-day, the others are shared by all of its rows
+THRESHOLD_COLUMNS = ("Last Light", "Mins to LL from 4AM", "First Light", "Mins to FL from 4AM",
+                     "Time above threshold", "Minutes above threshold")
+
+def wide_timing(timing_data):
+    """Turns timing data from its long layout, with one row per person-day and threshold, into a wide
+    layout with one row per person-day (and channel). Every column that depends on the threshold (see
+    THRESHOLD_COLUMNS) is split into one column per threshold, suffixed with it (e.g. 'First Light 50'),
+    in place of the original column. Columns shared by the thresholds of a day are only kept once, so the
+    wide layout is several times smaller. The columns are filled from preallocated arrays in one pass.
+
+    #### Parameters
+
+    timing_data: pd.DataFrame
+
+        Timing data in the long layout, as returned by process_data or do_everything.
+
+    #### Returns
+
+        Timing data in the wide layout, with person-days in order of appearance. Use `long_timing`
+        to turn it back.
+    """
+    keys = [column for column in ("UID", "Date", "Channel") if column in timing_data.columns]
+    day = timing_data.groupby(keys, sort = False, observed = True).ngroup().to_numpy()
+    thresholds, threshold = np.unique(timing_data["Threshold"].to_numpy(), return_inverse = True)
+    first = np.unique(day, return_index = True)[1]
+
+    columns = {}
+    for column in timing_data.columns.drop("Threshold"):
+        values = timing_data[column]
+        if not column.startswith(THRESHOLD_COLUMNS):
+            columns[column] = values.iloc[first].reset_index(drop = True)
+            continue
+        values = values.to_numpy(dtype = float, na_value = np.nan) if values.dtype == "Int64" else values.to_numpy()
+        if values.dtype.kind in "iub":
+            values = values.astype(float)
+        missing = np.array("NaT", dtype = values.dtype) if values.dtype.kind in "Mm" else (
+            np.nan if values.dtype.kind == "f" else None)
+        block = np.full((len(first), len(thresholds)), missing, dtype = values.dtype)
+        block[day, threshold] = values
+        for i, value in enumerate(thresholds):
+            columns[f"{column} {value}"] = block[:, i]
+    return pd.DataFrame(columns)
+
+def _threshold_of(column):
+    """(name, threshold) of a threshold column of wide timing data, or None for shared columns."""
+    name, _, value = column.rpartition(" ")
+    if not name.startswith(THRESHOLD_COLUMNS):
+        return None
+    try:
+        return name, int(value)
+    except ValueError:
+        try:
+            return name, float(value)
+        except ValueError:
+            return None
+
+def long_timing(wide):
+    """Turns timing data from the wide layout of `wide_timing` back into the long layout, with one
+    row per person-day and threshold and the thresholds of every person-day in ascending order."""
+    split = {column: _threshold_of(column) for column in wide.columns}
+    thresholds = list(dict.fromkeys(found[1] for found in split.values() if found is not None))
+    rows = np.repeat(np.arange(len(wide)), len(thresholds))
+    keys = [column for column in ("UID", "Date", "Channel") if column in wide.columns]
+
+    columns = {}
+    for column, found in split.items():
+        if found is None:
+            columns[column] = wide[column].iloc[rows].reset_index(drop = True)
+            if column == keys[-1]:
+                columns["Threshold"] = np.tile(thresholds, len(wide))
+        elif found[0] not in columns:
+            columns[found[0]] = np.column_stack([wide[f"{found[0]} {value}"].to_numpy()
+                                                 for value in thresholds]).ravel()
+    return pd.DataFrame(columns)
+
+def _shard_of(uid, num_shards):
+    """Shard of a participant, stable across processes and machines unlike the builtin hash."""
+    return int(hashlib.md5(str(uid).encode()).hexdigest()[:8], 16) % num_shards
+
+def _shard_path(outfile, shard, num_shards):
+    """Output directory of a shard within outfile."""
+    return os.path.join(outfile, "shards", f"shard-{shard:04d}-of-{num_shards:04d}")
 
-# %% ../00_processing.ipynb 6
 class SALAFrame:
     """
     DataFrame-like storage for actiwatch data loaded either from a directory of csv files
@@ -270,9 +1618,9 @@ class SALAFrame:
             files to be read as data.
 
         timezone: str
-            Single timezone specified for all data within the object. A list of
-            valid timezones can be obtained from pytz.all_timezones. Note that it is impossible
-            for different timezones to be present (all data must be converted to a single timezone)
+            Default timezone for the data within the object. A list of
+            valid timezones can be obtained from pytz.all_timezones. Participants from other
+            timezones can be given their own location through the sites table.
 
         latitude: float
             Latitude position for sunrise/sunset calculations. Northern latitudes should be entered as positive
@@ -282,6 +1630,23 @@ class SALAFrame:
             Longitude position for sunrise/sunset calculations. Eastern longitudes should be entered as positive,
             while western latitudes should be entered as negatives.
 
+        sites: pd.DataFrame or None
+            Optional table of per-site locations for multi-site studies. It is indexed by Group or UID
+            values (the index name selects which) and has 'Latitude', 'Longitude' and 'Timezone'
+            columns. Groups/UIDs missing from the table use the default location above.
+
+        profiler: PipelineProfiler or None
+            Optional profiler recording the wall time, CPU time, rows and memory of every
+            pipeline stage that is run on the object.
+
+        holidays: holiday calendar, list of dates or None
+            Holidays counted as Weekend/Holiday days in timing data and light cubes (see date_table).
+            None uses US federal holidays.
+
+        quality: pd.DataFrame or None
+            Data-quality and wear-time index of every person-day of the raw data last loaded
+            with get_raw_data (see person_day_quality), used to skip invalid person-days.
+
         Methods
         -------
         init(data=None, directory=None, timezone=None, latitude=None, longitude=None)
@@ -303,6 +1668,13 @@ class SALAFrame:
             Handles unprocessed combined raw data outputting first and last light times,
             and group identifiers for all specified light thresholds.
 
+        light_cube(raw_data, outfile=None)
+            Builds the time-of-day light aggregates of raw data used by LightPlot.
+
+        sun_table()
+            Calculates sunrise and sunset once for every site and date present in the
+            stored SALA data.
+
         sun_timings()
             Calculates sunset and sunrise timing information for currently stored SALA
             data, based on the timezone info within the stored data.
@@ -311,13 +1683,26 @@ class SALAFrame:
             Processes sleep data for existing timing data, generating a summary dataframe
             based on the number of sleep periods within the data.
 
+        process_incremental(raw_data, thresholds, outfile)
+            Processes only new or changed person-days and merges them with previously
+            exported timing data.
+
+        process_streaming(outfile, thresholds)
+            Runs the full pipeline one participant at a time, writing each participant's
+            timing data to a partitioned dataset before loading the next.
+
+        process_shard(outfile, thresholds, shard, num_shards)
+            Runs process_streaming for only the participants of one shard, so a study can be
+            split across machines and combined afterwards with merge_shards.
+
         do_everything()
             Complete all-in-one SALA function that handles processing raw data, adding sunrise/sunset
             information, and sleep information.
 
     """
 
-    def __init__(self, latitude, longitude, timezone, data=None, directory = None):
+    def __init__(self, latitude, longitude, timezone, data=None, directory = None, sites = None, profiler = None,
+                 holidays = None):
         """
         Initializes a SALA object either from existing parsed timing data, or from a directory
         of csvs. Timezone information can be optionally included to allow for sunset, sunrise
@@ -343,12 +1728,38 @@ class SALAFrame:
             directory: dictionary (optional)
                 Dictionary of valid folder names to load actiwatch data from.
                 Folders should have .csv files in them.
+
+            sites: pd.DataFrame (optional)
+                Per-site locations, indexed by Group or UID values with 'Latitude', 'Longitude'
+                and 'Timezone' columns. Groups/UIDs that are not listed use the location above.
+
+            profiler: PipelineProfiler (optional)
+                Records the wall time, CPU time, rows and memory of every pipeline stage.
+
+            holidays: holiday calendar or list of dates (optional)
+                Holidays counted as Weekend/Holiday days, e.g. a pandas holiday calendar of another
+                country or the breaks of an academic term (see date_table). By default US federal
+                holidays are used.
         """
         self._data = data
         self._directory = directory
         self._timezone = timezone
         self._latitude = latitude
         self._longitude = longitude
+        self._sites = None
+        if sites is not None:
+            self.sites = sites
+        self._profiler = None
+        if profiler is not None:
+            self.profiler = profiler
+        self._quality = None
+        self._holidays = holidays
+
+    def __getstate__(self):
+        # copies sent to worker processes do not record into the profiler of this object
+        state = self.__dict__.copy()
+        state["_profiler"] = None
+        return state
 
     @property
     def data(self):
@@ -410,7 +1821,52 @@ class SALAFrame:
             raise TypeError("Error: longitude must be a numeric")
         self._longitude = value
 
-    def get_raw_data_from_key(self, key, directory = None, grouping = 'Group'):
+    @property
+    def sites(self):
+        """Getter method for sites."""
+        return self._sites
+
+    @sites.setter
+    def sites(self, value):
+        """Setter method for sites."""
+        if type(value) != pd.DataFrame:
+            raise TypeError("Error: sites must be of type pd.DataFrame")
+        if value.index.name not in ("Group", "UID"):
+            raise ValueError("Error: sites must be indexed by 'Group' or 'UID'")
+        if not {"Latitude", "Longitude", "Timezone"}.issubset(value.columns):
+            raise ValueError("Error: sites must have 'Latitude', 'Longitude' and 'Timezone' columns")
+        self._sites = value
+
+    @property
+    def holidays(self):
+        """Getter method for holidays."""
+        return self._holidays
+
+    @holidays.setter
+    def holidays(self, value):
+        """Setter method for holidays."""
+        self._holidays = value
+
+    @property
+    def quality(self):
+        """Getter method for the person-day quality index of the raw data."""
+        return self._quality
+
+    @property
+    def profiler(self):
+        """Getter method for profiler."""
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, value):
+        """Setter method for profiler."""
+        if value is not None and not isinstance(value, PipelineProfiler):
+            raise TypeError("Error: profiler must be a PipelineProfiler or None")
+        self._profiler = value
+
+    @_profiled
+    def get_raw_data_from_key(self, key, directory = None, grouping = 'Group', n_jobs = 1, progress = None,
+                              cache = None):
         """Loads and combines raw actiwatch data from any csv files found in
            the specified directory matching a particular key within the directory.
 
@@ -432,6 +1888,19 @@ class SALAFrame:
                 Name of the generated column for specifying groupings, where
                 the values will be the name of the key given. Default = 'Group'.
 
+            n_jobs: int
+
+                Number of threads used to parse the csv files of the key concurrently. Default = 1.
+
+            progress: callable or None
+
+                Called as progress(done, total, filename) each time a csv file has been parsed.
+
+            cache: str, ParsedFileCache or None
+
+                Directory (or ParsedFileCache) used to cache parsed csv files between calls, so only
+                new or changed files are parsed. Default = None, which parses every file.
+
             #### Returns
 
             All of the raw unprocessed data within the directory matching a specified key.
@@ -441,11 +1910,15 @@ class SALAFrame:
             raise ValueError("Error: a valid source of data must be provided.")
         if directory is not None:
             self._directory = directory
-        raw_data = load_actiwatch_data(self.directory[key], uidprefix = key)[0]
+        raw_data = load_actiwatch_data(self.directory[key], uidprefix = key,
+                                       n_jobs = n_jobs, progress = progress, cache = cache)[0]
         raw_data[grouping] = key
+        raw_data[grouping] = raw_data[grouping].astype("category")
         return raw_data
 
-    def get_raw_data(self, outfile, directory = None, grouping = 'Group', export = True):
+    @_profiled
+    def get_raw_data(self, outfile, directory = None, grouping = 'Group', export = True,
+                     n_jobs = None, progress = None, cache = None, partitioned = False):
         """Loads and combines raw actiwatch data from any csv files found in
            the specified directory for all keys within the directory.
 
@@ -472,29 +1945,66 @@ class SALAFrame:
                 Whether or not to export combined raw data to a parquet file saved in the designated
                 outfile location.
 
+            n_jobs: int or None
+
+                Number of threads used to parse csv files. Default = None, which loads every key
+                in its own process instead. When set, keys are loaded one after another with their
+                files spread over n_jobs threads.
+
+            progress: callable or None
+
+                Called as progress(done, total, filename) each time a csv file has been parsed.
+                Only used when n_jobs is set.
+
+            cache: str, ParsedFileCache or None
+
+                Directory (or ParsedFileCache) used to cache parsed csv files between calls, so only
+                new or changed files are parsed. Default = None, which parses every file.
+
+            partitioned: bool
+
+                Whether to export a dataset partitioned by group, UID and month (outfile/raw/,
+                see `write_dataset`) instead of a single raw.parquet file. Default = False.
+
             #### Returns
 
             All of the raw unprocessed data within the directory for all keys as a single
-            dataframe.
+            dataframe. The quality index of its person-days is kept in `quality` and exported
+            to quality.parquet along with the raw data.
 
     """
         if directory is None and self._directory is None:
             raise ValueError("Error: a valid source of data must be provided.")
         if directory is not None:
             self._directory = directory
-        raw_results = (
-            Parallel(n_jobs=len(self._directory))(delayed(self.get_raw_data_from_key)(key, self._directory) for key in self._directory.keys())
-                   )
+        if n_jobs is None:
+            raw_results = (
+                Parallel(n_jobs=len(self._directory))(delayed(self.get_raw_data_from_key)(key, self._directory, cache = cache) for key in self._directory.keys())
+                       )
+        else:
+            raw_results = [self.get_raw_data_from_key(key, self._directory, grouping, n_jobs, progress, cache)
+                           for key in self._directory.keys()]
+        # categories differ between keys, so recompact after combining them
+        all_data = compact_raw_data(pd.concat(raw_results))
+        if grouping in all_data.columns:
+            all_data[grouping] = all_data[grouping].astype("category")
+        self._quality = person_day_quality(all_data)
+
         # save data to parquet file
-        all_data = pd.concat(raw_results)
 
-        if export:
+        if export and partitioned:
+            write_dataset(all_data, outfile + "raw", partition_on = (grouping, "UID"))
+        elif export:
             all_data.to_parquet(outfile + "raw.parquet", engine = 'fastparquet',
                                    compression = "gzip")
+        if export:
+            self._quality.to_parquet(outfile + "quality.parquet", engine = 'fastparquet',
+                                     compression = "gzip")
 
         return all_data
 
-    def export(self, outfile, data=None):
+    @_profiled
+    def export(self, outfile, data=None, partitioned=False, layout="long"):
         """
         Exports existing timing data to a parquet format.
 
@@ -505,21 +2015,47 @@ class SALAFrame:
             data: pd.DataFrame
 
             Desired dataframe for exporting.
+            partitioned: bool
+
+                Whether to export a dataset partitioned by group, UID and month (outfile/timing/,
+                see `write_dataset`) instead of a single timing.parquet file. Default = False.
+            layout: str
+
+                'long', with one row per person-day and threshold, or 'wide', with one row per
+                person-day and a column per threshold (see `wide_timing`). Default = 'long'.
         """
+        if layout not in ("long", "wide"):
+            raise ValueError(f"layout must be 'long' or 'wide', got {layout!r}.")
 
         if self.data is None and data is None:
             raise Exception("Error: no timing data available to export.")
         if data is None:
             data = self.data
         # putting date information in a parquet valid format
-        data["Date"] = data["Date"].astype("datetime64[s]")
-        data.to_parquet(f"{outfile}timing.parquet",
+        data["Date"] = pd.to_datetime(data["Date"]).astype("datetime64[ns]")
+        for column in ("Sunrise", "Sunset"):
+            if column in data.columns and data[column].dtype == object:
+                # times from sites in several timezones cannot share a column type, store them in UTC
+                data[column] = pd.to_datetime(data[column], utc = True)
+        if layout == "wide":
+            data = wide_timing(data)
+        if partitioned:
+            write_dataset(data, f"{outfile}timing", time_column = "Date")
+        else:
+            data.to_parquet(f"{outfile}timing.parquet",
                                engine = "fastparquet", compression="gzip")
 
 
+    @_profiled
     def process_data(self,
                      raw_data,
-                     thresholds):
+                     thresholds,
+                     shard_by = None,
+                     n_jobs = None,
+                     channels = None,
+                     windows = None,
+                     day_start = "04:00",
+                     wear_rules = None):
         """Handles unprocessed combined raw data outputting first and last light times,
             and group identifiers for all specified light thresholds.
 
@@ -534,67 +2070,194 @@ class SALAFrame:
 
             List of light thresholds for the watch data.
 
+        shard_by: str, list or None
+
+            Column(s) to split raw_data by before processing, e.g. 'UID' or ['Group', 'UID'].
+            Each worker then receives only the rows of its own participants and computes all
+            thresholds for them. Default = None, which runs one worker per threshold over the
+            full raw data.
+
+        n_jobs: int or None
+
+            Number of worker processes. Default = None, which uses one worker per threshold,
+            or every available core (-1) when shard_by is given.
+
+        channels: list or None
+
+            Light channels to process, e.g. ['White Light', 'Blue Light', 'Melanopic EDI'], either
+            raw light columns or derived channels (see DERIVED_CHANNELS). All channels are computed
+            in the same pass over the raw data and the result gets a 'Channel' column, with one row
+            per person-day, channel and threshold. Default = None, which only processes White Light.
+
+        windows: dict or None
+
+            Named windows of the day to report separately, as {name: (start, end)} clock times,
+            e.g. {'Morning': ('06:00', '10:00'), 'Evening': ('18:00', '22:00')}. Every window gets its
+            own time above threshold, lux minutes and first and last light columns, suffixed with its
+            name, and all windows are evaluated in the same pass as the full day. Default = None, which
+            only reports the time above threshold and lux minutes of an 'AM' window until 12:00.
+
+        day_start: str
+
+            Clock time at which person-days start. Default = "04:00", which is 4:00AM.
+
+        wear_rules: dict or None
+
+            Wear-time rules of a valid person-day (see apply_wear_rules and WEAR_RULES), e.g.
+            {'min_wear_minutes': 720}, or {} for the default rules. The raw rows of person-days failing
+            them are left out before any light processing, and the person-days are left out of the
+            result. The quality index from get_raw_data is used where available. Default = None,
+            which processes every person-day.
+
         #### Returns
 
             Processed timing data in a dataframe format, with specific identifier columns based
-            on weekday and weekend/holiday groupings.
+            on weekday and weekend/holiday groupings. Participants without any on-wrist ACTIVE or
+            REST data are skipped.
         """
-        timing_results = (Parallel(n_jobs=len(thresholds))
-        (delayed(firstAndLastLight)(raw_data, threshold) for threshold in thresholds)
-                         )
-        timing_data = pd.concat(timing_results)
-
-        # loading federal holidays to classify dates as weekend/holiday
-        cal = calendar()
-        holidays = (
-        cal.holidays(start = timing_data.Date.min(), end = timing_data.Date.max())
-    )
-        # retrieve day number (e.g. 0) from date index
-        timing_data["DayofWeek"] = pd.DatetimeIndex(timing_data["Date"]).dayofweek
-        days = ["Mon", "Tues", "Wed", "Thu", "Fri", "Sat", "Sun"]
-        day_type = ["Weekday","Weekday","Weekday",
-                "Weekday","Weekday","Weekend/Holiday","Weekend/Holiday"]
-
-        # result should be a combination of Group identifier and the day of the week (e.g. Mon)
-        timing_data["GroupDayofWeek"] = (timing_data["Group"] + np.array(days)[timing_data["DayofWeek"]])
-
-        is_holiday = pd.to_datetime(timing_data["Date"]).isin(holidays)
-        weekends = (timing_data["Group"] + "Weekend/Holiday")
-
-         # result should be a combination of Group identifier and day type (e.g. Weekday)
-        day_types = (timing_data["Group"] + np.array(day_type)[timing_data["DayofWeek"]])
-
-        timing_data["GroupDayType"] = day_types.where(~is_holiday).combine_first(weekends.where(is_holiday))
-        timing_data["Weekend/Holiday"] = ((timing_data["DayofWeek"] > 4) | is_holiday)
+        if wear_rules is not None:
+            quality = self._quality
+            if quality is None or _clock_offset(day_start) != DAY_START:
+                quality = person_day_quality(raw_data, day_start)
+            valid = apply_wear_rules(quality, wear_rules)
+            valid = valid[valid["Valid"]]
+            raw_data = raw_data[_valid_day_rows(raw_data, valid, day_start)]
+            if raw_data.empty:
+                raise ValueError("No person-days pass the wear rules.")
+        # participants that never wore their watch (e.g. entirely off-wrist) have no light timing
+        on_wrist = raw_data["Interval Status"].isin(["ACTIVE", "REST"]) & np.logical_not(raw_data["Off-Wrist Status"])
+        worn = set(raw_data.loc[on_wrist, "UID"])
+        for UID in pd.unique(raw_data["UID"].to_numpy()):
+            if UID not in worn:
+                print(f"Skipping {UID}: no on-wrist ACTIVE or REST data.")
+        if not worn:
+            raise ValueError("Error: no participant has any on-wrist ACTIVE or REST data.")
+        raw_data = raw_data[raw_data["UID"].isin(worn)]
+        if shard_by is None:
+            timing_results = (Parallel(n_jobs=len(thresholds) if n_jobs is None else n_jobs)
+            (delayed(firstAndLastLight)(raw_data, threshold, channels = channels, windows = windows, day_start = day_start)
+             for threshold in thresholds)
+                             )
+        else:
+            all_thresholds = _flatten_thresholds(thresholds)
+            shards = raw_data.groupby(shard_by, sort = False, observed = True)
+            timed_results = (Parallel(n_jobs=-1 if n_jobs is None else n_jobs)
+            (delayed(_timed_call)(firstAndLastLight, shard, all_thresholds, channels = channels, windows = windows,
+                                  day_start = day_start)
+             for _, shard in shards)
+                             )
+            timing_results = [result for result, _ in timed_results]
+            keys = [shard_by] if isinstance(shard_by, str) else list(shard_by)
+            if self._profiler is not None and "UID" in keys:
+                for (key, shard), (_, seconds) in zip(shards, timed_results):
+                    uid = key if isinstance(shard_by, str) else key[keys.index("UID")]
+                    self._profiler.add_participant("process_data", uid, seconds, len(shard))
+        timing_data = pd.concat(timing_results, ignore_index = True)
+        if wear_rules is not None:
+            # calendar dates of the kept rows that are not valid person-days themselves
+            days = pd.MultiIndex.from_arrays([valid["UID"].astype(str), valid["Date"]])
+            timing_data = timing_data[pd.MultiIndex.from_arrays([timing_data["UID"].astype(str),
+                                                                 pd.to_datetime(timing_data["Date"])]).isin(days)]
+            timing_data = timing_data.reset_index(drop = True)
+
+        timing_data = _add_day_types(timing_data, self._holidays)
 
         self._data = timing_data
         timing_data["Watch period"] = pd.to_timedelta(timing_data["Watch period"])
 
         return timing_data
 
+    @_profiled
+    def light_cube(self, raw_data, outfile = None, bin_minutes = 15, channels = None, grouping = "Group"):
+        """Builds the time-of-day light aggregates of raw data used by LightPlot (see `LightCube`).
+
+        #### Parameters
+
+        raw_data: pd.DataFrame
+
+            Combined raw data, as returned by get_raw_data.
+
+        outfile: str or None
+
+            Directory to save the cube to (e.g. ../SALA/example_output/light_cube). Default = None,
+            which does not save it.
+
+        bin_minutes: int
+
+            Width of the time-of-day bins in minutes. Default = 15.
+
+        channels: list or None
+
+            Light channels to aggregate. Default = None, which only aggregates White Light.
+
+        grouping: str
+
+            Column holding the group of every sample. Default = 'Group'.
+
+        #### Returns
+
+            The LightCube of the raw data.
+        """
+        cube = LightCube.from_raw(raw_data, bin_minutes = bin_minutes, channels = channels, grouping = grouping,
+                                  holidays = self._holidays)
+        if outfile is not None:
+            cube.save(outfile)
+        return cube
+
+    def sun_table(self):
+        """Calculates sunrise and sunset once for every site and date present in the data of the
+        SALA object. A row's site is looked up by its Group or UID in the sites table, falling back
+        to the object's own latitude, longitude and timezone.
+
+        #### Returns
+
+            Lookup table with one row per site and date, holding the 'Latitude', 'Longitude',
+            'Timezone', 'Date', 'Sunrise' and 'Sunset' of each, with timezone aware times.
+        """
+        return self._sun_table()[1]
+
+    def _sun_table(self):
+        """The site x date lookup table along with the position of each data row within it."""
+        locations = pd.DataFrame({"Latitude": self._latitude, "Longitude": self._longitude,
+                                  "Timezone": self._timezone}, index = self._data.index)
+        if self._sites is not None:
+            site = self._data[self._sites.index.name]
+            for column in locations.columns:
+                locations[column] = site.map(self._sites[column]).where(site.isin(self._sites.index),
+                                                                         locations[column])
+        if locations.isna().any(axis = None):
+            raise ValueError("Error: Missing timezone, latitude, or longitude info.")
+
+        codes, table = pd.factorize(pd.MultiIndex.from_arrays(
+            [locations["Latitude"], locations["Longitude"], locations["Timezone"], self._data["Date"]]))
+        table = table.to_frame(index = False, name = ["Latitude", "Longitude", "Timezone", "Date"])
+        times = [_sun_times(*site_date) for site_date in table.itertuples(index = False)]
+        table["Sunrise"] = [sunrise for sunrise, _ in times]
+        table["Sunset"] = [sunset for _, sunset in times]
+        return codes, table
+
+    @_profiled
     def sun_timings(self):
         """Calculates sunrise and sunset timing information for data present in the
-        SALA object.
+        SALA object. With a sites table spanning several timezones, the times of every row
+        stay aware of their own site's timezone.
 
         #### Returns
 
             Modified timing data with sunrise and sunset calculations
         """
 
-        if self._latitude is None or self._longitude is None:
-            raise ValueError("Error: Missing timezone, latitude, or longitude info.")
-        # add location info for calculating astral data
-        city = LocationInfo(timezone = self._timezone, latitude = self._latitude, longitude = self._longitude)
-        self._data["Sunrise"] = self._data["Date"].apply( lambda x: sun.sunrise(city.observer,
-                                                                           x,
-                                                                           tzinfo = city.tzinfo))
-        self._data["Sunset"] = self._data["Date"].apply( lambda x: sun.sunset(city.observer,
-                                                                         x,
-                                                                         tzinfo = city.tzinfo))
+        # calculate astral data once per site and date and map it back onto every row
+        codes, table = self._sun_table()
+        self._data["Sunrise"] = table["Sunrise"].take(codes).set_axis(self._data.index)
+        self._data["Sunset"] = table["Sunset"].take(codes).set_axis(self._data.index)
         return self._data
 
+    @_profiled
     def process_sleep(self, raw_data, sleep_split = "18:00", num_sleeps = 3):
-        """Processes sleep data for existing timing data.
+        """Processes sleep data for existing timing data. REST-S samples are split into sleep periods
+        at gaps of more than an hour, once for every participant and sleep day, and the longest
+        period of each sleep day is joined onto its timing rows.
 
         #### Parameters
 
@@ -624,106 +2287,400 @@ class SALAFrame:
                 Modified timing data with included sleep information
 
         """
-        sleepers = []
-        sleep_onsets = []
-        sleep_offsets = []
-        sleep_durations = []
-        sleep_onsetMSLMs = []
-        sleep_offsetMSLMs = []
+        unique_days, periods = self._join_sleep(raw_data, sleep_split)
+        timing_data = self._data
+        # adding days with at least num_sleeps sleep periods to short_frame
+        counts = periods.groupby(["UID", "Date"])["Sleep onset"].transform("size")
+        short_frame = (unique_days.merge(periods[counts >= num_sleeps], on = ["UID", "Date"])
+                       .rename(columns = {"Date": "DT"}).set_index(["UID", "DT"]))
+        if short_frame.empty:
+            print("Error: Could not concatenate multiple sleep instance data.")
+            return timing_data
 
+        return short_frame, timing_data
+
+    def _join_sleep(self, raw_data, sleep_split):
+        """Joins the main sleep of every sleep day onto the timing data, returning the unique
+        (UID, Date) days along with all of their sleep periods."""
         timing_data = self._data
-        for arow in timing_data.itertuples():
-            UID = arow.UID
-            DT = pd.to_datetime(arow.Date)
-            TM = pd.to_datetime(DT + pd.Timedelta("1 day"))
-            today = DT.strftime("%Y-%m-%d")
-
-            nextday = TM.strftime("%Y-%m-%d")
-
-            # taking raw timing data entry and splitting a "sleep day" at 6pm
-            # under the assumption that people do not end their days that early
-            day_split = raw_data.query("UID == @UID").loc[today +" " + sleep_split:nextday + " 18:00"]
-
-            # REST-S = watch thinks user is asleep
-            asleep = day_split[ day_split["Interval Status"] == "REST-S"].copy()
-
-            # there may be more than one sleep period in a given day's data
-            # new sleep period = when there is more than 1 hour between successive REST-S entries
-            sleep_periods = []
-            per = 0
-            count = 0
-
-            try:
-                lt = asleep.index[0]
-                for time in asleep.index:
-                    # allow up to 1 hour of being awake in the middle of the night
-                    if (time - lt > pd.Timedelta("1 hour")):
-                        per += 1
-                    lt = time
-                    sleep_periods.append(per)
-                asleep["Sleep period"] = sleep_periods
-            except IndexError:
-                asleep["Sleep period"] = [pd.to_datetime(0)]
-
-            try:
-            # calc sleep onsets/offsets/duration for each period of sleep in a person-day of data
-                sleeps = asleep.reset_index().groupby("Sleep period").apply( lambda x: pd.DataFrame({
-                         "Sleep onset": [x.DateTime.min()],
-                         "Sleep offset": [x.DateTime.max()],
-                         "Sleep duration": [x.DateTime.max() - x.DateTime.min()]
-                         }, index = x.DateTime.dt.normalize() ))
-            # if the value is = 0 -> np.int64 (not a DateTime)
-            except AttributeError:
-                sleeps = asleep.reset_index().groupby("Sleep period").apply( lambda x: pd.DataFrame({
-                 "Sleep onset": [pd.to_datetime(DT)],
-                 "Sleep offset": [pd.to_datetime(DT)],
-                 "Sleep duration": [pd.to_timedelta(x.DateTime.max() - x.DateTime.min())]
-                 }))
-            sleeps = sleeps.drop_duplicates().sort_values(by="Sleep duration", ascending = False)
-            onset = sleeps.iloc[0]['Sleep onset']
-            offset = sleeps.iloc[0]['Sleep offset']
-            dur =  sleeps.iloc[0]['Sleep duration']
-
-            # if onset is actually a datetime
-            if not isinstance(onset, np.int64):
-                onMSLM = (onset - DT).total_seconds() / 60.0
-
-            # if offset is actually a datetime
-            if not isinstance(offset, np.int64):
-                offMSLM = np.maximum((offset - TM).total_seconds() / 60.0, 0.0)
-
-            sleep_onsets.append(onset)
-            sleep_offsets.append(offset)
-            sleep_durations.append(dur)
-            sleep_onsetMSLMs.append(onMSLM)
-            sleep_offsetMSLMs.append(offMSLM)
-            sleep_count = sleeps.shape[0]
-
-            # adding to short_frame
-            if sleep_count >= num_sleeps:
-                sleeps['UID'] = UID
-                sleeps['DT'] = DT
-                sleeps.reset_index(drop = True).set_index(['UID','DT'])
-                sleepers.append(sleeps)
-        timing_data["Sleep onset"] = sleep_onsets
-        timing_data["Sleep offset"] = sleep_offsets
-        timing_data["Sleep duration"] = sleep_durations
-        timing_data["Sleep onset MSLM"] = sleep_onsetMSLMs
-        timing_data["Sleep offset MSLM"] = sleep_offsetMSLMs
+        # each sleep day is only segmented once, however many threshold rows share it
+        days = pd.DataFrame({"UID": timing_data["UID"].to_numpy(), "Date": pd.to_datetime(timing_data["Date"]).to_numpy()})
+        unique_days = days.drop_duplicates()
+        periods = _sleep_periods(raw_data, unique_days, sleep_split)
+        periods = periods.sort_values(["UID", "Date", "Sleep duration", "Sleep onset"],
+                                      ascending = [True, True, False, True], kind = "stable")
+        # the longest sleep period of a day is its main sleep
+        sleeps = days.merge(periods.drop_duplicates(["UID", "Date"]).drop(columns = "Sleep period"),
+                            on = ["UID", "Date"], how = "left")
+
+        # days without any REST-S get an empty sleep at midnight
+        DT = sleeps["Date"]
+        TM = DT + pd.Timedelta("1 day")
+        no_sleep = sleeps["Sleep onset"].isna()
+        sleeps.loc[no_sleep, "Sleep onset"] = DT[no_sleep]
+        sleeps.loc[no_sleep, "Sleep offset"] = DT[no_sleep]
+        sleeps.loc[no_sleep, "Sleep duration"] = pd.Timedelta(0)
+
+        timing_data["Sleep onset"] = sleeps["Sleep onset"].to_numpy()
+        timing_data["Sleep offset"] = sleeps["Sleep offset"].to_numpy()
+        timing_data["Sleep duration"] = sleeps["Sleep duration"].to_numpy()
+        timing_data["Sleep onset MSLM"] = ((sleeps["Sleep onset"] - DT) / pd.Timedelta("1 min")).to_numpy()
+        timing_data["Sleep offset MSLM"] = np.maximum((sleeps["Sleep offset"] - TM) / pd.Timedelta("1 min"), 0.0).to_numpy()
 
         self._data = timing_data
+        return unique_days, periods
+
+    @_profiled
+    def process_incremental(self, raw_data, thresholds, outfile, shard_by = None, n_jobs = None, channels = None,
+                            windows = None, day_start = "04:00", sleep_split = "18:00", wear_rules = None):
+        """Processes light, sunrise/sunset and sleep timing only for person-days that are new, or
+        whose raw rows have changed, since timing data was last exported to outfile by do_everything.
+        The results are merged with the previously exported timing data.
+
+        #### Parameters
+
+        raw_data: pd.DataFrame
+
+            Combined dataframe of all raw data from desired directory, including the days
+            that were processed before.
+
+        thresholds: list
+
+            List of light thresholds for the watch data. If these differ from the thresholds
+            of the exported timing data, every person-day is processed again.
+
+        outfile: str
+
+            Directory holding the previous timing.parquet and fingerprints.parquet exports.
+
+        shard_by: str, list or None
+
+            Column(s) to split the raw data by for parallel processing (see process_data).
+
+        n_jobs: int or None
+
+            Number of worker processes for light processing (see process_data).
+
+        channels: list or None
+
+            Light channels to process (see process_data). If these differ from the channels of the
+            exported timing data, every person-day is processed again.
+
+        windows, day_start: dict or None, str
+
+            Named windows of the day and the start of person-days (see process_data).
+
+        sleep_split: str
+
+            Time to split the sleep day (see process_sleep).
+
+        wear_rules: dict or None
+
+            Wear-time rules of a valid person-day (see process_data). If the windows, day start,
+            sleep split or wear rules differ from those of the exported timing data, every person-day
+            is processed again.
+
+        #### Returns
+
+            Processed timing data for all person-days, with sunrise, sunset and sleep information.
+        """
+        fingerprints = _day_fingerprints(raw_data)
         try:
-            short_frame = (
-                           pd.concat(sleepers).reset_index().drop('DateTime',axis=1)
-                           .set_index(['UID','DT']).drop_duplicates()
-                           )
-        except:
-            print("Error: Could not concatenate multiple sleep instance data.")
-            return timing_data
+            previous = pd.read_parquet(f"{outfile}timing.parquet", engine = "fastparquet")
+            previous_fingerprints = pd.read_parquet(f"{outfile}fingerprints.parquet", engine = "fastparquet")
+        except (OSError, ValueError):
+            previous = None
+        if previous is not None and "Threshold" not in previous:
+            previous = long_timing(previous)
+        try:
+            with open(f"{outfile}day_windows.json") as f:
+                previous_windows = {"wear_rules": None, **json.load(f)}
+        except OSError:
+            # exports from before day windows could be configured used the defaults
+            previous_windows = _window_settings(None, "04:00", "18:00")
+
+        previous_channels = set(previous["Channel"]) if previous is not None and "Channel" in previous else None
+        if (previous is None or set(previous["Threshold"]) != set(_flatten_thresholds(thresholds))
+            or previous_channels != (None if channels is None else set(channels))
+            or previous_windows != _window_settings(windows, day_start, sleep_split, wear_rules)):
+            # nothing to build on, every person-day is new
+            previous = None
+            dirty = fingerprints[["UID", "Date"]]
+        else:
+            unchanged = fingerprints.merge(previous_fingerprints, on = ["UID", "Date", "Rows", "Hash"])
+            days = (pd.concat([fingerprints[["UID", "Date"]], previous_fingerprints[["UID", "Date"]]])
+                    .drop_duplicates()
+                    .merge(unchanged[["UID", "Date"]], how = "left", indicator = True))
+            changed = days.loc[days["_merge"] == "left_only", ["UID", "Date"]]
+            # a person-day also depends on the following calendar date through its
+            # 4AM-to-4AM light window and its sleep day
+            dirty = pd.concat([changed, changed.assign(Date = changed["Date"] - pd.Timedelta("1 day"))])
+        dirty = pd.MultiIndex.from_frame(dirty.drop_duplicates())
+
+        # raw rows of the dirty person-days and of the calendar dates following them
+        needed = dirty.append(pd.MultiIndex.from_arrays([dirty.get_level_values(0),
+                                                         dirty.get_level_values(1) + pd.Timedelta("1 day")]))
+        subset = raw_data[pd.MultiIndex.from_arrays([raw_data["UID"], raw_data.index.normalize()]).isin(needed)]
+        # participants without any on-wrist ACTIVE/REST rows left have nothing to process
+        active = subset["Interval Status"].isin(["ACTIVE", "REST"]) & np.logical_not(subset["Off-Wrist Status"])
+        subset = subset[subset["UID"].isin(subset.loc[active, "UID"].unique())]
+
+        pieces = []
+        if previous is not None:
+            stale = pd.MultiIndex.from_arrays([previous["UID"], previous["Date"]]).isin(dirty)
+            pieces.append(previous[~stale])
+        if not subset.empty:
+            fresh = self.process_data(subset, thresholds, shard_by = shard_by, n_jobs = n_jobs, channels = channels,
+                                      windows = windows, day_start = day_start, wear_rules = wear_rules)
+            fresh["Date"] = pd.to_datetime(fresh["Date"])
+            self._data = fresh[pd.MultiIndex.from_arrays([fresh["UID"], fresh["Date"]]).isin(dirty)].reset_index(drop = True)
+            self.sun_timings()
+            self.process_sleep(subset, sleep_split = sleep_split)
+            pieces.append(self._data)
+
+        keys = ["UID", "Date", "Threshold"] if channels is None else ["UID", "Date", "Channel", "Threshold"]
+        timing_data = (pd.concat(pieces, ignore_index = True)
+                       .sort_values(keys, kind = "stable", ignore_index = True))
+        # labels of previous and fresh days have different categories
+        for column in ("GroupDayofWeek", "GroupDayType"):
+            timing_data[column] = timing_data[column].astype("category")
+        self._data = timing_data
+        return timing_data
 
-        return short_frame, timing_data
+    @_profiled
+    def process_streaming(self, outfile, thresholds, directory = None, grouping = "Group", sleep_split = "18:00",
+                          n_jobs = 1, progress = None, cache = None, skip = None, uids = None, channels = None,
+                          windows = None, day_start = "04:00", wear_rules = None):
+        """Runs the full SALA pipeline one participant at a time, for studies too large to hold in memory.
+        The csv files of each participant are loaded, processed for light, sunrise/sunset and sleep timing,
+        and written to a timing dataset partitioned by group, UID and month (outfile/timing/, see
+        `write_dataset`) before the next participant is loaded. Every sleep period of the participant
+        is written to a sleep dataset (outfile/sleep/) alongside, and the light cubes of all participants
+        are combined in outfile/light_cube/. Use `read_dataset` to read the results.
+
+        #### Parameters
 
-    def do_everything(self, outfile, thresholds, directory = None, grouping = "Group", export = True):
+        outfile: str
+
+            Directory to save to. (e.g. ../SALA/example_output/) Any timing dataset already
+            in it is replaced.
+
+        thresholds: list
+
+            List of light thresholds for the watch data.
+
+        directory: dict
+
+            Dictionary of valid folders to load actiwatch data from. If no dictionary
+            is provided, it uses the one initialized as part of the SALA object.
+
+        grouping: str
+
+            Name of the generated column for specifying groupings, where
+            the values will be the name of the key given. Default = 'Group'.
+
+        sleep_split: str
+
+            Time to split the sleep day (see process_sleep). Default is "18:00".
+
+        n_jobs: int
+
+            Number of participants processed at once, each in its own worker process.
+            Peak memory grows with it. Default = 1.
+
+        progress: callable or None
+
+            Called as progress(done, total, UID) each time a participant has been written.
+
+        cache: str, ParsedFileCache or None
+
+            Directory (or ParsedFileCache) used to cache parsed csv files between calls.
+
+        skip: collection or None
+
+            UIDs whose timing data was already written to outfile by an earlier, interrupted run.
+            Their files are kept and they are not processed again, while anything else found in
+            the dataset is removed. Default = None, which replaces the whole dataset.
+
+        uids: collection or None
+
+            UIDs to process. Default = None, which processes every participant in the directory.
+
+        channels: list or None
+
+            Light channels to process and aggregate in the light cubes (see process_data).
+            Default = None, which only processes White Light.
+
+        windows: dict or None
+
+            Named windows of the day to report separately (see process_data). Default = None.
+
+        day_start: str
+
+            Clock time at which person-days start. Default = "04:00", which is 4:00AM.
+
+        wear_rules: dict or None
+
+            Wear-time rules of a valid person-day (see process_data). Participants without any valid
+            person-day are skipped. Default = None, which processes every person-day.
+
+        #### Returns
+
+            The number of participants written to the timing dataset.
+        """
+        if directory is None and self._directory is None:
+            raise ValueError("Error: a valid source of data must be provided.")
+        if directory is not None:
+            self._directory = directory
+        participants = _participant_files(self._directory)
+        if uids is not None:
+            uids = set(uids)
+            participants = [participant for participant in participants if participant[1] in uids]
+        if skip is not None:
+            skip = set(skip)
+            participants = [participant for participant in participants if participant[1] not in skip]
+        paths = [os.path.join(outfile, "timing"), os.path.join(outfile, "sleep")]
+        cubes = os.path.join(outfile, "light_cube", "parts")
+        for path in paths + [cubes]:
+            if skip is None:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+            else:
+                # partial or stale output of participants that are not skipped is written again
+                for folder in glob.glob(os.path.join(path, "*", "UID=*")) + glob.glob(os.path.join(path, "UID=*")):
+                    if os.path.basename(folder)[len("UID="):] not in skip:
+                        shutil.rmtree(folder)
+
+        # participants of different timezones cannot share sunrise/sunset column types
+        timezones = {self._timezone}
+        if self._sites is not None:
+            timezones |= set(self._sites["Timezone"])
+        # participants are processed by a copy of this object, so they are not recorded as stages
+        worker = copy.copy(self)
+        results = (Parallel(n_jobs = n_jobs, return_as = 'generator')
+                   (delayed(_timed_call)(worker._process_participant, key, UID, files, thresholds, grouping,
+                                         sleep_split, cache, channels, windows, day_start, wear_rules)
+                    for key, UID, files in participants))
+        written = 0
+        # results come back in order, and the generator is read to its end so joblib finishes cleanly
+        for done, (result, seconds) in enumerate(results, start = 1):
+            UID = participants[done - 1][1]
+            if self._profiler is not None:
+                self._profiler.add_participant("process_streaming", UID, seconds,
+                                                _rows(None if result is None else result[0]))
+            if result is not None:
+                timing_data, sleep_data, cube = result
+                cube.save(os.path.join(cubes, f"UID={UID}"))
+                if len(timezones) > 1:
+                    for column in ("Sunrise", "Sunset"):
+                        timing_data[column] = timing_data[column].dt.tz_convert("UTC")
+                # the merged _metadata holds the categories of a single part for every part, while the
+                # categoricals of each participant (e.g. GroupDayType) only have those of its own group;
+                # Channel has the requested channels as categories in every part
+                for data in (timing_data, sleep_data):
+                    for column in data.select_dtypes("category").columns.difference([grouping, "UID", "Channel"]):
+                        data[column] = data[column].astype(str)
+                write_dataset(timing_data, paths[0], time_column = "Date", partition_on = (grouping, "UID"))
+                if not sleep_data.empty:
+                    write_dataset(sleep_data, paths[1], time_column = "Date", partition_on = (grouping, "UID"))
+                written += 1
+            if progress is not None:
+                progress(done, len(participants), UID)
+
+        # every participant wrote its own files, index them all in one _metadata file per dataset
+        for path in paths:
+            files = sorted(glob.glob(os.path.join(path, "**", "*.parquet"), recursive = True))
+            if files:
+                fastparquet.writer.merge(files, root = path)
+        parts = sorted(glob.glob(os.path.join(cubes, "UID=*")))
+        if parts:
+            LightCube.concat([LightCube.load(part) for part in parts]).save(os.path.dirname(cubes))
+        self._data = None
+        return written
+
+    def _process_participant(self, key, UID, files, thresholds, grouping, sleep_split, cache, channels = None,
+                             windows = None, day_start = "04:00", wear_rules = None):
+        """Light, sunrise/sunset and sleep timing of a single participant along with all of its sleep
+        periods and its light cube, or None without any on-wrist ACTIVE/REST data or, with wear rules,
+        without any valid person-day."""
+        raw_data = load_actiwatch_data(files, uidprefix = key, cache = cache)[0]
+        raw_data[grouping] = pd.Categorical([key] * len(raw_data))
+        active = raw_data["Interval Status"].isin(["ACTIVE", "REST"]) & np.logical_not(raw_data["Off-Wrist Status"])
+        if not active.any():
+            print(f"Skipping {UID}: no on-wrist ACTIVE or REST data.")
+            return None
+        if wear_rules is not None:
+            # the quality index of this participant alone, not of whatever the object loaded before
+            self._quality = person_day_quality(raw_data, day_start)
+            if not apply_wear_rules(self._quality, wear_rules)["Valid"].any():
+                print(f"Skipping {UID}: no person-days pass the wear rules.")
+                return None
+        # all thresholds in one pass, this process is already one of the workers
+        self.process_data(raw_data, [_flatten_thresholds(thresholds)], n_jobs = 1, channels = channels,
+                          windows = windows, day_start = day_start, wear_rules = wear_rules)
+        self.sun_timings()
+        _, periods = self._join_sleep(raw_data, sleep_split)
+        return (self._data, periods.assign(**{grouping: key}).sort_values(["Date", "Sleep period"]),
+                LightCube.from_raw(raw_data, channels = channels, grouping = grouping, holidays = self._holidays))
+
+    def process_shard(self, outfile, thresholds, shard, num_shards, directory = None, grouping = "Group",
+                      sleep_split = "18:00", n_jobs = 1, progress = None, cache = None, skip = None,
+                      channels = None, windows = None, day_start = "04:00", wear_rules = None):
+        """Runs process_streaming for the participants of one shard of the study. Participants are
+        assigned to shards by a hash of their UID, so every machine sharing the same outfile (e.g. on a
+        network drive) can run its own shard without any coordination. Each shard writes its timing and
+        sleep datasets to outfile/shards/shard-<shard>-of-<num_shards>/ and marks itself complete with
+        a _SUCCESS file once finished. Use merge_shards to combine them when all shards are done.
+
+        #### Parameters
+
+        outfile: str
+
+            Directory shared by all shards. (e.g. ../SALA/example_output/)
+
+        thresholds: list
+
+            List of light thresholds for the watch data.
+
+        shard: int
+
+            Shard to process, from 0 to num_shards - 1.
+
+        num_shards: int
+
+            Total number of shards the study is split into.
+
+        directory, grouping, sleep_split, n_jobs, progress, cache, skip, channels, windows, day_start, wear_rules
+
+            See process_streaming.
+
+        #### Returns
+
+            The number of participants written to the timing dataset of the shard.
+        """
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"shard must be between 0 and {num_shards - 1}, got {shard}.")
+        if directory is not None:
+            self._directory = directory
+        uids = [UID for _, UID, _ in _participant_files(self._directory) if _shard_of(UID, num_shards) == shard]
+        path = _shard_path(outfile, shard, num_shards)
+        marker = os.path.join(path, "_SUCCESS")
+        if os.path.exists(marker):
+            os.remove(marker)
+        written = self.process_streaming(path, thresholds, grouping = grouping, sleep_split = sleep_split,
+                                         n_jobs = n_jobs, progress = progress, cache = cache, skip = skip,
+                                         uids = uids, channels = channels, windows = windows, day_start = day_start,
+                                         wear_rules = wear_rules)
+        os.makedirs(path, exist_ok = True)
+        with open(marker, "w") as f:
+            json.dump({"shard": shard, "num_shards": num_shards, "participants": sorted(uids),
+                       "written": written}, f, indent = 2)
+        return written
+
+    @_profiled
+    def do_everything(self, outfile, thresholds, directory = None, grouping = "Group", export = True,
+                      shard_by = None, n_jobs = None, incremental = False, channels = None, windows = None,
+                      day_start = "04:00", sleep_split = "18:00", wear_rules = None):
         """Handles the full SALA pipeline (excluding sleep period analysis), from processing and combining raw data
         to parsing and calculating processed data with sunrise,sunset and sleep information.
 
@@ -752,7 +2709,44 @@ class SALAFrame:
         export: bool
 
             Whether or not to export processed timing data to a parquet file saved in the designated
-            outfile location.
+            outfile location, along with the light cube of the raw data (outfile/light_cube, see
+            light_cube).
+
+        shard_by: str, list or None
+
+            Column(s) to split the raw data by for parallel processing (see process_data).
+
+        n_jobs: int or None
+
+            Number of worker processes for light processing (see process_data).
+
+        incremental: bool
+
+            Whether to only process person-days that are new or changed since the last export
+            to outfile, merging them with the exported timing data (see process_incremental).
+            Default = False.
+
+        channels: list or None
+
+            Light channels to process (see process_data). Default = None, which only processes
+            White Light.
+
+        windows: dict or None
+
+            Named windows of the day to report separately (see process_data). Default = None.
+
+        day_start: str
+
+            Clock time at which person-days start. Default = "04:00", which is 4:00AM.
+
+        sleep_split: str
+
+            Time to split the sleep day (see process_sleep). Default = "18:00", which is 6:00PM.
+
+        wear_rules: dict or None
+
+            Wear-time rules of a valid person-day (see process_data). Default = None, which
+            processes every person-day.
 
         #### Returns
 
@@ -763,15 +2757,27 @@ class SALAFrame:
             directory = self.directory
 
         raw_data = self.get_raw_data(outfile, directory, grouping)
-        data = self.process_data(raw_data, thresholds)
-        self.sun_timings()
-        sala.process_sleep(raw_data)
+        if incremental:
+            self.process_incremental(raw_data, thresholds, outfile, shard_by = shard_by, n_jobs = n_jobs,
+                                     channels = channels, windows = windows, day_start = day_start,
+                                     sleep_split = sleep_split, wear_rules = wear_rules)
+        else:
+            data = self.process_data(raw_data, thresholds, shard_by = shard_by, n_jobs = n_jobs, channels = channels,
+                                     windows = windows, day_start = day_start, wear_rules = wear_rules)
+            self.sun_timings()
+            self.process_sleep(raw_data, sleep_split = sleep_split)
         if export:
             self.export(data = self.data, outfile = outfile)
+            # per-day summaries of the raw data, used to find changed days on the next incremental run
+            _day_fingerprints(raw_data).to_parquet(f"{outfile}fingerprints.parquet",
+                                                   engine = "fastparquet", compression = "gzip")
+            with open(f"{outfile}day_windows.json", "w") as f:
+                json.dump(_window_settings(windows, day_start, sleep_split, wear_rules), f, indent = 2)
+            self.light_cube(raw_data, f"{outfile}light_cube", channels = channels, grouping = grouping)
 
         return self._data
 
-# %% ../00_processing.ipynb 25
+# %% ../00_processing.ipynb 70
 def remove_first_day(data):
     """An example function that removes data
     from the first day of recording. Typically the first
@@ -780,3 +2786,74 @@ def remove_first_day(data):
     """
     return data[(data["Last Light"].apply(np.isnat) == False)
                & (data["Date"] != data["Date"].min())]
+
+# %% ../00_processing.ipynb 117
+def merge_shards(outfile, num_shards = None, holidays = None, grouping = "Group"):
+    """Combines the timing and sleep datasets written by every shard of SALAFrame.process_shard into
+    a single timing.parquet and sleep.parquet file within outfile, and their light cubes into
+    outfile/light_cube.
+
+    #### Parameters
+
+    outfile: str
+
+        Directory shared by all shards.
+
+    num_shards: int or None
+
+        Number of shards the study was split into. Default = None, which reads it from the shard
+        directories found in outfile.
+
+    holidays: holiday calendar, list of dates or None
+
+        Holidays counted as Weekend/Holiday days (see date_table). Default = None, which uses
+        US federal holidays.
+
+    grouping: str
+
+        Grouping column the shards were processed with, which partitions their datasets.
+        Default = 'Group'.
+
+    #### Returns
+
+        Merged timing data in a dataframe format, with group day types rebuilt over all shards.
+    """
+    folders = sorted(glob.glob(os.path.join(outfile, "shards", "shard-*-of-*")))
+    if num_shards is None:
+        counts = {int(os.path.basename(folder).rsplit("-", 1)[1]) for folder in folders}
+        if len(counts) != 1:
+            raise ValueError(f"Could not determine the number of shards in {outfile}, found {sorted(counts)}.")
+        num_shards = counts.pop()
+    paths = [_shard_path(outfile, shard, num_shards) for shard in range(num_shards)]
+    missing = [shard for shard, path in enumerate(paths) if not os.path.exists(os.path.join(path, "_SUCCESS"))]
+    if missing:
+        raise ValueError(f"Shards {missing} of {num_shards} have not finished.")
+
+    merged = {}
+    for name in ("timing", "sleep"):
+        frames = [read_dataset(os.path.join(path, name), time_column = "Date")
+                  for path in paths if os.path.isdir(os.path.join(path, name))]
+        # channels keep the order they were requested in, other categoricals differ between shards
+        frames = [frame.astype({column: str for column in frame.columns if column != "Channel"
+                                and isinstance(frame[column].dtype, pd.CategoricalDtype)}) for frame in frames]
+        merged[name] = pd.concat(frames, ignore_index = True) if frames else pd.DataFrame()
+
+    timing_data = merged["timing"]
+    if not timing_data.empty:
+        # partition columns come back last, restore the column order of SALAFrame.process_data
+        columns = [column for column in timing_data.columns if column not in ("UID", grouping)]
+        if grouping in timing_data.columns:
+            columns.insert(columns.index("Watch period"), grouping)
+        timing_data = timing_data[["UID"] + columns]
+        keys = ["UID", "Date", "Channel", "Threshold"] if "Channel" in timing_data.columns else ["UID", "Date", "Threshold"]
+        timing_data = _add_day_types(timing_data, holidays).sort_values(keys, kind = "stable", ignore_index = True)
+        timing_data.to_parquet(os.path.join(outfile, "timing.parquet"), engine = "fastparquet", compression = "gzip")
+    sleep_data = merged["sleep"]
+    if not sleep_data.empty:
+        sleep_data = sleep_data.sort_values(["UID", "Date", "Sleep period"], ignore_index = True)
+        sleep_data.to_parquet(os.path.join(outfile, "sleep.parquet"), engine = "fastparquet", compression = "gzip")
+    cubes = [LightCube.load(os.path.join(path, "light_cube")) for path in paths
+             if os.path.exists(os.path.join(path, "light_cube", "cube.json"))]
+    if cubes:
+        LightCube.concat(cubes).save(os.path.join(outfile, "light_cube"))
+    return timing_data
@@ -0,0 +1,370 @@
+# AUTOGENERATED! DO NOT EDIT! File to edit: ../04_reports.ipynb.
+
+# %% auto 0
+__all__ = ['ParticipantReport']
+
+# %% ../04_reports.ipynb 2
+from joblib import Parallel, delayed
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+import matplotlib as mpl
+import matplotlib.figure
+import pandas as pd
+import numpy as np
+import seaborn as sns
+
+import glob
+import os
+
+from .processing import SALAFrame, LightCube, read_dataset, long_timing
+from .plots import ClockPlot, LightPlot
+
+# %% ../04_reports.ipynb 5
+def _clock_time(times):
+    """Times of a datetime series as printable 'YYYY-MM-DD HH:MM', blank where missing."""
+    return times.dt.strftime("%Y-%m-%d %H:%M").fillna("")
+
+def _hours(durations):
+    """Durations of a timedelta series as printable 'Hh MMm', blank where missing."""
+    minutes = durations.dt.total_seconds() // 60
+    text = (minutes // 60).map("{:.0f}h ".format) + (minutes % 60).map("{:02.0f}m".format)
+    return text.where(minutes.notna(), "")
+
+def _tick_step(y_lim):
+    """A round step (1, 2 or 5 times a power of ten) giving at most eight ticks up to y_lim."""
+    if not y_lim > 0:
+        return 1
+    step = 10 ** np.floor(np.log10(y_lim / 8))
+    return next(step * factor for factor in (1, 2, 5, 10) if y_lim / (step * factor) <= 8)
+
+def _table(ax, frame, title = None):
+    """Draws a dataframe as a plain table filling the top of ax."""
+    ax.axis("off")
+    if title is not None:
+        ax.set_title(title, loc = "left")
+    if frame.empty:
+        ax.text(0.0, 1.0, "No data", va = "top")
+        return
+    table = ax.table(cellText = frame.to_numpy(), colLabels = list(frame.columns), loc = "upper center",
+                     cellLoc = "left", colLoc = "left")
+    table.auto_set_font_size(False)
+    table.set_fontsize(8)
+    table.scale(1.0, 1.2)
+
+def _light_quality(cube, channel, watch_period):
+    """Samples and mean level of the on-wrist light of a participant's light cube."""
+    stats = cube.stats[cube.stats["Channel"] == channel]
+    count = stats["Count"].sum()
+    quality = {f"{channel} samples": int(count),
+               f"Mean {channel} (lx)": round(stats["Sum"].sum() / count, 1) if count else np.nan}
+    if pd.notna(watch_period):
+        quality[f"Hours of {channel} sampled"] = round(count * watch_period / pd.Timedelta("1h"), 1)
+    return quality
+
+def _new_page(page_size):
+    """A figure drawn with the Agg canvas, outside of pyplot."""
+    figure = mpl.figure.Figure(figsize = page_size)
+    FigureCanvasAgg(figure)
+    return figure
+
+def _render_report(path, uid, quality, light, clock, sleep_table, cube, settings):
+    """Draws the report of one participant, writing every page to its PDF as soon as it is drawn."""
+    if isinstance(cube, str):
+        cube = LightCube.load(cube)
+    if cube is not None:
+        quality = {**quality, **_light_quality(cube, settings["channel"], quality.get("Watch period"))}
+    quality.pop("Watch period", None)
+    rows = settings["rows_per_page"]
+    with PdfPages(path) as pdf, sns.axes_style("white"):
+        # clock plot and data quality
+        figure = _new_page(settings["page_size"])
+        figure.suptitle(f"{uid}", fontsize = 14)
+        clocks, table = figure.subfigures(2, 1, height_ratios = [5, 3])
+        if len(clock):
+            ClockPlot._draw(clocks, light, clock, settings["group_by"], settings["thresholds"])
+            clocks.subplots_adjust(left = 0.05, right = 0.6, hspace = 0.35)
+        _table(table.add_subplot(1, 1, 1),
+               pd.DataFrame({"Measure": list(quality), "Value": [str(value) for value in quality.values()]}),
+               "Data quality")
+        pdf.savefig(figure)
+
+        # light profile, then the sleep table over as many pages as it takes
+        figure = _new_page(settings["page_size"])
+        profile, table = figure.subfigures(2, 1, height_ratios = [1, 1])
+        ax = profile.add_subplot(1, 1, 1)
+        d_m = []
+        if cube is not None and len(cube.stats):
+            try:
+                d_m, d_low, d_high, labels = LightPlot._from_cube(cube, None, settings["plot_type"], "DayType",
+                                                                  settings["channel"], 0)
+            except ValueError:
+                d_m = []
+        if d_m:
+            y_lim = max(float(np.nanmax(high.to_numpy())) for high in d_high) * 1.1
+            tinc = _tick_step(y_lim)
+            LightPlot._draw(ax, d_m, d_low, d_high, labels, settings["palette"], settings["plot_type"],
+                            y_lim, tinc, "Lux", verbose = False)
+            ax.set_title(f"Daily {settings['channel']} profile", loc = "left")
+        else:
+            ax.axis("off")
+            ax.set_title(f"Daily {settings['channel']} profile", loc = "left")
+            ax.text(0.0, 0.9, "No light cube", va = "top")
+        _table(table.add_subplot(1, 1, 1), sleep_table.iloc[:rows // 2], "Sleep timing")
+        pdf.savefig(figure)
+        for start in range(rows // 2, len(sleep_table), rows):
+            figure = _new_page(settings["page_size"])
+            _table(figure.add_subplot(1, 1, 1), sleep_table.iloc[start:start + rows], "Sleep timing (continued)")
+            pdf.savefig(figure)
+    return path
+
+class ParticipantReport:
+    """
+    Multi-page PDF reports of every participant of a study, with a clock plot of their light
+    and sleep timing, a data-quality table, their daily light profile and a table of their sleep
+    timing. Reports are drawn from the timing data, sleep periods and per-participant light
+    cubes written by the pipeline, see `from_output`.
+
+
+        Attributes
+        ----------
+        timing_data: pd.DataFrame
+            Timing data of every participant, as produced by `SALAFrame.do_everything` or
+            `SALAFrame.process_streaming`.
+
+        sleep_data: pd.DataFrame or None
+            Every sleep period of every participant (the sleep dataset of `process_streaming`). Without
+            it, the sleep table holds the main sleep of every day from the timing data.
+
+        cubes: dict
+            Light cube of every participant, keyed by UID, as a LightCube or the directory it was
+            saved to.
+
+
+        Methods
+        -------
+        from_output(outfile, **kwargs)
+            Reports of a pipeline output directory.
+        quality()
+            Data-quality statistics of every participant.
+        save(outdir, uids=None, n_jobs=-1)
+            Saves the report of every participant to outdir/<UID>.pdf.
+    """
+    def __init__(self, timing_data, sleep_data = None, cubes = None, group_by = "Weekend/Holiday",
+                 thresholds = [], timezone = None, accuracy = None, grouping = "Group", channel = "White Light",
+                 plot_type = "mean/sem", palette = "deep", page_size = (8.5, 11), rows_per_page = 36):
+        """
+        #### Parameters
+
+        timing_data: pd.DataFrame or SALA
+
+            Timing data of every participant, or a SALA object holding it.
+
+        sleep_data: pd.DataFrame or None
+
+            Sleep periods of every participant. Default = None, which reports the main sleep of every
+            day from the timing data.
+
+        cubes: dict or None
+
+            Light cube (or the directory of one) of every participant, keyed by UID. Participants
+            without one are reported without a light profile. For raw data held in memory, these can
+            be built with `{UID: LightCube.from_raw(data) for UID, data in raw_data.groupby("UID")}`.
+
+        group_by: str
+
+            Column to draw one clock per value of. Default = 'Weekend/Holiday'.
+
+        thresholds: list
+
+            Light thresholds to draw and report on. Default is every threshold in the data.
+
+        timezone: str
+
+            Timezone of the data, for sunrise and sunset. Timezone-aware sunrise and sunset times
+            are converted to it. Default = None, which uses the timezone sunrise is stored in.
+
+        accuracy: float or None
+
+            Relative accuracy of approximate clock plot quartiles (see ClockPlot.plot). Default = None.
+
+        grouping: str
+
+            Column holding the group of every participant. Default = 'Group'.
+
+        channel: str
+
+            Light channel of the daily light profile. Default = 'White Light'.
+
+        plot_type: str
+
+            Light profile style, 'mean/sem' or 'quantiles'. Default = 'mean/sem'.
+
+        palette: str
+
+            Seaborn color palette of the light profile.
+
+        page_size: tuple
+
+            Size of every page in inches. Default = (8.5, 11), US letter.
+
+        rows_per_page: int
+
+            Rows of the sleep table on every page after the first. Default = 36.
+        """
+        if isinstance(timing_data, SALAFrame):
+            timing_data = timing_data.data
+        if plot_type not in ("mean/sem", "quantiles"):
+            raise ValueError("Valid light profile choices are 'mean/sem' and 'quantiles'.")
+        self.sleep_data = sleep_data
+        self.cubes = {} if cubes is None else dict(cubes)
+        if thresholds is None or len(thresholds) < 1 or not thresholds:
+            thresholds = list(timing_data["Threshold"].unique())
+        if timezone is None and "Sunrise" in timing_data and timing_data["Sunrise"].dt.tz is not None:
+            # clocks are drawn in the timezone of the sunrise times, which cannot be drawn without one
+            timezone = str(timing_data["Sunrise"].dt.tz)
+        if timezone is not None and any(timing_data[column].dt.tz is not None for column in ("Sunrise", "Sunset")):
+            # studies of several timezones are written with sunrise and sunset in UTC
+            timing_data = timing_data.assign(**{column: timing_data[column].dt.tz_convert(timezone)
+                                                for column in ("Sunrise", "Sunset")})
+        self.timing_data = timing_data
+        self._settings = dict(group_by = group_by, thresholds = list(thresholds), timezone = timezone,
+                              accuracy = accuracy, grouping = grouping, channel = channel, plot_type = plot_type,
+                              palette = palette, page_size = page_size, rows_per_page = rows_per_page)
+
+    @classmethod
+    def from_output(cls, outfile, **kwargs):
+        """Reports of the output directory of a pipeline run: outfile/timing/ and outfile/sleep/ of
+        `process_streaming` (or the timing.parquet and sleep.parquet files of `merge_shards`), along
+        with the light cube of every participant in outfile/light_cube/parts/ or within its shards.
+        Timing data exported in the wide layout is turned back into the long one. Any other keyword
+        arguments are passed on to ParticipantReport.
+        """
+        data = {}
+        for name in ("timing", "sleep"):
+            if os.path.isdir(os.path.join(outfile, name)):
+                data[name] = read_dataset(os.path.join(outfile, name), time_column = "Date").reset_index(drop = True)
+            elif os.path.exists(os.path.join(outfile, f"{name}.parquet")):
+                data[name] = pd.read_parquet(os.path.join(outfile, f"{name}.parquet"), engine = "fastparquet")
+            else:
+                data[name] = None
+        if data["timing"] is None:
+            raise ValueError(f"No timing data found in {outfile}.")
+        if "Threshold" not in data["timing"]:
+            data["timing"] = long_timing(data["timing"])
+        parts = (glob.glob(os.path.join(outfile, "light_cube", "parts", "UID=*"))
+                 + glob.glob(os.path.join(outfile, "shards", "*", "light_cube", "parts", "UID=*")))
+        cubes = {os.path.basename(part)[len("UID="):]: part for part in sorted(parts)}
+        return cls(data["timing"], data["sleep"], cubes, **kwargs)
+
+    def quality(self, light = True):
+        """Data-quality statistics of every participant, calculated together in one grouped pass.
+
+        #### Parameters
+
+        light: bool
+
+            Whether to add the on-wrist light samples of every participant from their light cube,
+            which loads every cube. Default = True.
+
+        #### Returns
+
+            A dataframe indexed by UID, with the group, first and last day, number of days and
+            weekend/holiday days, nights with sleep, the share of days reaching each light threshold
+            and, with light, the samples, mean and hours of on-wrist light.
+        """
+        quality = self._quality()
+        if light:
+            rows = {uid: _light_quality(LightCube.load(cube) if isinstance(cube, str) else cube,
+                                        self._settings["channel"], quality.loc[uid, "Watch period"])
+                    for uid, cube in self.cubes.items() if uid in quality.index}
+            quality = quality.join(pd.DataFrame.from_dict(rows, orient = "index"))
+        return quality.drop(columns = "Watch period")
+
+    def _quality(self):
+        """Data-quality statistics of every participant from its timing and sleep data."""
+        data = self.timing_data
+        grouping = self._settings["grouping"]
+        days = data.drop_duplicates(["UID", "Date"])
+        by_uid = days.groupby("UID", observed = True, sort = True)
+        quality = pd.DataFrame({"Group": by_uid[grouping].first() if grouping in days else None,
+                                "First day": by_uid["Date"].min().dt.date,
+                                "Last day": by_uid["Date"].max().dt.date,
+                                "Days": by_uid["Date"].size()})
+        if "Weekend/Holiday" in days:
+            quality["Weekend/Holiday days"] = by_uid["Weekend/Holiday"].sum()
+        if self.sleep_data is not None and not self.sleep_data.empty:
+            slept = self.sleep_data[self.sleep_data["Sleep duration"] > pd.Timedelta(0)]
+            sleep = slept.groupby("UID", observed = True)
+            quality["Nights with sleep"] = sleep["Date"].nunique()
+            quality["Sleep periods per night"] = (sleep.size() / quality["Nights with sleep"]).round(2)
+        elif "Sleep duration" in days:
+            slept = days["Sleep duration"] > pd.Timedelta(0)
+            quality["Nights with sleep"] = slept.groupby(days["UID"], observed = True).sum()
+        quality = quality.fillna({"Nights with sleep": 0})
+        # share of the days on which the light reached every threshold
+        reached = (data[data["Threshold"].isin(self._settings["thresholds"])]
+                   .groupby(["UID", "Threshold"], observed = True)["Mins to FL from 4AM"].count().unstack())
+        for threshold in self._settings["thresholds"]:
+            if threshold in reached:
+                quality[f"Days reaching {threshold}lx (%)"] = (reached[threshold] / quality["Days"] * 100).round(1)
+        quality["Watch period"] = by_uid["Watch period"].first() if "Watch period" in days else pd.NaT
+        return quality
+
+    def _sleep_table(self):
+        """Printable sleep timing of every participant, keyed by UID."""
+        if self.sleep_data is not None:
+            sleep = self.sleep_data.sort_values(["UID", "Date", "Sleep onset"])
+            table = pd.DataFrame({"UID": sleep["UID"], "Date": sleep["Date"].dt.strftime("%Y-%m-%d"),
+                                  "Period": sleep["Sleep period"].astype(str)})
+        else:
+            sleep = self.timing_data.drop_duplicates(["UID", "Date"]).sort_values(["UID", "Date"])
+            table = pd.DataFrame({"UID": sleep["UID"], "Date": sleep["Date"].dt.strftime("%Y-%m-%d")})
+        # days without any sleep are recorded with a zero duration, they are left blank
+        slept = sleep["Sleep duration"] > pd.Timedelta(0)
+        table["Sleep onset"] = _clock_time(sleep["Sleep onset"].where(slept))
+        table["Sleep offset"] = _clock_time(sleep["Sleep offset"].where(slept))
+        table["Sleep duration"] = _hours(sleep["Sleep duration"].where(slept))
+        return {uid: part.drop(columns = "UID").reset_index(drop = True)
+                for uid, part in table.groupby("UID", observed = True)}
+
+    def save(self, outdir, uids = None, n_jobs = -1):
+        """Saves the report of every participant to outdir/<UID>.pdf, drawing reports in parallel
+        worker processes.
+
+        #### Parameters
+
+        outdir: str
+
+            Directory to save the reports to.
+
+        uids: list or None
+
+            Participants to report on. Default = None, which reports on every participant.
+
+        n_jobs: int
+
+            Number of worker processes. Default = -1, which uses every available core.
+
+        #### Returns
+
+            The paths of the saved reports.
+        """
+        settings = self._settings
+        data = self.timing_data
+        if uids is not None:
+            data = data[data["UID"].isin(list(uids))]
+        if data.empty:
+            return []
+        light, clock = ClockPlot.statistics(data, settings["group_by"], settings["thresholds"],
+                                            settings["timezone"], settings["accuracy"], split_by = "UID")
+        quality = self._quality().to_dict(orient = "index")
+        sleep_tables = self._sleep_table()
+        empty = pd.DataFrame(columns = ["Date", "Sleep onset", "Sleep offset", "Sleep duration"])
+        os.makedirs(outdir, exist_ok = True)
+        reported = list(dict.fromkeys(data["UID"]))
+        return Parallel(n_jobs = n_jobs)(
+            delayed(_render_report)(os.path.join(outdir, f"{uid}.pdf"), uid, quality[uid],
+                                    light[light.index.get_level_values(0) == uid],
+                                    clock[clock.index.get_level_values(0) == uid],
+                                    sleep_tables.get(uid, empty), self.cubes.get(uid), settings)
+            for uid in reported)